@@ -0,0 +1,210 @@
+"""
+アドミッション制御とクライアントごとのレート制限
+- クライアントIP（nginx が付ける X-Real-IP）ごとのトークンバケットで、エンドポイントごとにリクエスト数を制限する（429）
+  X-Real-IP は接続元が信頼するプロキシ（RATE_LIMIT_TRUSTED_PROXIES）の場合だけ使い、それ以外は接続元のIPで数える
+- 同時に処理中のリクエスト数と書き込みキューの長さに上限を設け、超えた分はすぐに断る（503）
+"""
+
+import ipaddress
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from log import logger, sampled_debug
+from metrics import metrics
+
+# "off" にするとレート制限を行わない
+RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_MODE", "on")
+# X-Real-IP ヘッダをクライアントIPとして使う（nginx を通さずに公開する場合は off にする）
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "on") == "on"
+# X-Real-IP を信頼する接続元（nginx）のアドレス。カンマ区切りで、CIDR表記も使える
+RATE_LIMIT_TRUSTED_PROXIES = os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1,::1")
+# この秒数リクエストのなかったクライアントの状態を捨てる
+RATE_LIMIT_IDLE_SECONDS = float(os.getenv("RATE_LIMIT_IDLE_SECONDS", "300"))
+# 保持する (クライアント, 予算名) の最大数（超えたら最も長く使われていないものから捨てる）
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+# 同時に処理するリクエスト数の上限（SSE など長時間つながるものは除く）
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "64"))
+# 書き込みキューに溜まっている件数の上限（超えると書き込みを断る）
+MAX_WRITE_QUEUE = int(os.getenv("MAX_WRITE_QUEUE", "1000"))
+# 同時実行数の上限の対象外にするパス（ヘルスチェックの /ready は混雑時も 503 にしない）
+# SSE の /api/rankings/stream は接続のレート制限と live.py の購読数の上限で制限する
+ADMISSION_EXEMPT_PATHS = frozenset({"/api/rankings/stream", "/metrics", "/ready"})
+
+# エンドポイントごとの予算: 名前 → (1秒あたりの補充数, バケットの容量)
+# RATE_LIMIT_<名前の大文字> に "補充数,容量" を設定すると上書きできる
+DEFAULT_BUDGETS = {
+    "ranking_submit": (1.0, 5),
+    "game_session": (2.0, 10),
+    "rankings_read": (10.0, 30),
+    "texts_draw": (5.0, 20),
+    # パスワードの総当たりと bcrypt による負荷を抑える（5回の後は10秒に1回）
+    "admin_login": (0.1, 5),
+    # ランキング配信（SSE）の接続。同時に開ける数は live.py の上限で別に制限する
+    "live_connect": (0.5, 10),
+}
+
+
+def _load_budgets():
+    budgets = {}
+    for name, default in DEFAULT_BUDGETS.items():
+        value = os.getenv(f"RATE_LIMIT_{name.upper()}")
+        if value:
+            rate, burst = value.split(",")
+            budgets[name] = (float(rate), int(burst))
+        else:
+            budgets[name] = default
+    return budgets
+
+
+def _parse_networks(value):
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip())
+
+
+trusted_proxies = _parse_networks(RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def is_trusted_proxy(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def client_ip(request):
+    peer = request.client.host if request.client else "unknown"
+    # 接続元が nginx でなければヘッダは誰でも付けられるため使わない
+    if RATE_LIMIT_TRUST_PROXY and is_trusted_proxy(peer):
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return peer
+
+
+class RateLimiter:
+    """
+    (クライアント, 予算名) ごとのトークンバケット
+    最後に使われた順に並べておき、先頭から一定時間使われていないものを捨てるので、状態は最近のクライアント数に比例する
+    max_buckets を超えた場合は一定時間が経っていなくても先頭から捨てる（送信元を偽った大量のクライアントへの備え）
+    """
+
+    def __init__(self, budgets=None, idle_seconds=RATE_LIMIT_IDLE_SECONDS, max_buckets=RATE_LIMIT_MAX_BUCKETS):
+        self.budgets = budgets if budgets is not None else _load_budgets()
+        self.idle_seconds = idle_seconds
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        # (クライアント, 予算名) → [残りトークン, 最終更新時刻]
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _expire(self, now):
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_seconds:
+                break
+            del self._buckets[key]
+
+    def acquire(self, client, name, now=None):
+        """1トークン消費できれば 0、できなければ次のトークンまでの秒数を返す"""
+        rate, burst = self.budgets[name]
+        now = time.monotonic() if now is None else now
+        key = (client, name)
+        with self._lock:
+            self._expire(now)
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = [float(burst), now]
+            else:
+                bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                metrics.increment("rate_limit_evicted_total")
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit(name):
+    """エンドポイントの依存関係: クライアントIPごとの予算を超えたら 429 を返す"""
+    if name not in rate_limiter.budgets:
+        raise ValueError(f"レート制限の予算 {name} が定義されていません")
+
+    async def dependency(request: Request):
+        if RATE_LIMIT_MODE != "on":
+            return
+        retry_after = rate_limiter.acquire(client_ip(request), name)
+        if retry_after:
+            metrics.increment("rate_limited_total")
+            raise HTTPException(
+                status_code=429,
+                detail="リクエストが多すぎます。しばらくしてから再度お試しください",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+
+    return dependency
+
+
+class AdmissionMiddleware:
+    """
+    ASGIミドルウェア: 処理中のリクエスト数が上限に達しているとき、または書き込みキューが溢れそうなときは
+    アプリケーションに渡さずに 503 を返す（待たせるとDBの待ち行列が伸び続けるため）
+    """
+
+    def __init__(self, app, max_concurrent=MAX_CONCURRENT_REQUESTS, write_queue_depth=None,
+                 max_write_queue=MAX_WRITE_QUEUE):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.write_queue_depth = write_queue_depth
+        self.max_write_queue = max_write_queue
+        self.in_flight = 0
+
+    def _overloaded(self, scope):
+        if self.in_flight >= self.max_concurrent:
+            return True
+        if scope["method"] in ("GET", "HEAD", "OPTIONS") or self.write_queue_depth is None:
+            return False
+        return self.write_queue_depth() >= self.max_write_queue
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in ADMISSION_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if self._overloaded(scope):
+            metrics.increment("load_shed_total")
+            if sampled_debug():
+                logger.debug("過負荷のためリクエストを断りました: %s %s (処理中 %d件)",
+                             scope["method"], scope["path"], self.in_flight)
+            body = json.dumps({"detail": "サーバーが混み合っています。しばらくしてから再度お試しください"},
+                              ensure_ascii=False).encode("utf-8")
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,129 @@
+"""
+管理者認証
+ログイン時に一度だけ bcrypt でパスワードを検証して有効期限付きの署名済みトークン（JWT）を発行し、
+以降の管理者APIはトークンの署名確認（検証済みのトークンはメモリにキャッシュ）だけで認証します
+"""
+
+import asyncio
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+
+from log import logger
+from workers import MULTI_WORKER, WORKER_STATE_DIR, startup_lock
+
+# 管理者パスワード（ADMIN_PASSWORD_HASH に bcrypt のハッシュを設定した場合はそちらを使う）
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
+ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH")
+
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# 検証済みトークンのキャッシュ件数
+TOKEN_CACHE_SIZE = 256
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt の検証専用のスレッド（1回約0.4秒かかるため、DBのスレッドプールを占有しないよう分ける）
+PASSWORD_THREADS = 1
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_THREADS, thread_name_prefix="bcrypt")
+
+
+def _load_secret_key():
+    """
+    トークンの署名鍵。SECRET_KEY が未設定の場合は起動ごとに生成する
+    （複数ワーカーの場合は全ワーカーで同じ鍵を使うよう状態ディレクトリに保存する）
+    """
+    secret_key = os.getenv("SECRET_KEY")
+    if secret_key:
+        return secret_key
+    logger.warning("SECRET_KEY が設定されていません。一時的な鍵を使用します（再起動するとログインし直しになります）")
+    if not MULTI_WORKER:
+        return secrets.token_urlsafe(32)
+    path = os.path.join(WORKER_STATE_DIR, "secret_key")
+    with startup_lock():
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                f.write(secrets.token_urlsafe(32))
+        with open(path) as f:
+            return f.read().strip()
+
+
+SECRET_KEY = _load_secret_key()
+
+
+class AdminAuth:
+    def __init__(self, secret_key=SECRET_KEY, algorithm=ALGORITHM, expire_minutes=ACCESS_TOKEN_EXPIRE_MINUTES):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.expire_minutes = expire_minutes
+        self._password_hash = ADMIN_PASSWORD_HASH
+        self._lock = threading.Lock()
+        # トークン → 有効期限（UNIX時刻）
+        self._verified = OrderedDict()
+
+    def _hash(self):
+        if self._password_hash is None:
+            with self._lock:
+                if self._password_hash is None:
+                    # 平文の ADMIN_PASSWORD しかない場合は起動後に一度だけハッシュにする
+                    self._password_hash = pwd_context.hash(ADMIN_PASSWORD)
+        return self._password_hash
+
+    def verify_password(self, password):
+        """同期処理（bcrypt の計算が重いため check_password から専用のスレッドで呼び出す）"""
+        return pwd_context.verify(password, self._hash())
+
+    async def check_password(self, password):
+        """verify_password をイベントループの外（専用のスレッド）で実行する"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, self.verify_password, password)
+
+    def create_token(self):
+        expires = datetime.utcnow() + timedelta(minutes=self.expire_minutes)
+        token = jwt.encode({"sub": "admin", "exp": expires}, self.secret_key, algorithm=self.algorithm)
+        return token, self.expire_minutes * 60
+
+    def verify_token(self, token):
+        """トークンが有効なら True。検証済みのトークンは期限までキャッシュから判定する"""
+        now = time.time()
+        expires = self._verified.get(token)
+        if expires is not None:
+            if expires > now:
+                return True
+            self._verified.pop(token, None)
+            return False
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            return False
+        if claims.get("sub") != "admin":
+            return False
+        with self._lock:
+            self._verified[token] = claims["exp"]
+            while len(self._verified) > TOKEN_CACHE_SIZE:
+                self._verified.popitem(last=False)
+        return True
+
+
+admin_auth = AdminAuth()
+_bearer = HTTPBearer(auto_error=False)
+
+
+async def require_admin(credentials: HTTPAuthorizationCredentials = Depends(_bearer)):
+    """管理者APIの依存関係: Authorization: Bearer <token> を確認する"""
+    if credentials is None or not admin_auth.verify_token(credentials.credentials):
+        logger.warning("管理者認証失敗: トークンが無効です")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="管理者としてログインしてください",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -1,17 +1,46 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import os
 
 # データベースURL（SQLiteを使用）
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./renu_typing_game.db")
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 
+# SQLiteの設定
+# WALモードでは読み込みが書き込みを待たず、synchronous=NORMAL でコミットごとのfsyncを減らせます
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}  # SQLite用の設定
+
+# 書き込み用エンジン（SQLiteの書き込みは1本の接続に集約する）
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # SQLite用の設定
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args,
+    **({"pool_size": 1, "max_overflow": 0, "pool_timeout": SQLITE_BUSY_TIMEOUT_MS / 1000} if IS_SQLITE else {})
 )
 
+# 読み込み用エンジン
+read_engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args) if IS_SQLITE else engine
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _configure_sqlite)
+    event.listen(read_engine, "connect", _configure_sqlite)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -21,3 +50,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# DBアクセスの実行方式
+# "threadpool": 専用スレッドプールで実行し、SQLiteのI/O中もイベントループを止めない
+# "inline": 従来どおりイベントループ上で直接実行する
+DB_ACCESS_MODE = os.getenv("DB_ACCESS_MODE", "threadpool")
+DB_THREADPOOL_SIZE = int(os.getenv("DB_THREADPOOL_SIZE", "4"))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADPOOL_SIZE, thread_name_prefix="db")
+
+async def run_db(func, *args, **kwargs):
+    """同期のDB処理を DB_ACCESS_MODE に従って実行する"""
+    if DB_ACCESS_MODE == "inline":
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
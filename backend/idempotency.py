@@ -0,0 +1,53 @@
+"""
+ランキング送信の冪等キー
+クライアントが結果ごとに生成したキーで、タイムアウト後の再送などによる二重登録を防ぎます
+- 重複の判定は rankings.idempotency_key の一意インデックスで行う（登録と同じトランザクション内で確認する）
+- 最近登録したキーとその登録結果は件数を制限したLRUに保持し、再送は書き込みキューに入れずに返す
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from metrics import metrics
+
+# 登録結果を保持するキーの件数
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+
+class RecentKeys:
+    """冪等キー → 登録結果（レスポンスの辞書）。最近使われた順に IDEMPOTENCY_CACHE_SIZE 件まで保持する"""
+
+    def __init__(self, size=IDEMPOTENCY_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+        if result is None:
+            metrics.cache_miss("idempotency")
+        else:
+            metrics.cache_hit("idempotency")
+        return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        """管理者がランキングを削除した場合など、保持している登録結果が古くなったときに呼ぶ"""
+        with self._lock:
+            self._results.clear()
+
+    def __len__(self):
+        return len(self._results)
+
+
+recent_keys = RecentKeys()
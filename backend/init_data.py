@@ -5,12 +5,14 @@
 
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
-from models import Base, TextContent, AdminSettings
+from models import TextContent, AdminSettings
+from migrations import run_migrations
+from text_store import import_texts_json
 from passlib.context import CryptContext
 import os
 
-# データベーステーブルの作成
-Base.metadata.create_all(bind=engine)
+# データベーススキーマの作成・更新
+run_migrations(engine)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -118,12 +120,6 @@ def create_admin_settings():
     """管理者設定を作成"""
     db = SessionLocal()
     try:
-        # 既存の設定をチェック
-        existing_settings = db.query(AdminSettings).count()
-        if existing_settings > 0:
-            print("管理者設定は既に存在します")
-            return
-
         settings = [
             {
                 "setting_key": "game_time_limit",
@@ -142,6 +138,13 @@ def create_admin_settings():
             }
         ]
 
+        # 既存の設定をチェック（texts.json の取り込み記録など他の設定があっても、ないキーだけを追加する）
+        existing_keys = {key for (key,) in db.query(AdminSettings.setting_key)}
+        settings = [setting for setting in settings if setting["setting_key"] not in existing_keys]
+        if not settings:
+            print("管理者設定は既に存在します")
+            return
+
         for setting_data in settings:
             admin_setting = AdminSettings(
                 setting_key=setting_data["setting_key"],
@@ -160,6 +163,12 @@ def create_admin_settings():
 
 if __name__ == "__main__":
     print("初期データを作成しています...")
+    # texts.json があればそちらを優先して取り込む（ローマ字付き）
+    db = SessionLocal()
+    try:
+        import_texts_json(db)
+    finally:
+        db.close()
     create_sample_texts()
     create_admin_settings()
     print("初期データの作成が完了しました！")
@@ -0,0 +1,294 @@
+"""
+インメモリのランキング（上位K件）
+期間 × 難易度ごとに上位K件を保持し、ランキングの送信・管理操作のたびに差分更新します
+参照（top）はメモリだけで完結し、DBからの再読み込み（reload）はスレッドプールから呼び出します
+"""
+
+import bisect
+import os
+import threading
+from datetime import datetime
+
+from database import ReadSessionLocal
+from log import logger
+from metrics import metrics
+from ranking_queries import DATE_FILTERS, window_start, rankings_query
+from models import Ranking
+
+# 各ランキングで保持する件数（これを超える limit はSQLで処理します）
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+
+
+# 上位K件に保持し、差分配信で送る項目（公開してよいものだけ。冪等キー・フラグなどは含めない）
+ENTRY_FIELDS = ("id", "nickname", "wpm", "accuracy", "difficulty", "text_content_id", "created_at")
+
+
+def ranking_to_entry(ranking):
+    return {field: getattr(ranking, field) for field in ENTRY_FIELDS}
+
+
+def dict_to_entry(ranking):
+    """ranking_to_dict などで作った全カラムの辞書から、公開する項目だけを取り出す"""
+    return {field: ranking[field] for field in ENTRY_FIELDS}
+
+
+def entry_key(entry):
+    # SQLと同じ並び順（WPM降順、同値はID昇順）
+    return (-entry["wpm"], entry["id"])
+
+
+class Board:
+    """1つの (期間, 難易度) に対応する上位K件"""
+
+    def __init__(self, date_filter, difficulty, size):
+        self.date_filter = date_filter
+        self.difficulty = difficulty
+        self.size = size
+        self.keys = []
+        self.entries = []
+        # K件を超えてDBにだけ残っている記録があるか
+        self.truncated = False
+        # 欠けた順位を埋めるためにDBからの再読み込みが必要か
+        self.dirty = True
+        # 再読み込み中の目印と、その間に届いた変更（読み込んだ結果に後から適用する）
+        self.loading = None
+        self.pending = []
+
+    def matches(self, entry, now):
+        if self.difficulty is not None and entry["difficulty"] != self.difficulty:
+            return False
+        start = window_start(self.date_filter, now)
+        return start is None or entry["created_at"] >= start
+
+    def read(self, db, now):
+        rows = rankings_query(db, self.date_filter, self.difficulty, now=now).limit(self.size + 1).all()
+        return [ranking_to_entry(row) for row in rows]
+
+    def fill(self, entries):
+        self.entries = entries[:self.size]
+        self.keys = [entry_key(entry) for entry in self.entries]
+        self.truncated = len(entries) > self.size
+        self.dirty = False
+
+    def insert(self, entry):
+        """記録を挿入し、挿入位置と押し出された記録を返す（圏外の場合は位置 None）"""
+        key = entry_key(entry)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            # 反映済みの記録（他のワーカーからの同期と重なった場合など）
+            return None, None
+        if position >= self.size:
+            self.truncated = True
+            return None, None
+        self.keys.insert(position, key)
+        self.entries.insert(position, entry)
+        evicted = None
+        if len(self.entries) > self.size:
+            self.keys.pop()
+            evicted = self.entries.pop()
+            self.truncated = True
+        return position, evicted
+
+    def remove(self, ranking_id):
+        for position, entry in enumerate(self.entries):
+            if entry["id"] == ranking_id:
+                del self.keys[position]
+                del self.entries[position]
+                # 切り捨てた記録が繰り上がるため再読み込みが必要
+                if self.truncated:
+                    self.dirty = True
+                return True
+        return False
+
+    def expire(self, now):
+        """期間外になった記録を取り除く"""
+        start = window_start(self.date_filter, now)
+        if start is None or not self.entries:
+            return False
+        kept = [entry for entry in self.entries if entry["created_at"] >= start]
+        if len(kept) == len(self.entries):
+            return False
+        self.entries = kept
+        self.keys = [entry_key(entry) for entry in kept]
+        if self.truncated:
+            self.dirty = True
+        return True
+
+    def clear(self):
+        self.keys = []
+        self.entries = []
+        self.truncated = False
+        self.dirty = False
+        self.loading = None
+        self.pending = []
+
+
+class Leaderboard:
+    """期間 × 難易度ごとの Board をまとめて管理する"""
+
+    def __init__(self, size=LEADERBOARD_SIZE, session_factory=ReadSessionLocal):
+        self.size = size
+        self.session_factory = session_factory
+        self._lock = threading.RLock()
+        self.boards = {}
+        self.version = 0
+
+    @staticmethod
+    def normalize(date_filter, difficulty):
+        if date_filter not in DATE_FILTERS:
+            date_filter = "all"
+        return date_filter, difficulty or None
+
+    def needs_reload(self, date_filter, difficulty):
+        with self._lock:
+            board = self.boards.get(self.normalize(date_filter, difficulty))
+            return board is not None and board.dirty
+
+    def reload(self, date_filter, difficulty):
+        """
+        再読み込みが必要なランキングをDBから構築する（DBアクセスを伴うため run_db から呼び出す）
+        SQLの実行中はロックを持たず、その間に反映された送信・削除は読み込んだ結果に適用し直す
+        """
+        key = self.normalize(date_filter, difficulty)
+        with self._lock:
+            board = self.boards.get(key)
+            if board is None or not board.dirty or board.loading is not None:
+                return
+            token = board.loading = object()
+            board.pending = []
+
+        db = self.session_factory()
+        try:
+            entries = board.read(db, datetime.utcnow())
+        except Exception:
+            with self._lock:
+                if board.loading is token:
+                    board.loading = None
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            # 読み込み中に全体の再読み込み・リセットがあった場合は結果を捨てる
+            if self.boards.get(key) is not board or board.loading is not token:
+                return
+            board.fill(entries)
+            for action, value in board.pending:
+                if action == "add":
+                    board.insert(value)
+                else:
+                    board.remove(value)
+            board.loading = None
+            board.pending = []
+            self.version += 1
+
+    def load(self):
+        """起動時・一括操作の後にDBから全ての (期間, 難易度) を読み込む（run_db から呼び出す）"""
+        db = self.session_factory()
+        try:
+            difficulties = [difficulty for (difficulty,) in db.query(Ranking.difficulty).distinct()]
+        finally:
+            db.close()
+
+        with self._lock:
+            self.boards = {}
+            for date_filter in DATE_FILTERS:
+                for difficulty in [None] + difficulties:
+                    self.boards[(date_filter, difficulty)] = Board(date_filter, difficulty, self.size)
+            self.version += 1
+        for key in list(self.boards):
+            self.reload(*key)
+        logger.info("ランキング読み込み: %d件のランキングを構築しました", len(self.boards))
+
+    def top(self, date_filter, difficulty, limit):
+        """上位 limit 件を返す。保持件数を超える場合は None（呼び出し側でSQLを使う）"""
+        return self.top_with_version(date_filter, difficulty, limit)[0]
+
+    def top_with_version(self, date_filter, difficulty, limit):
+        """
+        top() の結果と、その内容に対応する版を返す（レスポンスのキャッシュ用）
+        DBにはアクセスせず、再読み込みが必要なランキングは None を返す（呼び出し側で reload する）
+        """
+        if limit < 0 or limit > self.size:
+            metrics.cache_miss("rankings")
+            return None, self.version
+        key = self.normalize(date_filter, difficulty)
+        now = datetime.utcnow()
+        with self._lock:
+            board = self.boards.get(key)
+            if board is None:
+                # 記録が1件もない難易度はここで保持せずSQLに任せる
+                metrics.cache_miss("rankings")
+                return None, self.version
+            if board.expire(now):
+                self.version += 1
+            if board.dirty:
+                metrics.cache_miss("rankings")
+                return None, self.version
+            metrics.cache_hit("rankings")
+            return board.entries[:limit], self.version
+
+    def add(self, entry):
+        """送信された記録を該当する全てのランキングに反映し、(キー, 順位, 押し出された記録) を返す"""
+        now = datetime.utcnow()
+        changes = []
+        with self._lock:
+            if ("all", entry["difficulty"]) not in self.boards:
+                # 新しい難易度のランキングは次回の参照時にDBから構築する
+                for date_filter in DATE_FILTERS:
+                    self.boards.setdefault((date_filter, entry["difficulty"]),
+                                           Board(date_filter, entry["difficulty"], self.size))
+            for key, board in self.boards.items():
+                if not board.matches(entry, now):
+                    continue
+                if board.dirty:
+                    # 再読み込み中のランキングには読み込み後に適用する（それ以外は次の読み込みでDBから入る）
+                    if board.loading is not None:
+                        board.pending.append(("add", entry))
+                    continue
+                position, evicted = board.insert(entry)
+                if position is not None:
+                    changes.append((key, position, evicted))
+            self.version += 1
+        return changes
+
+    def remove(self, ranking_id):
+        with self._lock:
+            for board in self.boards.values():
+                if board.loading is not None:
+                    board.pending.append(("remove", ranking_id))
+                board.remove(ranking_id)
+            self.version += 1
+
+    def replace(self, entry):
+        """管理者による編集を反映する（古い位置から取り除いて入れ直す）"""
+        now = datetime.utcnow()
+        with self._lock:
+            for board in self.boards.values():
+                matches = board.matches(entry, now)
+                if board.loading is not None:
+                    board.pending.append(("remove", entry["id"]))
+                    if matches:
+                        board.pending.append(("add", entry))
+                board.remove(entry["id"])
+                if not board.dirty and matches:
+                    board.insert(entry)
+            self.version += 1
+
+    def invalidate(self):
+        """一括操作の後などに全ランキングを再読み込み対象にする（読み込み中の結果は使わない）"""
+        with self._lock:
+            for board in self.boards.values():
+                board.dirty = True
+                board.loading = None
+                board.pending = []
+            self.version += 1
+
+    def clear(self):
+        with self._lock:
+            for board in self.boards.values():
+                board.clear()
+            self.version += 1
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,142 @@
+"""
+ランキングの差分配信（Server-Sent Events）
+ランキング送信のたびに、期間 × 難易度ごとの差分（挿入された順位・押し出された記録）を購読者へ配信します
+差分は1回だけシリアライズして全購読者で共有し、キューが溢れた（読むのが遅い）購読者は切断します
+長時間つながる接続のため、同時に購読できる数に全体とクライアントIPごとの上限を設けます
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+
+from log import logger
+from metrics import metrics
+
+# 購読者ごとに溜めておけるイベント数（溢れたら切断する）
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "64"))
+# 接続維持のためのコメントを送る間隔（秒）
+LIVE_HEARTBEAT_INTERVAL = float(os.getenv("LIVE_HEARTBEAT_INTERVAL", "15"))
+# 同時に購読できる数の上限（全体・クライアントIPごと）
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "5000"))
+LIVE_MAX_SUBSCRIBERS_PER_CLIENT = int(os.getenv("LIVE_MAX_SUBSCRIBERS_PER_CLIENT", "20"))
+
+HEARTBEAT = b": ping\n\n"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} はJSONにできません")
+
+
+def encode_event(event, data):
+    """SSEのイベント1件をバイト列にする"""
+    payload = json.dumps(data, default=_default, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    def __init__(self, key, queue_size, client=None):
+        self.key = key
+        self.client = client
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+
+class LeaderboardHub:
+    """(期間, 難易度) ごとの購読者へ差分を配信する"""
+
+    def __init__(self, queue_size=LIVE_QUEUE_SIZE, max_subscribers=LIVE_MAX_SUBSCRIBERS,
+                 max_per_client=LIVE_MAX_SUBSCRIBERS_PER_CLIENT):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.max_per_client = max_per_client
+        self.subscribers = {}
+        # クライアントIP → 購読数
+        self.clients = {}
+        self.count = 0
+        self.dropped = 0
+
+    def subscribe(self, key, client=None):
+        """購読を始める。上限に達している場合は None（呼び出し側で 503 を返す）"""
+        if self.count >= self.max_subscribers or (
+                client is not None and self.clients.get(client, 0) >= self.max_per_client):
+            metrics.increment("live_subscribers_rejected_total")
+            return None
+        subscriber = Subscriber(key, self.queue_size, client)
+        self.subscribers.setdefault(key, set()).add(subscriber)
+        self.count += 1
+        if client is not None:
+            self.clients[client] = self.clients.get(client, 0) + 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """購読をやめる（同じ購読者に何度呼び出してもよい）"""
+        subscribers = self.subscribers.get(subscriber.key)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[subscriber.key]
+        self.count -= 1
+        if subscriber.client is not None:
+            remaining = self.clients[subscriber.client] - 1
+            if remaining:
+                self.clients[subscriber.client] = remaining
+            else:
+                del self.clients[subscriber.client]
+
+    def _send(self, subscribers, message):
+        for subscriber in list(subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 読み出しが追いつかない購読者は切断する（他の購読者や送信処理を待たせない）
+                subscriber.closed = True
+                self.unsubscribe(subscriber)
+                self.dropped += 1
+                metrics.increment("live_subscribers_dropped_total")
+                logger.warning("ランキング配信: 遅い購読者を切断しました (%s)", subscriber.key)
+
+    def publish_changes(self, entry, changes):
+        """Leaderboard.add の戻り値を購読者へ配信する（イベントループ上で呼び出す）"""
+        for (date_filter, difficulty), position, evicted in changes:
+            subscribers = self.subscribers.get((date_filter, difficulty))
+            if not subscribers:
+                continue
+            message = encode_event("diff", {
+                "date_filter": date_filter,
+                "difficulty": difficulty,
+                "rank": position + 1,
+                "entry": entry,
+                "evicted_id": evicted["id"] if evicted else None,
+            })
+            self._send(subscribers, message)
+
+    def publish_reset(self):
+        """管理操作などで差分では表せない変更があったことを通知する（クライアントは再取得する）"""
+        message = encode_event("reset", {})
+        for subscribers in list(self.subscribers.values()):
+            self._send(subscribers, message)
+
+    async def stream(self, subscriber, snapshot=None, heartbeat=LIVE_HEARTBEAT_INTERVAL):
+        """
+        subscribe() で始めた購読者1人分のSSEストリーム（終わると購読をやめる）
+        snapshot は最初に送るイベントを返す非同期関数（取りこぼしがないよう購読を始めてから呼び出す）
+        """
+        try:
+            if snapshot is not None:
+                yield await snapshot()
+            while True:
+                if subscriber.closed and subscriber.queue.empty():
+                    return
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            self.unsubscribe(subscriber)
+
+
+live_hub = LeaderboardHub()
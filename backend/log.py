@@ -0,0 +1,30 @@
+"""
+ログ設定
+LOG_LEVEL で出力レベルを、LOG_SAMPLE_RATE でリクエストごとに出るログの間引き率を指定します
+"""
+
+import logging
+import os
+import random
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# リクエストごとのデバッグログを出力する割合（0〜1）
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+logger = logging.getLogger("renu")
+logger.setLevel(LOG_LEVEL)
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+
+def sampled_debug():
+    """
+    ホットパスのデバッグログを出力するかどうか
+    DEBUG が無効なら乱数も引かずに False を返すため、無効時のコストはほぼゼロです
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
@@ -1,26 +1,186 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 from typing import List, Optional
+from contextlib import asynccontextmanager
 import uvicorn
+import csv
+import io
+import json
 import os
 from datetime import datetime
 
-from database import get_db, engine
-from models import Base, GameSession, TextContent, AdminSettings, Ranking
+from database import get_db, get_read_db, engine, read_engine, SessionLocal, ReadSessionLocal, run_db
+from log import logger, sampled_debug
+from metrics import metrics, MetricsMiddleware, instrument_engine
+from migrations import run_migrations
+from ranking_queries import (
+    rankings_query, ranking_to_dict, filter_conditions, admin_rankings_page, stream_rankings,
+    is_visible, FLAG_APPROVED
+)
+from leaderboard import leaderboard, ranking_to_entry, dict_to_entry, LEADERBOARD_SIZE
+from live import live_hub, encode_event
+from response_cache import response_cache, encoded_response
+from percentiles import percentile_sketch
+from text_catalog import text_catalog
+from text_draw import text_drawer, TEXT_DRAW_MAX_COUNT
+from romaji import automaton_cache
+import text_store
+import text_search
+import player_stats
+import plausibility
+from idempotency import recent_keys
+from singleflight import SingleFlight
+from write_queue import write_batcher
+from session_reaper import session_reaper
+from workers import worker_sync, startup_lock
+from auth import admin_auth, require_admin
+from warmup import warm_up, WarmUpMiddleware
+from admission import AdmissionMiddleware, rate_limit, client_ip
+from models import GameSession, Ranking, PlayerStats
 from schemas import (
-    GameSessionCreate, GameSessionResponse,
-    TextContentCreate, TextContentUpdate, AdminSettingsUpdate,
-    RankingResponse, RankingCreate
+    GameSessionCreate, GameSessionComplete, GameSessionResponse,
+    TextContentCreate, TextContentUpdate,
+    RankingResponse, RankingCreate, RankingBatch, RankingFilter, RankingBulkUpdate, PersonalStats,
+    AdminLogin, AdminToken
 )
 
-# データベーステーブルの作成
-Base.metadata.create_all(bind=engine)
+# キャッシュから返すランキングの項目（RankingResponse と同じ）
+RANKING_FIELDS = tuple(RankingResponse.model_fields)
+
+# DBクエリ時間の計測
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine)
+
+def max_ranking_id():
+    db = ReadSessionLocal()
+    try:
+        return db.scalar(select(func.max(Ranking.id))) or 0
+    finally:
+        db.close()
+
+def rankings_after(ranking_id):
+    db = ReadSessionLocal()
+    try:
+        rows = db.execute(select(Ranking.__table__).where(Ranking.id > ranking_id).order_by(Ranking.id)).mappings()
+        return [dict(row) for row in rows]
+    finally:
+        db.close()
+
+# 他のワーカーが追加したランキングの取り込み位置（このIDまでは反映済み）と、それより後で反映済みのID
+# （ウォームアップで現在の最大IDに設定する）
+ranking_sync = {"cursor": 0, "applied": set()}
+
+def mark_ranking_applied(ranking_id):
+    """このワーカーで登録・反映したランキングを取り込み済みにする"""
+    if ranking_id == ranking_sync["cursor"] + 1:
+        ranking_sync["cursor"] = ranking_id
+        while ranking_sync["cursor"] + 1 in ranking_sync["applied"]:
+            ranking_sync["cursor"] += 1
+            ranking_sync["applied"].discard(ranking_sync["cursor"])
+    elif ranking_id > ranking_sync["cursor"]:
+        ranking_sync["applied"].add(ranking_id)
+
+async def sync_new_rankings():
+    """他のワーカーが追加したランキングを、上位K件・WPM分布・差分配信に反映する"""
+    for ranking in await run_db(rankings_after, ranking_sync["cursor"]):
+        # 読み込み中にこのワーカーで反映した記録は飛ばす
+        if (ranking["id"] > ranking_sync["cursor"] and ranking["id"] not in ranking_sync["applied"]
+                and is_visible(ranking["flag"])):
+            percentile_sketch.add(ranking)
+            entry = dict_to_entry(ranking)
+            live_hub.publish_changes(entry, leaderboard.add(entry))
+        mark_ranking_applied(ranking["id"])
+
+async def sync_reset_rankings():
+    """他のワーカーで管理者による削除・編集があった場合は全て読み直す"""
+    ranking_sync["cursor"] = await run_db(max_ranking_id)
+    ranking_sync["applied"].clear()
+    recent_keys.clear()
+    await run_db(leaderboard.load)
+    await run_db(percentile_sketch.load)
+    live_hub.publish_reset()
+
+async def sync_texts():
+    await run_db(text_catalog.refresh)
+
+if worker_sync is not None:
+    worker_sync.register("texts", sync_texts)
+    worker_sync.register("rankings", sync_new_rankings)
+    worker_sync.register("rankings_reset", sync_reset_rankings)
+
+def notify_workers(name):
+    """このワーカーでの書き込みを他のワーカーへ知らせる（単一プロセスの場合は何もしない）"""
+    if worker_sync is not None:
+        worker_sync.notify(name)
+
+async def sync_workers():
+    """読み取りの前に他のワーカーでの書き込みを反映する（変更がなければ共有メモリを読むだけ）"""
+    if worker_sync is not None:
+        await worker_sync.check()
+
+def prepare_database():
+    """
+    スキーマの更新と初期データの取り込み
+    （複数ワーカーの場合は1ワーカーずつ実行し、2番目以降は適用・取り込み済みであることを確認するだけ）
+    """
+    with startup_lock():
+        run_migrations(engine)
+        db = SessionLocal()
+        try:
+            # texts.json をテキストテーブルへ一度だけ取り込む
+            text_store.import_texts_json(db)
+            # 集計テーブルを追加した直後は既存のランキングから作成する
+            player_stats.backfill_if_empty(db)
+        finally:
+            db.close()
+
+def load_ranking_cursor():
+    ranking_sync["cursor"] = max_ranking_id()
+    ranking_sync["applied"].clear()
+
+# 起動時に順に実行する準備（完了するまで /ready は 503 を返す）
+WARMUP_STEPS = [
+    ("database", prepare_database),
+    ("texts", text_catalog.refresh),
+    # ローマ字入力のオートマトンをコンパイルしておく
+    ("automata", text_catalog.get_active_with_automata),
+    ("ranking_cursor", load_ranking_cursor),
+    # ランキング上位とWPM分布をメモリに読み込む
+    ("leaderboard", leaderboard.load),
+    ("percentiles", percentile_sketch.load),
+    # テキスト抽選の重み付けに使う最近の出題回数
+    ("text_plays", text_drawer.plays.load),
+    # 放置されたゲームセッションの定期削除はスキーマの準備後に開始する
+    ("session_reaper", session_reaper.start),
+]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ランキング・ゲームセッションの書き込みキューを開始
+    await write_batcher.start()
+    # DBの準備とホットデータの読み込み（サーバーは応答を始め、完了まで /ready は 503 を返す）
+    await warm_up.start(WARMUP_STEPS)
+    # 他のワーカーでの書き込みの定期確認を開始
+    if worker_sync is not None:
+        await worker_sync.start()
+    yield
+    if worker_sync is not None:
+        await worker_sync.stop()
+    await warm_up.stop()
+    await session_reaper.stop()
+    await write_batcher.stop()
 
 app = FastAPI(
     title="ReNU打 API",
     description="タイピングゲームのAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -32,18 +192,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 管理者認証用のシンプルな設定
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
+# ウォームアップが終わるまでリクエストを待たせる
+app.add_middleware(WarmUpMiddleware)
+
+# 過負荷時の受付制限（同時処理数・書き込みキューの上限）
+app.add_middleware(AdmissionMiddleware, write_queue_depth=lambda: write_batcher.pending)
+
+# エンドポイントごとのメトリクス計測（受付制限で断ったリクエストも計測する）
+app.add_middleware(MetricsMiddleware)
+
+# 公開ランキングの1ページあたりの最大件数
+RANKINGS_PAGE_MAX_SIZE = 100
+
+# 管理画面のランキング一覧の1ページあたりの最大件数
+ADMIN_PAGE_MAX_SIZE = 1000
+
+# テキスト検索の1ページあたりの最大件数
+TEXT_SEARCH_MAX_SIZE = 200
+# 同時に届いた同じランキングのSQLを1回にまとめ、結果を保持する秒数（ランキングが更新されると版が変わり使われなくなる）
+RANKINGS_QUERY_TTL = float(os.getenv("RANKINGS_QUERY_TTL", "1.0"))
+
+rankings_flight = SingleFlight("rankings_query")
+leaderboard_flight = SingleFlight("leaderboard_reload")
+texts_flight = SingleFlight("texts_load")
+
+# テキストの一括追加で一度に受け付ける最大件数
+BULK_IMPORT_MAX_ROWS = 50000
 
 # ルートエンドポイント
 @app.get("/")
 async def root():
     return {"message": "ReNU打 API へようこそ！"}
 
+# 準備完了の確認（ロードバランサ・ヘルスチェック用）
+@app.get("/ready")
+async def ready():
+    status_data = warm_up.status()
+    if not warm_up.ready:
+        return JSONResponse(status_code=503, content=status_data)
+    return status_data
+
+# メトリクス（Prometheus テキスト形式）
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # デバッグ用エンドポイント
 @app.get("/api/debug/status")
 async def debug_status():
-    import json
     import os
     
     debug_info = {
@@ -73,15 +269,11 @@ async def debug_status():
             debug_info["texts_file"]["size"] = os.path.getsize(texts_file)
             debug_info["texts_file"]["readable"] = os.access(texts_file, os.R_OK)
             
-            # ファイルの内容を読み込み
-            try:
-                with open(texts_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    texts = data.get('texts', [])
-                    debug_info["texts_data"]["count"] = len(texts)
-                    debug_info["texts_data"]["sample"] = texts[:3] if texts else []
-            except Exception as e:
-                debug_info["texts_data"]["error"] = str(e)
+            # キャッシュ済みのカタログから内容を取得
+            texts = text_catalog.get_all()
+            debug_info["texts_data"]["count"] = len(texts)
+            debug_info["texts_data"]["sample"] = texts[:3] if texts else []
+            debug_info["texts_data"]["error"] = text_catalog.error
         else:
             debug_info["texts_file"]["error"] = "ファイルが存在しません"
             
@@ -90,430 +282,745 @@ async def debug_status():
     
     return debug_info
 
-# 管理者認証用のシンプルな関数
-def verify_admin_password(password: str):
-    print(f"認証試行: 入力パスワード='{password}', 正しいパスワード='{ADMIN_PASSWORD}'")
-    result = password == ADMIN_PASSWORD
-    print(f"認証結果: {result}")
-    return result
-
 # ゲームセッション関連エンドポイント
-@app.post("/api/game/session", response_model=GameSessionResponse)
-async def create_game_session(
-    session_data: GameSessionCreate,
-    db: Session = Depends(get_db)
-):
-    db_session = GameSession(
-        nickname=session_data.nickname,
-        text_content_id=session_data.text_content_id,
-        difficulty=session_data.difficulty,
-        start_time=datetime.utcnow()
-    )
-    db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
-    return db_session
-
-@app.get("/api/game/texts")
-async def get_text_contents():
-    import json
-    import os
+@app.post("/api/game/session", response_model=GameSessionResponse, dependencies=[Depends(rate_limit("game_session"))])
+async def create_game_session(session_data: GameSessionCreate):
+    def insert_session(db):
+        db_session = GameSession(
+            nickname=session_data.nickname,
+            text_content_id=session_data.text_content_id,
+            difficulty=session_data.difficulty,
+            start_time=datetime.utcnow(),
+            is_completed=False
+        )
+        db.add(db_session)
+        db.flush()
+        return {column.name: getattr(db_session, column.name) for column in GameSession.__table__.columns}
     
-    print("=== テキスト取得API開始 ===")
+    # 同時に届いた書き込みと1トランザクションにまとめてコミットする
+    return await write_batcher.submit(insert_session)
+
+@app.post("/api/game/session/{session_id}/complete", response_model=GameSessionResponse)
+async def complete_game_session(session_id: int, completion: GameSessionComplete):
+    """セッションを終了し、登録されたランキングと結び付ける（完了済みの場合はそのまま返す）"""
+    def close_session(db):
+        db_session = db.get(GameSession, session_id)
+        if db_session is None:
+            return "session_not_found", None
+        if not db_session.is_completed:
+            wpm, accuracy = completion.wpm, completion.accuracy
+            if completion.ranking_id is not None:
+                ranking = db.get(Ranking, completion.ranking_id)
+                if ranking is None:
+                    return "ranking_not_found", None
+                wpm = ranking.wpm if wpm is None else wpm
+                accuracy = ranking.accuracy if accuracy is None else accuracy
+                db_session.ranking_id = ranking.id
+            db_session.end_time = datetime.utcnow()
+            db_session.wpm = wpm
+            db_session.accuracy = accuracy
+            db_session.is_completed = True
+            db.flush()
+        return "ok", {column.name: getattr(db_session, column.name) for column in GameSession.__table__.columns}
     
-    try:
-        # テキストファイルのパス
-        texts_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'texts.json')
-        print(f"テキストファイルパス: {texts_file}")
-        print(f"ファイル存在確認: {os.path.exists(texts_file)}")
-        
-        # ファイルが存在しない場合はデフォルトテキストを返す
-        if not os.path.exists(texts_file):
-            print("警告: テキストファイルが存在しません。デフォルトテキストを返します。")
-            default_texts = [
-                {"id": 1, "title": "こんにちは", "content": "こんにちは", "difficulty": "easy", "is_active": True},
-                {"id": 2, "title": "ありがとう", "content": "ありがとう", "difficulty": "easy", "is_active": True},
-                {"id": 3, "title": "おはよう", "content": "おはよう", "difficulty": "easy", "is_active": True}
-            ]
-            print(f"デフォルトテキスト返却: {len(default_texts)}件")
-            return default_texts
-        
-        # ファイルサイズを確認
-        file_size = os.path.getsize(texts_file)
-        print(f"ファイルサイズ: {file_size} bytes")
-        
-        # ファイルからテキストを読み込み
-        print("ファイル読み込み開始...")
-        with open(texts_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            texts = data.get('texts', [])
-            print(f"JSON読み込み成功: {len(texts)}件のテキスト")
-            
-        # アクティブなテキストのみを返す
-        active_texts = [text for text in texts if text.get('is_active', True)]
-        print(f"アクティブテキスト: {len(active_texts)}件")
-        
-        # 難易度別の統計
-        easy_count = len([t for t in active_texts if t.get('difficulty') == 'easy'])
-        medium_count = len([t for t in active_texts if t.get('difficulty') == 'medium'])
-        hard_count = len([t for t in active_texts if t.get('difficulty') == 'hard'])
-        print(f"難易度別統計 - Easy: {easy_count}, Medium: {medium_count}, Hard: {hard_count}")
-        
-        print("=== テキスト取得API成功 ===")
-        return active_texts
-        
-    except json.JSONDecodeError as e:
-        print(f"JSON解析エラー: {e}")
-        print("デフォルトテキストを返します")
-        return [
-            {"id": 1, "title": "こんにちは", "content": "こんにちは", "difficulty": "easy", "is_active": True},
-            {"id": 2, "title": "ありがとう", "content": "ありがとう", "difficulty": "easy", "is_active": True},
-            {"id": 3, "title": "おはよう", "content": "おはよう", "difficulty": "easy", "is_active": True}
-        ]
-    except Exception as e:
-        print(f"予期しないエラー: {e}")
-        print(f"エラータイプ: {type(e).__name__}")
-        import traceback
-        print(f"スタックトレース: {traceback.format_exc()}")
-        # エラー時はデフォルトテキストを返す
-        return [
-            {"id": 1, "title": "こんにちは", "content": "こんにちは", "difficulty": "easy", "is_active": True},
-            {"id": 2, "title": "ありがとう", "content": "ありがとう", "difficulty": "easy", "is_active": True},
-            {"id": 3, "title": "おはよう", "content": "おはよう", "difficulty": "easy", "is_active": True}
-        ]
+    result, session = await write_batcher.submit(close_session)
+    if result == "session_not_found":
+        raise HTTPException(status_code=404, detail="ゲームセッションが見つかりません")
+    if result == "ranking_not_found":
+        raise HTTPException(status_code=404, detail="ランキングが見つかりません")
+    return session
+
+@app.get("/api/game/texts")
+async def get_text_contents(request: Request, with_automata: bool = False):
+    # キャッシュ済みのアクティブテキストを返す（ウォーム時はディスクI/OもJSON解析も行わない）
+    # エンコード・圧縮済みの本文はカタログの版が変わるまで使い回す
+    await sync_workers()
+    if not text_catalog.loaded:
+        # 読み込み前に同時に届いた要求は1回の読み込みを共有する（イベントループは止めない）
+        await texts_flight.do("/api/game/texts", lambda: run_db(text_catalog.ensure_loaded))
+    if with_automata:
+        # ローマ字入力の受理オートマトン付き（コンパイル済みのものを返す）
+        body = response_cache.get(("texts", True), text_catalog.version, text_catalog.get_active_with_automata)
+    else:
+        body = response_cache.get(("texts", False), text_catalog.version, text_catalog.get_active)
+    return encoded_response(request, body)
+
+@app.get("/api/game/texts/next", dependencies=[Depends(rate_limit("texts_draw"))])
+async def draw_texts(
+    difficulty: Optional[str] = None,
+    count: int = Query(1, ge=1, le=TEXT_DRAW_MAX_COUNT),
+    session: Optional[str] = Query(None, max_length=64),  # 指定すると同じセッション内で同じテキストを出さない
+    weighted: bool = False,  # 最近よく出たテキストほど出にくくする
+    with_automata: bool = False
+):
+    """
+    テキストを抽選して、選ばれたものだけを返す（カタログ全体を送らない）
+    難易度別の配列から O(件数) で抽選する
+    """
+    await sync_workers()
+    if session and text_drawer.shared is not None:
+        # 複数ワーカーでは出題済みのテキストを共有ファイルで確認する（ファイルI/Oのためスレッドプールで実行）
+        texts = await run_db(text_drawer.draw, difficulty, count, session, weighted)
+    else:
+        texts = text_drawer.draw(difficulty, count, session, weighted)
+    if with_automata:
+        texts = [{**text, "automaton": automaton_cache.get(text.get('content'), text.get('romaji'))} for text in texts]
+    return texts
+
+async def leaderboard_top(date_filter, difficulty, limit):
+    """
+    メモリ上の上位K件を (記録, 版) で返す。保持していない場合は (None, 版)
+    再読み込みが必要なランキングはDB用のスレッドで構築してから返す（同時の要求は1回の読み込みを共有する）
+    """
+    entries, version = leaderboard.top_with_version(date_filter, difficulty, limit)
+    if entries is None and limit <= LEADERBOARD_SIZE and leaderboard.needs_reload(date_filter, difficulty):
+        key = leaderboard.normalize(date_filter, difficulty)
+        await leaderboard_flight.do(key, lambda: run_db(leaderboard.reload, *key))
+        entries, version = leaderboard.top_with_version(date_filter, difficulty, limit)
+    return entries, version
 
 # ランキング関連エンドポイント
-@app.get("/api/rankings", response_model=List[RankingResponse])
+@app.get("/api/rankings", response_model=List[RankingResponse], dependencies=[Depends(rate_limit("rankings_read"))])
 async def get_rankings(
-    limit: int = 10,
+    request: Request,
+    limit: int = Query(10, ge=1, le=RANKINGS_PAGE_MAX_SIZE),
     date_filter: Optional[str] = None,  # "today", "week", "month", "all"
-    db: Session = Depends(get_db)
+    difficulty: Optional[str] = None,
+    best_per_player: bool = False  # プレイヤーごとの最高記録のみ
 ):
-    from datetime import datetime, timedelta
+    # 通常のランキングはメモリ上の上位K件から返す（再読み込みが必要な場合もDBアクセスはイベントループの外で行う）
+    await sync_workers()
+    if not best_per_player:
+        entries, version = await leaderboard_top(date_filter, difficulty, limit)
+        if entries is not None:
+            # 同じ版のランキングはエンコード・圧縮済みの本文を使い回す
+            key = ("rankings", *leaderboard.normalize(date_filter, difficulty), limit)
+            body = response_cache.get(
+                key, version, lambda: [{field: entry.get(field) for field in RANKING_FIELDS} for entry in entries]
+            )
+            return encoded_response(request, body)
     
-    query = db.query(Ranking)
+    # メモリ上にないランキングはSQLで取得する。同じ条件の同時の要求は1回のクエリを共有する
+    date_filter, difficulty = leaderboard.normalize(date_filter, difficulty)
     
-    # 日付フィルタリング
-    if date_filter and date_filter != "all":
-        now = datetime.utcnow()
-        
-        if date_filter == "today":
-            # 今日のランキング
-            start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            query = query.filter(Ranking.created_at >= start_of_day)
-        elif date_filter == "week":
-            # 過去1週間のランキング
-            week_ago = now - timedelta(days=7)
-            query = query.filter(Ranking.created_at >= week_ago)
-        elif date_filter == "month":
-            # 過去1ヶ月のランキング
-            month_ago = now - timedelta(days=30)
-            query = query.filter(Ranking.created_at >= month_ago)
-    
-    rankings = query.order_by(Ranking.wpm.desc()).limit(limit).all()
-    return rankings
-
-@app.post("/api/rankings")
-async def submit_ranking(
-    ranking_data: RankingCreate,
-    db: Session = Depends(get_db)
+    def read_rankings():
+        db = ReadSessionLocal()
+        try:
+            rows = rankings_query(db, date_filter, difficulty, best_per_player).limit(limit).all()
+            return [{field: getattr(row, field) for field in RANKING_FIELDS} for row in rows]
+        finally:
+            db.close()
+    
+    key = ("/api/rankings", date_filter, difficulty, limit, best_per_player, leaderboard.version)
+    return await rankings_flight.do(key, lambda: run_db(read_rankings), ttl=RANKINGS_QUERY_TTL)
+
+@app.get("/api/rankings/stream", dependencies=[Depends(rate_limit("live_connect"))])
+async def stream_rankings_live(
+    request: Request,
+    date_filter: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=LEADERBOARD_SIZE)
 ):
-    print("=== ランキング送信受信 ===")
-    print(f"受信データ: {ranking_data}")
+    """
+    ランキングの差分を Server-Sent Events で配信する
+    接続直後に現在の上位 limit 件（snapshot）を送り、その後は送信のたびに diff を送る
+    """
+    key = leaderboard.normalize(date_filter, difficulty)
+    # 同時に購読できる数（全体・クライアントIPごと）の上限を超えた接続は断る
+    subscriber = live_hub.subscribe(key, client_ip(request))
+    if subscriber is None:
+        raise HTTPException(
+            status_code=503,
+            detail="ランキング配信の接続数が上限に達しています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "5"},
+        )
     
-    try:
+    async def snapshot():
+        entries, _ = await leaderboard_top(*key, limit)
+        if entries is None:
+            # メモリ上にないランキングはクライアントにREST APIで取得させる
+            return encode_event("reset", {})
+        return encode_event("snapshot", {"date_filter": key[0], "difficulty": key[1], "entries": entries})
+    
+    return StreamingResponse(
+        live_hub.stream(subscriber, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # ストリームが始まる前に切断された場合も購読をやめる
+        background=BackgroundTask(live_hub.unsubscribe, subscriber)
+    )
+
+@app.get("/api/rankings/percentile")
+async def get_percentile(wpm: float, difficulty: Optional[str] = None, date_filter: Optional[str] = None):
+    """指定したWPMが何%の記録より速いかを返す（error は推定誤差の上限、単位は%）"""
+    result = percentile_sketch.percentile(wpm, difficulty, date_filter)
+    return {"wpm": wpm, "difficulty": difficulty, "date_filter": date_filter, **result}
+
+@app.get("/api/rankings/personal/{nickname}", response_model=PersonalStats)
+async def get_personal_rankings(nickname: str, limit: int = Query(10, ge=1, le=100)):
+    """プレイヤーの集計と最近・ベストの記録を返す（全履歴は走査しない）"""
+    def read_summary():
+        db = ReadSessionLocal()
+        try:
+            return player_stats.personal_summary(db, nickname, limit)
+        finally:
+            db.close()
+    
+    return await run_db(read_summary)
+
+def check_ranking(ranking_data):
+    """入力文字数・経過時間・ミス数と矛盾する記録なら判定理由を返す"""
+    reason = plausibility.check_submission(
+        ranking_data.wpm, ranking_data.accuracy, ranking_data.errors,
+        ranking_data.timeElapsed, ranking_data.charactersTyped
+    )
+    if reason is not None:
+        metrics.increment("rankings_rejected_total")
+        logger.warning("不自然な記録を拒否: %s %s", reason, ranking_data)
+    return reason
+
+def insert_rankings(db, items):
+    """
+    items を登録し、("created" か "duplicate", ランキングの辞書) のリストを返す（書き込みキューのトランザクション内で実行する）
+    冪等キーが登録済みのもの（同じ送信内で重複したものを含む）は登録せずに既存の行を返す
+    """
+    keys = [item.idempotency_key for item in items if item.idempotency_key]
+    existing = {}
+    if keys:
+        rows = db.execute(select(Ranking.__table__).where(Ranking.idempotency_key.in_(keys))).mappings()
+        existing = {row["idempotency_key"]: dict(row) for row in rows}
+    
+    results = []
+    created_at = datetime.utcnow()
+    for item in items:
+        if item.idempotency_key in existing:
+            results.append(("duplicate", existing[item.idempotency_key]))
+            continue
         ranking = Ranking(
-            nickname=ranking_data.nickname,
-            wpm=ranking_data.wpm,
-            accuracy=ranking_data.accuracy,
-            errors=ranking_data.errors,
-            time_elapsed=ranking_data.timeElapsed,
-            characters_typed=ranking_data.charactersTyped,
-            difficulty=ranking_data.difficulty,
-            text_content_id=ranking_data.text_content_id,
-            created_at=datetime.utcnow()
+            nickname=item.nickname,
+            wpm=item.wpm,
+            accuracy=item.accuracy,
+            errors=item.errors,
+            time_elapsed=item.timeElapsed,
+            characters_typed=item.charactersTyped,
+            difficulty=item.difficulty,
+            text_content_id=item.text_content_id,
+            idempotency_key=item.idempotency_key,
+            created_at=created_at
         )
-        
-        print(f"作成されたランキングオブジェクト: {ranking}")
-        
         db.add(ranking)
-        db.commit()
-        db.refresh(ranking)
-        
-        print(f"ランキング保存成功: ID={ranking.id}")
-        print("=== ランキング送信完了 ===")
-        
-        return ranking
-    except Exception as e:
-        print(f"ランキング保存エラー: {e}")
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"ランキング保存に失敗しました: {str(e)}")
+        db.flush()
+        # プレイヤーごとの集計も同じトランザクションで更新する
+        player_stats.record_ranking(db, ranking)
+        ranking = ranking_to_dict(ranking)
+        if item.idempotency_key:
+            existing[item.idempotency_key] = ranking
+        results.append(("created", ranking))
+    return results
 
-# 管理者関連エンドポイント
-@app.get("/api/admin/texts")
-async def get_all_texts(password: str = None):
-    import json
-    import os
+def ranking_result(status, ranking):
+    """登録結果のレスポンス。新しい記録は上位K件・WPM分布・差分配信に反映する"""
+    # 送信前の記録の中で何%より速いか（ヒストグラムから推定）
+    percentile = percentile_sketch.percentile(ranking["wpm"], ranking["difficulty"])["percentile"]
+    if status == "created":
+        percentile_sketch.add(ranking)
+        # 上位K件と差分配信には公開する項目だけを渡す（冪等キーは送信したクライアントにだけ返す）
+        entry = dict_to_entry(ranking)
+        changes = leaderboard.add(entry)
+        mark_ranking_applied(ranking["id"])
+        # 購読中のクライアントへ差分を配信する
+        live_hub.publish_changes(entry, changes)
+    return {**ranking, "percentile": percentile}
+
+@app.post("/api/rankings", dependencies=[Depends(rate_limit("ranking_submit"))])
+async def submit_ranking(ranking_data: RankingCreate):
+    if sampled_debug():
+        logger.debug("ランキング送信受信: %s", ranking_data)
     
-    print(f"管理者テキスト取得リクエスト: password='{password}'")
-    if not password or not verify_admin_password(password):
-        print("認証失敗")
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
+    # 登録済みのキーの再送は書き込まずに前回の結果を返す
+    key = ranking_data.idempotency_key
+    cached = recent_keys.get(key) if key else None
+    if cached is not None:
+        return {**cached, "duplicate": True}
+    
+    reason = check_ranking(ranking_data)
+    if reason is not None:
+        raise HTTPException(
+            status_code=422,
+            detail=f"記録の値が不自然なため登録できません（{plausibility.FLAG_LABELS[reason]}）"
+        )
     
     try:
-        # テキストファイルのパス
-        texts_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'texts.json')
-        
-        if not os.path.exists(texts_file):
-            return []
-        
-        # ファイルからテキストを読み込み
-        with open(texts_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            texts = data.get('texts', [])
-            
-        print(f"テキスト取得成功: {len(texts)}件")
-        return texts
-        
+        # 同時に届いた送信と1トランザクションにまとめてコミットする
+        [(status, ranking)] = await write_batcher.submit(lambda db: insert_rankings(db, [ranking_data]))
     except Exception as e:
-        print(f"テキスト読み込みエラー: {e}")
+        logger.error("ランキング保存エラー: %s", e)
+        raise HTTPException(status_code=500, detail=f"ランキング保存に失敗しました: {str(e)}")
+    
+    result = ranking_result(status, ranking)
+    if key:
+        recent_keys.put(key, result)
+    if status == "created":
+        notify_workers("rankings")
+        if sampled_debug():
+            logger.debug("ランキング保存成功: ID=%s", ranking['id'])
+        return result
+    return {**result, "duplicate": True}
+
+@app.post("/api/rankings/batch", dependencies=[Depends(rate_limit("ranking_submit"))])
+async def submit_rankings_batch(batch: RankingBatch):
+    """
+    複数の結果をまとめて登録する（新しい記録は1トランザクションで書き込む）
+    結果ごとに created（登録）・duplicate（登録済みのキー）・rejected（不自然な記録）を返す
+    """
+    results = [None] * len(batch.results)
+    pending = []
+    for index, item in enumerate(batch.results):
+        cached = recent_keys.get(item.idempotency_key)
+        if cached is not None:
+            results[index] = {"idempotency_key": item.idempotency_key, "status": "duplicate", "ranking": cached}
+            continue
+        reason = check_ranking(item)
+        if reason is not None:
+            results[index] = {
+                "idempotency_key": item.idempotency_key,
+                "status": "rejected",
+                "detail": plausibility.FLAG_LABELS[reason],
+            }
+            continue
+        pending.append((index, item))
+    
+    if pending:
+        items = [item for _, item in pending]
+        try:
+            written = await write_batcher.submit(lambda db: insert_rankings(db, items))
+        except Exception as e:
+            logger.error("ランキング一括保存エラー: %s", e)
+            raise HTTPException(status_code=500, detail=f"ランキング保存に失敗しました: {str(e)}")
+        
+        for (index, item), (status, ranking) in zip(pending, written):
+            result = ranking_result(status, ranking)
+            recent_keys.put(item.idempotency_key, result)
+            results[index] = {"idempotency_key": item.idempotency_key, "status": status, "ranking": result}
+        if any(status == "created" for status, _ in written):
+            notify_workers("rankings")
+    
+    return {"results": results}
+
+# 管理者関連エンドポイント
+@app.post("/api/admin/login", response_model=AdminToken, dependencies=[Depends(rate_limit("admin_login"))])
+async def admin_login(login: AdminLogin):
+    """パスワードを一度だけ bcrypt で検証し、管理者APIで使うトークンを発行する"""
+    if not await admin_auth.check_password(login.password):
+        logger.warning("管理者ログイン失敗")
+        raise HTTPException(status_code=401, detail="管理者パスワードが正しくありません")
+    token, expires_in = admin_auth.create_token()
+    return {"access_token": token, "token_type": "bearer", "expires_in": expires_in}
+
+@app.get("/api/admin/texts", dependencies=[Depends(require_admin)])
+async def get_all_texts():
+    texts = text_catalog.get_all()
+    
+    # テキストが登録されていない場合は空のリストを返す
+    if not text_catalog.from_store:
         return []
+    
+    logger.debug("テキスト取得成功: %d件", len(texts))
+    return texts
 
-@app.post("/api/admin/texts")
+@app.get("/api/admin/texts/search", dependencies=[Depends(require_admin)])
+async def search_texts(
+    q: Optional[str] = Query(None, max_length=200),
+    difficulty: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=TEXT_SEARCH_MAX_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    """タイトル・本文の全文検索（一致箇所の強調付き）。q を省略した場合は絞り込みのみ"""
+    return await run_db(text_search.search_texts, db, q, difficulty, is_active, offset, limit)
+
+@app.post("/api/admin/texts", dependencies=[Depends(require_admin)])
 async def create_text_content(
     text_data: TextContentCreate,
-    password: str = None
+    db: Session = Depends(get_db)
 ):
-    import json
-    import os
+    try:
+        new_text = await run_db(text_store.create_text, db, text_data.dict())
+    except Exception as e:
+        logger.error("テキスト保存エラー: %s", e)
+        await run_db(db.rollback)
+        raise HTTPException(status_code=500, detail="テキストの保存に失敗しました")
+    
+    await run_db(text_catalog.apply, new_text)
+    notify_workers("texts")
+    return new_text
+
+@app.post("/api/admin/texts/bulk", dependencies=[Depends(require_admin)])
+async def bulk_import_texts(request: Request):
+    """JSON（配列または {"texts": [...]}) または CSV のテキストをまとめて追加する"""
+    body = await request.body()
+    try:
+        if "csv" in request.headers.get("content-type", ""):
+            # CSVの空欄は未指定として扱う
+            records = [
+                {key: value for key, value in record.items() if value != ""}
+                for record in csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+            ]
+        else:
+            data = json.loads(body)
+            records = data.get("texts") if isinstance(data, dict) else data
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"読み込めないデータです: {e}")
     
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="テキストの配列を指定してください")
+    if len(records) > BULK_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"一度に追加できるのは{BULK_IMPORT_MAX_ROWS}件までです")
+    
+    # 全件を検証し、1件でもエラーがあれば何も書き込まない
+    rows = []
+    errors = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({"index": index, "errors": [{"msg": "オブジェクトではありません"}]})
+            continue
+        try:
+            rows.append(TextContentCreate(**record).dict())
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False)})
+    if errors:
+        raise HTTPException(status_code=422, detail={"message": "検証エラーがあります", "errors": errors[:100]})
+    
+    def import_rows():
+        db = SessionLocal()
+        try:
+            return text_store.bulk_create_texts(db, rows)
+        finally:
+            db.close()
     
     try:
-        # テキストファイルのパス
-        texts_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'texts.json')
-        
-        # 既存のテキストを読み込み
-        texts = []
-        if os.path.exists(texts_file):
-            with open(texts_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                texts = data.get('texts', [])
-        
-        # 新しいIDを生成
-        new_id = max([t.get('id', 0) for t in texts], default=0) + 1
-        
-        # 新しいテキストを追加
-        new_text = {
-            "id": new_id,
-            "title": text_data.title,
-            "content": text_data.content,
-            "difficulty": text_data.difficulty,
-            "is_active": text_data.is_active
-        }
-        texts.append(new_text)
-        
-        # ファイルに保存
-        with open(texts_file, 'w', encoding='utf-8') as f:
-            json.dump({"texts": texts}, f, ensure_ascii=False, indent=2)
-        
-        return new_text
-        
+        ids = await run_db(import_rows) if rows else []
     except Exception as e:
-        print(f"テキスト保存エラー: {e}")
-        raise HTTPException(status_code=500, detail="テキストの保存に失敗しました")
+        logger.error("テキスト一括追加エラー: %s", e)
+        raise HTTPException(status_code=500, detail="テキストの一括追加に失敗しました")
+    
+    await run_db(text_catalog.refresh)
+    notify_workers("texts")
+    return {"message": f"{len(ids)}件のテキストを追加しました", "created": len(ids), "ids": ids}
 
-@app.put("/api/admin/texts/{text_id}")
+@app.put("/api/admin/texts/{text_id}", dependencies=[Depends(require_admin)])
 async def update_text_content(
     text_id: int,
     text_data: TextContentUpdate,
-    password: str = None
+    db: Session = Depends(get_db)
 ):
-    import json
-    import os
-    
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
-    
     try:
-        # テキストファイルのパス
-        texts_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'texts.json')
-        
-        if not os.path.exists(texts_file):
-            raise HTTPException(status_code=404, detail="テキストファイルが見つかりません")
-        
-        # 既存のテキストを読み込み
-        with open(texts_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            texts = data.get('texts', [])
-        
-        # 対象のテキストを検索
-        text_index = None
-        for i, text in enumerate(texts):
-            if text.get('id') == text_id:
-                text_index = i
-                break
-        
-        if text_index is None:
-            raise HTTPException(status_code=404, detail="テキストが見つかりません")
-        
-        # テキストを更新
-        update_data = text_data.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            texts[text_index][field] = value
-        
-        # ファイルに保存
-        with open(texts_file, 'w', encoding='utf-8') as f:
-            json.dump({"texts": texts}, f, ensure_ascii=False, indent=2)
-        
-        return texts[text_index]
-        
-    except HTTPException:
-        raise
+        updated_text = await run_db(text_store.update_text, db, text_id, text_data.dict(exclude_unset=True))
     except Exception as e:
-        print(f"テキスト更新エラー: {e}")
+        logger.error("テキスト更新エラー: %s", e)
+        await run_db(db.rollback)
         raise HTTPException(status_code=500, detail="テキストの更新に失敗しました")
+    
+    if updated_text is None:
+        raise HTTPException(status_code=404, detail="テキストが見つかりません")
+    
+    await run_db(text_catalog.apply, updated_text)
+    notify_workers("texts")
+    return updated_text
 
-@app.delete("/api/admin/texts/{text_id}")
+@app.delete("/api/admin/texts/{text_id}", dependencies=[Depends(require_admin)])
 async def delete_text_content(
     text_id: int,
-    password: str = None
+    db: Session = Depends(get_db)
 ):
-    import json
-    import os
-    
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
-    
     try:
-        # テキストファイルのパス
-        texts_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'texts.json')
-        
-        if not os.path.exists(texts_file):
-            raise HTTPException(status_code=404, detail="テキストファイルが見つかりません")
-        
-        # 既存のテキストを読み込み
-        with open(texts_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            texts = data.get('texts', [])
-        
-        # 対象のテキストを検索して削除
-        original_length = len(texts)
-        texts = [text for text in texts if text.get('id') != text_id]
-        
-        if len(texts) == original_length:
-            raise HTTPException(status_code=404, detail="テキストが見つかりません")
-        
-        # ファイルに保存
-        with open(texts_file, 'w', encoding='utf-8') as f:
-            json.dump({"texts": texts}, f, ensure_ascii=False, indent=2)
-        
-        return {"message": "テキストが削除されました"}
-        
-    except HTTPException:
-        raise
+        deleted = await run_db(text_store.delete_text, db, text_id)
     except Exception as e:
-        print(f"テキスト削除エラー: {e}")
+        logger.error("テキスト削除エラー: %s", e)
+        await run_db(db.rollback)
         raise HTTPException(status_code=500, detail="テキストの削除に失敗しました")
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="テキストが見つかりません")
+    
+    await run_db(text_catalog.remove, text_id)
+    notify_workers("texts")
+    return {"message": "テキストが削除されました"}
 
 # ランキング管理エンドポイント
-@app.get("/api/admin/rankings")
-async def get_all_rankings(password: str = None):
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
+@app.get("/api/admin/rankings", dependencies=[Depends(require_admin)])
+async def get_all_rankings(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=ADMIN_PAGE_MAX_SIZE),
+    difficulty: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    nickname: Optional[str] = None,
+    flagged: Optional[bool] = None
+):
+    conditions = filter_conditions(difficulty, date_from, date_to, nickname, flagged=flagged)
+    
+    def load_page():
+        db = ReadSessionLocal()
+        try:
+            return admin_rankings_page(db, conditions, cursor, limit)
+        finally:
+            db.close()
     
     try:
-        db = next(get_db())
-        rankings = db.query(Ranking).order_by(Ranking.created_at.desc()).all()
-        db.close()
-        return rankings
+        items, next_cursor = await run_db(load_page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"ランキング取得エラー: {e}")
+        logger.error("ランキング取得エラー: %s", e)
         raise HTTPException(status_code=500, detail="ランキングの取得に失敗しました")
+    
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/api/admin/rankings/export", dependencies=[Depends(require_admin)])
+async def export_rankings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    difficulty: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    nickname: Optional[str] = None,
+    flagged: Optional[bool] = None
+):
+    conditions = filter_conditions(difficulty, date_from, date_to, nickname, flagged=flagged)
+    columns = [column.name for column in Ranking.__table__.columns]
+    
+    def generate():
+        # 同期ジェネレータはスレッドプールで1チャンクずつ実行されるため、全件をメモリに載せない
+        db = ReadSessionLocal()
+        try:
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+            for partition in stream_rankings(db, conditions):
+                if format == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for row in partition:
+                        writer.writerow([row[column] for column in columns])
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(json.dumps(dict(row), ensure_ascii=False, default=str) + "\n" for row in partition)
+        finally:
+            db.close()
+    
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"rankings.{format}"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-@app.delete("/api/admin/rankings/{ranking_id}")
-async def delete_ranking(ranking_id: int, password: str = None):
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
+@app.post("/api/admin/rankings/bulk-delete", dependencies=[Depends(require_admin)])
+async def bulk_delete_rankings(ranking_filter: RankingFilter):
+    """条件に合うランキングを1つのDELETE文で削除する"""
+    conditions = filter_conditions(**ranking_filter.dict())
+    if not conditions:
+        raise HTTPException(status_code=400, detail="条件を1つ以上指定してください（全件削除はリセットを使用してください）")
+    
+    def remove_matching():
+        db = SessionLocal()
+        try:
+            nicknames = db.scalars(select(Ranking.nickname).where(*conditions).distinct()).all()
+            result = db.execute(delete(Ranking).where(*conditions))
+            player_stats.rebuild_player_stats(db, nicknames)
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
     
     try:
-        db = next(get_db())
-        ranking = db.query(Ranking).filter(Ranking.id == ranking_id).first()
-        
-        if not ranking:
+        deleted_count = await run_db(remove_matching)
+    except Exception as e:
+        logger.error("ランキング一括削除エラー: %s", e)
+        raise HTTPException(status_code=500, detail="ランキングの一括削除に失敗しました")
+    
+    await run_db(leaderboard.load)
+    await run_db(percentile_sketch.load)
+    recent_keys.clear()
+    live_hub.publish_reset()
+    notify_workers("rankings_reset")
+    return {"message": f"{deleted_count}件のランキングを削除しました", "deleted": deleted_count}
+
+@app.post("/api/admin/rankings/bulk-update", dependencies=[Depends(require_admin)])
+async def bulk_update_rankings(bulk_update: RankingBulkUpdate):
+    """条件に合うランキングを1つのUPDATE文で更新する"""
+    conditions = filter_conditions(**bulk_update.filter.dict())
+    values = bulk_update.values.dict(exclude_none=True)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="条件を1つ以上指定してください")
+    if not values:
+        raise HTTPException(status_code=400, detail="更新する値を指定してください")
+    
+    def update_matching():
+        db = SessionLocal()
+        try:
+            nicknames = db.scalars(select(Ranking.nickname).where(*conditions).distinct()).all()
+            result = db.execute(update(Ranking).where(*conditions).values(**values))
+            if "nickname" in values:
+                nicknames.append(values["nickname"])
+            player_stats.rebuild_player_stats(db, nicknames)
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+    
+    try:
+        updated_count = await run_db(update_matching)
+    except Exception as e:
+        logger.error("ランキング一括更新エラー: %s", e)
+        raise HTTPException(status_code=500, detail="ランキングの一括更新に失敗しました")
+    
+    await run_db(leaderboard.load)
+    await run_db(percentile_sketch.load)
+    recent_keys.clear()
+    live_hub.publish_reset()
+    notify_workers("rankings_reset")
+    return {"message": f"{updated_count}件のランキングを更新しました", "updated": updated_count}
+
+@app.post("/api/admin/rankings/plausibility", dependencies=[Depends(require_admin)])
+async def rescore_rankings(dry_run: bool = False):
+    """全ての記録の妥当性をまとめて判定し、不自然な記録にフラグを付ける（ランキングから除外する）"""
+    try:
+        summary = await run_db(plausibility.rescore, engine, dry_run, read_engine)
+    except Exception as e:
+        logger.error("記録の妥当性チェックエラー: %s", e)
+        raise HTTPException(status_code=500, detail="記録の妥当性チェックに失敗しました")
+    
+    if summary["changed"] and not dry_run:
+        await run_db(leaderboard.load)
+        await run_db(percentile_sketch.load)
+        recent_keys.clear()
+        live_hub.publish_reset()
+        notify_workers("rankings_reset")
+    return summary
+
+@app.delete("/api/admin/rankings/{ranking_id}", dependencies=[Depends(require_admin)])
+async def delete_ranking(ranking_id: int):
+    def remove_ranking():
+        db = SessionLocal()
+        try:
+            nickname = db.scalar(select(Ranking.nickname).where(Ranking.id == ranking_id))
+            if nickname is None:
+                return 0
+            deleted_count = db.query(Ranking).filter(Ranking.id == ranking_id).delete()
+            player_stats.rebuild_player_stats(db, [nickname])
+            db.commit()
+            return deleted_count
+        finally:
             db.close()
+    
+    try:
+        if not await run_db(remove_ranking):
             raise HTTPException(status_code=404, detail="ランキングが見つかりません")
-        
-        db.delete(ranking)
-        db.commit()
-        db.close()
+        leaderboard.remove(ranking_id)
+        await run_db(percentile_sketch.load)
+        recent_keys.clear()
+        live_hub.publish_reset()
+        notify_workers("rankings_reset")
         
         return {"message": "ランキングが削除されました"}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"ランキング削除エラー: {e}")
+        logger.error("ランキング削除エラー: %s", e)
         raise HTTPException(status_code=500, detail="ランキングの削除に失敗しました")
 
-@app.delete("/api/admin/rankings")
-async def reset_all_rankings(password: str = None):
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
+@app.delete("/api/admin/rankings", dependencies=[Depends(require_admin)])
+async def reset_all_rankings():
+    def remove_all_rankings():
+        db = SessionLocal()
+        try:
+            deleted_count = db.query(Ranking).delete()
+            db.query(PlayerStats).delete()
+            db.commit()
+            return deleted_count
+        finally:
+            db.close()
     
     try:
-        db = next(get_db())
-        deleted_count = db.query(Ranking).delete()
-        db.commit()
-        db.close()
+        deleted_count = await run_db(remove_all_rankings)
+        leaderboard.clear()
+        await run_db(percentile_sketch.load)
+        recent_keys.clear()
+        live_hub.publish_reset()
+        notify_workers("rankings_reset")
         
         return {"message": f"{deleted_count}件のランキングがリセットされました"}
     except Exception as e:
-        print(f"ランキングリセットエラー: {e}")
+        logger.error("ランキングリセットエラー: %s", e)
         raise HTTPException(status_code=500, detail="ランキングのリセットに失敗しました")
 
-@app.put("/api/admin/rankings/{ranking_id}")
+@app.put("/api/admin/rankings/{ranking_id}", dependencies=[Depends(require_admin)])
 async def update_ranking(
     ranking_id: int, 
-    ranking_data: dict,
-    password: str = None
+    ranking_data: dict
 ):
-    if not password or not verify_admin_password(password):
-        raise HTTPException(status_code=403, detail="管理者パスワードが正しくありません")
+    if ranking_data.get('flag') not in (None, FLAG_APPROVED, *plausibility.FLAG_LABELS):
+        raise HTTPException(status_code=400, detail=f"不正なフラグです: {ranking_data['flag']}")
+    
+    def edit_ranking():
+        db = SessionLocal()
+        try:
+            ranking = db.query(Ranking).filter(Ranking.id == ranking_id).first()
+            
+            if not ranking:
+                return None
+            previous_nickname = ranking.nickname
+            
+            # 更新可能なフィールドを更新
+            if 'nickname' in ranking_data:
+                ranking.nickname = ranking_data['nickname']
+            if 'wpm' in ranking_data:
+                ranking.wpm = ranking_data['wpm']
+            if 'accuracy' in ranking_data:
+                ranking.accuracy = ranking_data['accuracy']
+            if 'errors' in ranking_data:
+                ranking.errors = ranking_data['errors']
+            if 'time_elapsed' in ranking_data:
+                ranking.time_elapsed = ranking_data['time_elapsed']
+            if 'characters_typed' in ranking_data:
+                ranking.characters_typed = ranking_data['characters_typed']
+            if 'difficulty' in ranking_data:
+                ranking.difficulty = ranking_data['difficulty']
+            if 'flag' in ranking_data:
+                # 確認済み（approved）にするか、フラグを外す
+                ranking.flag = ranking_data['flag']
+            
+            db.flush()
+            player_stats.rebuild_player_stats(db, [previous_nickname, ranking.nickname])
+            db.commit()
+            db.refresh(ranking)
+            return ranking
+        finally:
+            db.close()
     
     try:
-        db = next(get_db())
-        ranking = db.query(Ranking).filter(Ranking.id == ranking_id).first()
-        
+        ranking = await run_db(edit_ranking)
         if not ranking:
-            db.close()
             raise HTTPException(status_code=404, detail="ランキングが見つかりません")
-        
-        # 更新可能なフィールドを更新
-        if 'nickname' in ranking_data:
-            ranking.nickname = ranking_data['nickname']
-        if 'wpm' in ranking_data:
-            ranking.wpm = ranking_data['wpm']
-        if 'accuracy' in ranking_data:
-            ranking.accuracy = ranking_data['accuracy']
-        if 'errors' in ranking_data:
-            ranking.errors = ranking_data['errors']
-        if 'time_elapsed' in ranking_data:
-            ranking.time_elapsed = ranking_data['time_elapsed']
-        if 'characters_typed' in ranking_data:
-            ranking.characters_typed = ranking_data['characters_typed']
-        if 'difficulty' in ranking_data:
-            ranking.difficulty = ranking_data['difficulty']
-        
-        db.commit()
-        db.refresh(ranking)
-        db.close()
+        if is_visible(ranking.flag):
+            leaderboard.replace(ranking_to_entry(ranking))
+        else:
+            leaderboard.remove(ranking.id)
+        await run_db(percentile_sketch.load)
+        recent_keys.clear()
+        live_hub.publish_reset()
+        notify_workers("rankings_reset")
         
         return ranking
     except HTTPException:
         raise
     except Exception as e:
-        print(f"ランキング更新エラー: {e}")
+        logger.error("ランキング更新エラー: %s", e)
         raise HTTPException(status_code=500, detail="ランキングの更新に失敗しました")
 
 if __name__ == "__main__":
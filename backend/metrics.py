@@ -0,0 +1,208 @@
+"""
+メトリクスの収集と Prometheus テキスト形式での出力
+エンドポイントごとのリクエスト数・レイテンシ・処理中の件数、DBクエリ時間、キャッシュのヒット率を集計します
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+# レイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """固定境界のヒストグラム（分位点はバケット内の線形補間で推定する）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for index, count in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+            if count and cumulative + count >= target:
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.in_flight = {}
+        self.db_queries = Histogram()
+        self.cache = {}
+        self.counters = {}
+
+    def request_started(self, route):
+        with self._lock:
+            self.in_flight[route] = self.in_flight.get(route, 0) + 1
+
+    def request_finished(self, route, method, status, elapsed):
+        with self._lock:
+            self.in_flight[route] -= 1
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get(route)
+            if histogram is None:
+                histogram = self.latency[route] = Histogram()
+            histogram.observe(elapsed)
+
+    def db_query(self, elapsed):
+        with self._lock:
+            self.db_queries.observe(elapsed)
+
+    def cache_hit(self, name):
+        with self._lock:
+            hits, misses = self.cache.get(name, (0, 0))
+            self.cache[name] = (hits + 1, misses)
+
+    def cache_miss(self, name):
+        with self._lock:
+            hits, misses = self.cache.get(name, (0, 0))
+            self.cache[name] = (hits, misses + 1)
+
+    def increment(self, name, value=1):
+        """任意のカウンタを加算する"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def render(self):
+        """Prometheus のテキスト形式で出力する"""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE renu_http_requests_total counter")
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'renu_http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+            lines.append("# TYPE renu_http_requests_in_flight gauge")
+            for route, count in sorted(self.in_flight.items()):
+                lines.append(f'renu_http_requests_in_flight{{route="{route}"}} {count}')
+
+            lines.append("# TYPE renu_http_request_duration_seconds histogram")
+            for route, histogram in sorted(self.latency.items()):
+                lines.extend(_histogram_lines("renu_http_request_duration_seconds", f'route="{route}"', histogram))
+
+            lines.append("# TYPE renu_http_request_duration_quantile_seconds gauge")
+            for route, histogram in sorted(self.latency.items()):
+                for q in QUANTILES:
+                    lines.append(f'renu_http_request_duration_quantile_seconds{{route="{route}",quantile="{q}"}} '
+                                 f'{histogram.quantile(q):.6f}')
+
+            lines.append("# TYPE renu_db_query_duration_seconds histogram")
+            lines.extend(_histogram_lines("renu_db_query_duration_seconds", "", self.db_queries))
+
+            lines.append("# TYPE renu_cache_requests_total counter")
+            lines.append("# TYPE renu_cache_hit_ratio gauge")
+            for name, (hits, misses) in sorted(self.cache.items()):
+                lines.append(f'renu_cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+                lines.append(f'renu_cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+                total = hits + misses
+                lines.append(f'renu_cache_hit_ratio{{cache="{name}"}} {hits / total if total else 0:.4f}')
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE renu_{name} counter")
+                lines.append(f"renu_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name, labels, histogram):
+    prefix = labels + "," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    suffix = "{" + labels + "}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """ASGIミドルウェア: ルート（パスのテンプレート）単位でリクエストを計測する"""
+
+    # パス → ルートの対応を覚えておく件数の上限
+    ROUTE_CACHE_SIZE = 1024
+
+    def __init__(self, app):
+        self.app = app
+        self._route_cache = {}
+
+    def _resolve_route(self, scope):
+        path = scope["path"]
+        route_path = self._route_cache.get(path)
+        if route_path is not None:
+            return route_path
+        route_path = "<unmatched>"
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                route_path = route.path
+                break
+            if match == Match.PARTIAL and route_path == "<unmatched>":
+                route_path = route.path
+        if len(self._route_cache) >= self.ROUTE_CACHE_SIZE:
+            self._route_cache.clear()
+        self._route_cache[path] = route_path
+        return route_path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._resolve_route(scope)
+        status = 500
+        started = time.perf_counter()
+        metrics.request_started(route)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.request_finished(route, scope["method"], status, time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    """SQLAlchemy エンジンのクエリ時間を計測する"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.db_query(time.perf_counter() - conn.info["query_start"].pop())
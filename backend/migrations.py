@@ -0,0 +1,223 @@
+"""
+バージョン管理されたスキーマのマイグレーション
+schema_version テーブルに適用済みのバージョンを記録し、未適用のものだけを番号順に1つずつ（それぞれ1トランザクションで）適用します
+各マイグレーションは途中まで適用された既存のDBでも安全に実行できるように、存在を確認してから変更します
+適用する内容はモデルから生成せず、書いた時点のDDLで固定します（同じバージョンはどの環境でも同じスキーマになる）
+新しいカラムやインデックスは、モデルに追加したうえで MIGRATIONS の末尾に追加してください
+"""
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import OperationalError
+
+from log import logger
+
+# 適用済みのマイグレーションの記録（モデルの Base とは別に管理する）
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def add_column(conn, table_name, column_name, ddl_type):
+    """カラムがなければ追加する"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name not in existing:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl_type}"))
+
+
+def create_index(conn, name, table_name, *columns, unique=False):
+    """インデックスがなければ作成する"""
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table_name} ({', '.join(columns)})"
+    ))
+
+
+def create_table(conn, table_name, ddl):
+    """テーブルがなければ作成する（ddl はカラムと制約の定義）"""
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table_name} ({ddl})"))
+
+
+def _initial_tables(conn):
+    # マイグレーション導入前のアプリ（create_all）が作成していたテーブル
+    create_table(conn, "admin_settings", (
+        "id INTEGER NOT NULL, "
+        "setting_key VARCHAR(100) NOT NULL, "
+        "setting_value TEXT NOT NULL, "
+        "description VARCHAR(500), "
+        "updated_at DATETIME, "
+        "PRIMARY KEY (id), "
+        "UNIQUE (setting_key)"
+    ))
+    create_index(conn, "ix_admin_settings_id", "admin_settings", "id")
+    create_table(conn, "text_contents", (
+        "id INTEGER NOT NULL, "
+        "title VARCHAR(200) NOT NULL, "
+        "content TEXT NOT NULL, "
+        "difficulty VARCHAR(20) NOT NULL, "
+        "is_active BOOLEAN, "
+        "created_at DATETIME, "
+        "updated_at DATETIME, "
+        "PRIMARY KEY (id)"
+    ))
+    create_index(conn, "ix_text_contents_id", "text_contents", "id")
+    create_table(conn, "game_sessions", (
+        "id INTEGER NOT NULL, "
+        "nickname VARCHAR(50) NOT NULL, "
+        "text_content_id INTEGER NOT NULL, "
+        "difficulty VARCHAR(20) NOT NULL, "
+        "start_time DATETIME, "
+        "end_time DATETIME, "
+        "wpm FLOAT, "
+        "accuracy FLOAT, "
+        "is_completed BOOLEAN, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(text_content_id) REFERENCES text_contents (id)"
+    ))
+    create_index(conn, "ix_game_sessions_id", "game_sessions", "id")
+    create_table(conn, "rankings", (
+        "id INTEGER NOT NULL, "
+        "nickname VARCHAR(50) NOT NULL, "
+        "text_content_id INTEGER, "
+        "wpm FLOAT NOT NULL, "
+        "accuracy FLOAT NOT NULL, "
+        "errors INTEGER, "
+        "time_elapsed FLOAT, "
+        "characters_typed INTEGER, "
+        "difficulty VARCHAR(20) NOT NULL, "
+        "created_at DATETIME, "
+        "PRIMARY KEY (id), "
+        "FOREIGN KEY(text_content_id) REFERENCES text_contents (id)"
+    ))
+    create_index(conn, "ix_rankings_id", "rankings", "id")
+
+
+def _ranking_indexes(conn):
+    # ランキング取得（期間・難易度・ベスト記録）用
+    create_index(conn, "ix_rankings_wpm", "rankings", "wpm")
+    create_index(conn, "ix_rankings_created_at", "rankings", "created_at")
+    create_index(conn, "ix_rankings_created_at_wpm", "rankings", "created_at", "wpm")
+    create_index(conn, "ix_rankings_difficulty_wpm", "rankings", "difficulty", "wpm")
+    create_index(conn, "ix_rankings_nickname_wpm", "rankings", "nickname", "wpm")
+
+
+def _text_romaji(conn):
+    add_column(conn, "text_contents", "romaji", "TEXT")
+
+
+def _player_stats(conn):
+    create_table(conn, "player_stats", (
+        "nickname VARCHAR(50) NOT NULL, "
+        "total_sessions INTEGER NOT NULL, "
+        "total_wpm FLOAT NOT NULL, "
+        "total_accuracy FLOAT NOT NULL, "
+        "best_wpm FLOAT NOT NULL, "
+        "total_play_time FLOAT NOT NULL, "
+        "last_played_at DATETIME, "
+        "updated_at DATETIME, "
+        "PRIMARY KEY (nickname)"
+    ))
+    create_index(conn, "ix_rankings_nickname_created_at", "rankings", "nickname", "created_at")
+
+
+def _session_completion(conn):
+    add_column(conn, "game_sessions", "ranking_id", "INTEGER REFERENCES rankings(id)")
+    create_index(conn, "ix_game_sessions_completed_start_time", "game_sessions", "is_completed", "start_time")
+
+
+def _text_search(conn):
+    # テキスト検索用の FTS5 索引（trigram。SQLite 以外や FTS5 のないビルドでは LIKE 検索を使う）
+    if conn.dialect.name != "sqlite":
+        return
+    try:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS text_contents_fts USING fts5("
+            "title, content, content='text_contents', content_rowid='id', tokenize='trigram')"
+        ))
+    except OperationalError as e:
+        logger.warning("FTS5 索引を作成できません（LIKE 検索を使います）: %s", e)
+        return
+    # text_contents への書き込みに合わせて索引を更新する
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS text_contents_fts_insert AFTER INSERT ON text_contents BEGIN "
+        "INSERT INTO text_contents_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS text_contents_fts_delete AFTER DELETE ON text_contents BEGIN "
+        "INSERT INTO text_contents_fts(text_contents_fts, rowid, title, content) "
+        "VALUES ('delete', old.id, old.title, old.content); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS text_contents_fts_update AFTER UPDATE OF title, content ON text_contents BEGIN "
+        "INSERT INTO text_contents_fts(text_contents_fts, rowid, title, content) "
+        "VALUES ('delete', old.id, old.title, old.content); "
+        "INSERT INTO text_contents_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+    ))
+    # 既存のテキストを索引に入れる
+    conn.execute(text("INSERT INTO text_contents_fts(text_contents_fts) VALUES ('rebuild')"))
+
+
+def _ranking_flags(conn):
+    add_column(conn, "rankings", "flag", "VARCHAR(30)")
+
+
+def _ranking_idempotency_key(conn):
+    add_column(conn, "rankings", "idempotency_key", "VARCHAR(64)")
+    create_index(conn, "ux_rankings_idempotency_key", "rankings", "idempotency_key", unique=True)
+
+
+# (バージョン, 名前, 適用する関数)
+MIGRATIONS = [
+    (1, "initial_tables", _initial_tables),
+    (2, "ranking_indexes", _ranking_indexes),
+    (3, "text_romaji", _text_romaji),
+    (4, "player_stats", _player_stats),
+    (5, "session_completion", _session_completion),
+    (6, "text_search", _text_search),
+    (7, "ranking_flags", _ranking_flags),
+    (8, "ranking_idempotency_key", _ranking_idempotency_key),
+]
+
+
+def applied_versions(conn):
+    schema_version.create(bind=conn, checkfirst=True)
+    return set(conn.scalars(select(schema_version.c.version)))
+
+
+def pending_migrations(engine):
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def run_migrations(engine):
+    """未適用のマイグレーションを番号順に適用し、適用したバージョンの一覧を返す（何度実行しても安全）"""
+    applied = []
+    for version, name, migrate in pending_migrations(engine):
+        with engine.begin() as conn:
+            # 他のプロセスが先に適用していないかをトランザクション内で確認する
+            if version in applied_versions(conn):
+                continue
+            logger.info("マイグレーション適用: %d %s", version, name)
+            migrate(conn)
+            conn.execute(schema_version.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    # 使い方: python migrations.py [--status]
+    from database import engine
+
+    if "--status" in sys.argv[1:]:
+        pending = {version for version, _, _ in pending_migrations(engine)}
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:4d} {name:30s} {'未適用' if version in pending else '適用済み'}")
+    else:
+        applied = run_migrations(engine)
+        print(f"{len(applied)}件のマイグレーションを適用しました")
@@ -1,9 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
-Base = declarative_base()
+from database import Base
 
 # Userテーブルは削除し、ニックネームのみで管理
 
@@ -13,6 +12,7 @@ class TextContent(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
+    romaji = Column(Text)
     difficulty = Column(String(20), nullable=False)  # easy, medium, hard
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -34,6 +34,12 @@ class GameSession(Base):
     wpm = Column(Float)
     accuracy = Column(Float)
     is_completed = Column(Boolean, default=False)
+    ranking_id = Column(Integer, ForeignKey("rankings.id"), nullable=True)
+    
+    # 放置セッションの削除用（未完了のまま古くなったものを探す）
+    __table_args__ = (
+        Index("ix_game_sessions_completed_start_time", "is_completed", "start_time"),
+    )
     
     # リレーションシップ
     text_content = relationship("TextContent", back_populates="game_sessions")
@@ -51,10 +57,36 @@ class Ranking(Base):
     characters_typed = Column(Integer, default=0)
     difficulty = Column(String(20), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    flag = Column(String(30))  # 妥当性チェックの判定理由（None は問題なし、approved は管理者が確認済み）
+    idempotency_key = Column(String(64))  # クライアントが結果ごとに生成するキー（再送による二重登録を防ぐ）
+    
+    # ランキング表示・管理画面用のインデックス（期間・難易度・プレイヤーごとのWPM順、作成日時順）
+    __table_args__ = (
+        Index("ix_rankings_wpm", "wpm"),
+        Index("ix_rankings_created_at", "created_at"),
+        Index("ix_rankings_created_at_wpm", "created_at", "wpm"),
+        Index("ix_rankings_difficulty_wpm", "difficulty", "wpm"),
+        Index("ix_rankings_nickname_wpm", "nickname", "wpm"),
+        Index("ix_rankings_nickname_created_at", "nickname", "created_at"),
+        Index("ux_rankings_idempotency_key", "idempotency_key", unique=True),
+    )
     
     # リレーションシップ
     text_content = relationship("TextContent", back_populates="rankings")
 
+class PlayerStats(Base):
+    """プレイヤーごとの集計（ランキング登録時に累計値と最高記録を更新する）"""
+    __tablename__ = "player_stats"
+    
+    nickname = Column(String(50), primary_key=True)
+    total_sessions = Column(Integer, nullable=False, default=0)
+    total_wpm = Column(Float, nullable=False, default=0)
+    total_accuracy = Column(Float, nullable=False, default=0)
+    best_wpm = Column(Float, nullable=False, default=0)
+    total_play_time = Column(Float, nullable=False, default=0)  # 秒
+    last_played_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class AdminSettings(Base):
     __tablename__ = "admin_settings"
     
@@ -0,0 +1,140 @@
+"""
+WPMの順位（上位何%か）の推定
+難易度 × 日ごとの固定幅ヒストグラムを保持し、rankings テーブルを数え直さずに
+「X%のプレイヤーより速い」を返します。起動時にDBから集計し、ランキング送信のたびに加算します
+"""
+
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, cast, func
+
+from database import ReadSessionLocal
+from log import logger
+from models import Ranking
+from ranking_queries import visible_condition, window_start
+
+# ヒストグラムのバケット幅（WPM）と上限（これ以上は最後のバケットにまとめる）
+PERCENTILE_BUCKET_WIDTH = float(os.getenv("PERCENTILE_BUCKET_WIDTH", "1"))
+PERCENTILE_MAX_WPM = float(os.getenv("PERCENTILE_MAX_WPM", "2000"))
+
+# 日ごとのヒストグラムを保持する日数（期間フィルタの最長 "month" = 30日 + 当日）
+RETAINED_DAYS = 31
+
+
+class Histogram:
+    """WPMの固定幅ヒストグラム"""
+
+    def __init__(self, bucket_count):
+        self.counts = [0] * bucket_count
+        self.total = 0
+
+    def add(self, bucket, count=1):
+        self.counts[bucket] += count
+        self.total += count
+
+
+class PercentileSketch:
+    """難易度ごとに、全期間の合計と直近の日ごとのヒストグラムを持つ"""
+
+    def __init__(self, width=PERCENTILE_BUCKET_WIDTH, max_wpm=PERCENTILE_MAX_WPM, session_factory=ReadSessionLocal):
+        self.width = width
+        self.bucket_count = int(max_wpm // width) + 1
+        self.session_factory = session_factory
+        self._lock = threading.RLock()
+        # difficulty -> Histogram（difficulty=None は全難易度）
+        self.totals = {}
+        # (difficulty, 日付) -> Histogram
+        self.days = {}
+
+    def bucket(self, wpm):
+        return min(max(int(wpm // self.width), 0), self.bucket_count - 1)
+
+    def _add(self, difficulty, day, bucket, count=1):
+        for key in (None, difficulty):
+            total = self.totals.get(key)
+            if total is None:
+                total = self.totals[key] = Histogram(self.bucket_count)
+            total.add(bucket, count)
+            daily = self.days.get((key, day))
+            if daily is None:
+                daily = self.days[(key, day)] = Histogram(self.bucket_count)
+            daily.add(bucket, count)
+
+    def _prune(self, today):
+        oldest = today - timedelta(days=RETAINED_DAYS)
+        for key in [key for key in self.days if key[1] < oldest]:
+            del self.days[key]
+
+    def load(self):
+        """DB側で (難易度, 日, バケット) ごとに件数を集計して読み込む（行ごとには読まない）"""
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(
+                    Ranking.difficulty,
+                    func.date(Ranking.created_at),
+                    cast(Ranking.wpm / self.width, Integer),
+                    func.count(Ranking.id),
+                )
+                .filter(visible_condition())
+                .group_by(Ranking.difficulty, func.date(Ranking.created_at), cast(Ranking.wpm / self.width, Integer))
+                .all()
+            )
+        finally:
+            db.close()
+
+        with self._lock:
+            self.totals = {}
+            self.days = {}
+            for difficulty, day, bucket, count in rows:
+                day = date.fromisoformat(str(day)) if day is not None else date.min
+                self._add(difficulty, day, min(max(bucket or 0, 0), self.bucket_count - 1), count)
+            self._prune(datetime.utcnow().date())
+        logger.info("WPM分布読み込み: %d件", self.totals[None].total if None in self.totals else 0)
+
+    def add(self, ranking):
+        """送信されたランキング（辞書）を加える"""
+        with self._lock:
+            self._add(ranking["difficulty"], ranking["created_at"].date(), self.bucket(ranking["wpm"]))
+
+    def _histograms(self, date_filter, difficulty, now):
+        start = window_start(date_filter, now)
+        if start is None:
+            total = self.totals.get(difficulty)
+            return [total] if total else []
+        # 期間の境界は日単位で丸める
+        self._prune(now.date())
+        first_day = start.date()
+        return [
+            histogram for (key, day), histogram in self.days.items()
+            if key == difficulty and day >= first_day
+        ]
+
+    def percentile(self, wpm, difficulty=None, date_filter=None, now=None):
+        """
+        wpm より遅い記録の割合（%）と、推定誤差の上限（%）、対象件数を返す
+        同じバケット内の記録は一様に分布しているとみなして補間するため、誤差はそのバケットの件数の割合以下
+        """
+        now = now or datetime.utcnow()
+        bucket = self.bucket(wpm)
+        fraction = min(max(wpm / self.width - bucket, 0.0), 1.0)
+        below = 0
+        in_bucket = 0
+        total = 0
+        with self._lock:
+            for histogram in self._histograms(date_filter, difficulty, now):
+                below += sum(histogram.counts[:bucket])
+                in_bucket += histogram.counts[bucket]
+                total += histogram.total
+        if total == 0:
+            return {"percentile": None, "error": 0.0, "total": 0}
+        return {
+            "percentile": 100.0 * (below + in_bucket * fraction) / total,
+            "error": 100.0 * in_bucket / total,
+            "total": total,
+        }
+
+
+percentile_sketch = PercentileSketch()
@@ -0,0 +1,267 @@
+"""
+ランキングの記録の妥当性チェック
+- 送信時: 1件の値をフロントエンドと同じ式で検算し、矛盾する記録を登録前に断る（check_submission）
+- 一括: rankings の数値カラムを NumPy の配列に読み込み、同じ規則と難易度・テキストごとの外れ値の判定を
+  ベクトル演算でまとめて行い、結果を flag カラムに書き戻す（rescore。数百万件でも数秒）
+  読み込みと判定は読み込み用の接続で行い、書き込み用の接続は変更した行の短い書き戻しの間だけ使う
+flag が付いた記録はランキング・WPM分布・プレイヤー集計から除外されます（管理者が approved にすると再び表示）
+
+使い方: python plausibility.py [--dry-run]
+"""
+
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+import player_stats
+from log import logger
+from ranking_queries import FLAG_APPROVED
+
+# 人が入力できる上限（1分あたりの文字数）
+MAX_PLAUSIBLE_WPM = float(os.getenv("MAX_PLAUSIBLE_WPM", "1200"))
+# 検算の許容誤差（フロントエンドは小数第2位で丸めて送る）
+WPM_TOLERANCE = 1.0
+WPM_RELATIVE_TOLERANCE = 0.02
+ACCURACY_TOLERANCE = 1.0
+# 外れ値の判定: log(1 + WPM) の中央値から MAD の何倍離れたら外れ値とするか
+OUTLIER_THRESHOLD = float(os.getenv("PLAUSIBILITY_OUTLIER_THRESHOLD", "5"))
+# テキストごとの判定に必要な件数（少ない場合は難易度全体で判定する）
+MIN_GROUP_SIZE = 30
+MIN_LOG_SCALE = 0.05
+# 読み込みの単位
+BATCH_SIZE = 50000
+# 書き戻しの単位（1トランザクションで更新する件数。書き込み用の接続を長く占有しないよう小さくする）
+WRITE_BATCH_SIZE = 500
+# 書き戻しのトランザクションの間隔（秒）。待っているランキング登録に書き込み用の接続を先に渡す
+WRITE_BATCH_PAUSE = 0.005
+
+# 判定理由（flag カラムの値）と表示名。先頭の規則から順に判定する
+FLAG_LABELS = {
+    "invalid_value": "負の値または数値でない値",
+    "accuracy_range": "正確率が0〜100%の範囲外",
+    "wpm_limit": f"WPMが上限（{MAX_PLAUSIBLE_WPM:g}）を超えている",
+    "wpm_mismatch": "WPMが入力文字数と経過時間に合わない",
+    "accuracy_mismatch": "正確率が入力文字数とミス数に合わない",
+    "outlier": "同じ難易度・テキストの記録と比べて極端に速い",
+}
+RULES = ("invalid_value", "accuracy_range", "wpm_limit", "wpm_mismatch", "accuracy_mismatch")
+
+
+def expected_wpm(characters_typed, time_elapsed):
+    """フロントエンドと同じ式（入力文字数 ÷ 経過時間(分)。経過時間0の場合は入力文字数）"""
+    if characters_typed > 0 and time_elapsed > 0:
+        return characters_typed / (time_elapsed / 60)
+    return float(characters_typed)
+
+
+def expected_accuracy(characters_typed, errors):
+    total = characters_typed + errors
+    return characters_typed / total * 100 if total > 0 else 100.0
+
+
+def check_submission(wpm, accuracy, errors, time_elapsed, characters_typed):
+    """送信された1件を検算し、矛盾があれば判定理由（FLAG_LABELS のキー）、なければ None を返す"""
+    values = (wpm, accuracy, errors, time_elapsed, characters_typed)
+    if any(not math.isfinite(value) or value < 0 for value in values):
+        return "invalid_value"
+    if accuracy > 100:
+        return "accuracy_range"
+    if wpm > MAX_PLAUSIBLE_WPM:
+        return "wpm_limit"
+    expected = expected_wpm(characters_typed, time_elapsed)
+    if abs(wpm - expected) > max(WPM_TOLERANCE, expected * WPM_RELATIVE_TOLERANCE):
+        return "wpm_mismatch"
+    if abs(accuracy - expected_accuracy(characters_typed, errors)) > ACCURACY_TOLERANCE:
+        return "accuracy_mismatch"
+    return None
+
+
+def rule_codes(wpm, accuracy, errors, time_elapsed, characters_typed):
+    """
+    check_submission と同じ規則を配列全体に適用する
+    行ごとに 0（問題なし）か、最初に当てはまった規則の RULES での位置 + 1 を返す
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.stack([wpm, accuracy, errors, time_elapsed, characters_typed])
+        invalid = (~np.isfinite(values) | (values < 0)).any(axis=0)
+        timed = (characters_typed > 0) & (time_elapsed > 0)
+        expected = np.where(timed, characters_typed / np.where(timed, time_elapsed, 1.0) * 60, characters_typed)
+        total = characters_typed + errors
+        accuracy_expected = np.where(total > 0, characters_typed / np.where(total > 0, total, 1.0) * 100, 100.0)
+        conditions = [
+            invalid,
+            accuracy > 100,
+            wpm > MAX_PLAUSIBLE_WPM,
+            np.abs(wpm - expected) > np.maximum(WPM_TOLERANCE, expected * WPM_RELATIVE_TOLERANCE),
+            np.abs(accuracy - accuracy_expected) > ACCURACY_TOLERANCE,
+        ]
+    codes = np.zeros(len(wpm), dtype=np.int8)
+    # 後ろの規則から上書きし、最初に当てはまった規則を残す
+    for code in range(len(conditions), 0, -1):
+        codes[conditions[code - 1]] = code
+    return codes
+
+
+def _group_median(sorted_values, starts, sizes):
+    """グループごとに昇順に並んだ配列から各グループの中央値を求める"""
+    low = sorted_values[starts + (sizes - 1) // 2]
+    high = sorted_values[starts + sizes // 2]
+    return (low + high) / 2
+
+
+def robust_scores(values, groups):
+    """
+    グループごとの中央値と MAD（中央絶対偏差）による外れ値スコアと、各行のグループの件数を返す
+    並べ替え2回と添字の計算だけで、グループ数によらず O(n log n)
+    """
+    if len(values) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(values)])
+    group_index = np.repeat(np.arange(len(starts)), sizes)
+
+    medians = _group_median(values[order], starts, sizes)
+    deviations = np.abs(values[order] - medians[group_index])
+    mads = _group_median(deviations[np.lexsort((deviations, group_index))], starts, sizes)
+    scales = np.maximum(mads * 1.4826, MIN_LOG_SCALE)
+
+    scores = np.empty(len(values))
+    scores[order] = (values[order] - medians[group_index]) / scales[group_index]
+    counts = np.empty(len(values), dtype=np.int64)
+    counts[order] = sizes[group_index]
+    return scores, counts
+
+
+def evaluate(columns):
+    """
+    読み込んだ列から各行の判定理由（None は問題なし）の配列を返す
+    外れ値は、規則に当てはまらない記録だけで難易度・テキストごとに判定する（件数が少ないテキストは難易度全体）
+    """
+    codes = rule_codes(
+        columns["wpm"], columns["accuracy"], columns["errors"],
+        columns["time_elapsed"], columns["characters_typed"]
+    )
+    flags = np.array([None] + list(RULES), dtype=object)[codes]
+
+    valid = np.flatnonzero(codes == 0)
+    if len(valid):
+        log_wpm = np.log1p(columns["wpm"][valid])
+        difficulty = columns["difficulty_code"][valid]
+        text_id = columns["text_content_id"][valid]
+        difficulty_scores, _ = robust_scores(log_wpm, difficulty)
+        text_scores, text_counts = robust_scores(log_wpm, difficulty * (int(text_id.max()) + 2) + text_id + 1)
+        use_text = (text_id >= 0) & (text_counts >= MIN_GROUP_SIZE)
+        scores = np.where(use_text, text_scores, difficulty_scores)
+        # 遅すぎる記録は順位に影響しないため、速い側だけを外れ値とする
+        flags[valid[scores > OUTLIER_THRESHOLD]] = "outlier"
+    return flags
+
+
+NUMERIC_COLUMNS = ("id", "wpm", "accuracy", "errors", "time_elapsed", "characters_typed", "text_content_id")
+
+
+def load_columns(conn, batch_size=BATCH_SIZE):
+    """
+    rankings の判定に使う列を NumPy の配列として読み込む
+    SQLAlchemy の Row を作らずに DB-API のタプルを batch_size 件ずつ2次元配列にする（100万件で約4秒）
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, wpm, accuracy, COALESCE(errors, 0), COALESCE(time_elapsed, 0), "
+            "COALESCE(characters_typed, 0), COALESCE(text_content_id, -1), difficulty, flag FROM rankings"
+        )
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=object))
+    finally:
+        cursor.close()
+    table = np.concatenate(chunks) if chunks else np.empty((0, len(NUMERIC_COLUMNS) + 2), dtype=object)
+
+    numeric = table[:, :len(NUMERIC_COLUMNS)].astype(np.float64)
+    columns = {name: numeric[:, index] for index, name in enumerate(NUMERIC_COLUMNS)}
+    columns["id"] = columns["id"].astype(np.int64)
+    columns["text_content_id"] = columns["text_content_id"].astype(np.int64)
+    columns["flag"] = table[:, -1]
+    _, difficulty_code = np.unique(table[:, -2].astype(str), return_inverse=True)
+    columns["difficulty_code"] = difficulty_code.astype(np.int64)
+    return columns
+
+
+def write_flags(conn, ids, flags):
+    """
+    ids の行の flag を書き戻し、対象プレイヤーの集計を作り直す（呼び出し側のトランザクション内で実行する）
+    読み込んだ後に管理者が approved にした記録は変更しない
+    """
+    nicknames = conn.execute(
+        text("SELECT DISTINCT nickname FROM rankings WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    ).scalars().all()
+    conn.execute(
+        text(
+            "UPDATE rankings SET flag = :flag WHERE id = :ranking_id AND (flag IS NULL OR flag != :approved)"
+        ).bindparams(bindparam("flag"), bindparam("ranking_id"), bindparam("approved")),
+        [{"flag": flag, "ranking_id": ranking_id, "approved": FLAG_APPROVED} for ranking_id, flag in zip(ids, flags)]
+    )
+    # フラグが付いた記録をプレイヤーごとの集計からも除外する
+    player_stats.rebuild_player_stats(conn, nicknames)
+
+
+def rescore(engine, dry_run=False, read_engine=None):
+    """
+    全ての記録を判定して flag を書き戻し、集計を返す
+    管理者が approved にした記録は変更しない。以前に付けたフラグは判定結果に合わせて外す
+    読み込みと判定は read_engine（省略時は engine）で行い、書き戻しは WRITE_BATCH_SIZE 件ごとの短いトランザクションにする
+    """
+    started = time.perf_counter()
+    with (read_engine or engine).connect() as conn:
+        columns = load_columns(conn)
+    loaded = time.perf_counter()
+    flags = evaluate(columns)
+    current = columns["flag"]
+    changed = np.flatnonzero((current != flags) & (current != FLAG_APPROVED))
+    evaluated = time.perf_counter()
+
+    if not dry_run and len(changed):
+        ids = columns["id"][changed].tolist()
+        values = flags[changed].tolist()
+        for offset in range(0, len(ids), WRITE_BATCH_SIZE):
+            if offset:
+                time.sleep(WRITE_BATCH_PAUSE)
+            with engine.begin() as conn:
+                write_flags(conn, ids[offset:offset + WRITE_BATCH_SIZE], values[offset:offset + WRITE_BATCH_SIZE])
+
+    flagged = Counter(flags.tolist())
+    flagged.pop(None, None)
+    summary = {
+        "checked": len(flags),
+        "flagged": dict(flagged),
+        "changed": len(changed),
+        "dry_run": dry_run,
+        "load_seconds": round(loaded - started, 3),
+        "evaluate_seconds": round(evaluated - loaded, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info("記録の妥当性チェック: %s", summary)
+    return summary
+
+
+if __name__ == "__main__":
+    from database import engine, read_engine
+
+    result = rescore(engine, dry_run="--dry-run" in sys.argv[1:], read_engine=read_engine)
+    print(f"{result['checked']}件を判定、{result['changed']}件のフラグを"
+          f"{'変更します（--dry-run のため書き込みません）' if result['dry_run'] else '変更しました'}"
+          f"（{result['total_seconds']} 秒）")
+    for flag, count in sorted(result["flagged"].items()):
+        print(f"  {flag:18s} {count:8d}  {FLAG_LABELS[flag]}")
@@ -0,0 +1,131 @@
+"""
+プレイヤーごとの集計
+ランキング登録と同じトランザクションで累計値と最高記録を更新し、個人成績の表示はこの1行を読むだけで済ませます
+管理画面でランキングを削除・編集した場合は、対象プレイヤーの集計をランキングから作り直します
+"""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select
+
+from models import PlayerStats, Ranking
+from ranking_queries import visible_condition
+
+# 個人成績で返す最近の記録・ベスト記録の件数
+PERSONAL_RESULTS_LIMIT = 10
+
+
+def record_ranking(db, ranking):
+    """登録したランキング1件を集計に加える（呼び出し側のトランザクション内で実行する）"""
+    stats = db.get(PlayerStats, ranking.nickname)
+    if stats is None:
+        stats = PlayerStats(
+            nickname=ranking.nickname,
+            total_sessions=0,
+            total_wpm=0.0,
+            total_accuracy=0.0,
+            best_wpm=0.0,
+            total_play_time=0.0,
+        )
+        db.add(stats)
+    stats.total_sessions += 1
+    stats.total_wpm += ranking.wpm
+    stats.total_accuracy += ranking.accuracy
+    stats.best_wpm = max(stats.best_wpm, ranking.wpm)
+    stats.total_play_time += ranking.time_elapsed or 0
+    stats.last_played_at = ranking.created_at
+    stats.updated_at = datetime.utcnow()
+
+
+def rebuild_player_stats(db, nicknames=None):
+    """
+    ランキングから集計を作り直す（nicknames を省略すると全プレイヤー。フラグが付いた記録は含めない）
+    コミットは呼び出し側で行う
+    """
+    delete_query = delete(PlayerStats)
+    source = (
+        select(
+            Ranking.nickname,
+            func.count(Ranking.id),
+            func.sum(Ranking.wpm),
+            func.sum(Ranking.accuracy),
+            func.max(Ranking.wpm),
+            func.coalesce(func.sum(Ranking.time_elapsed), 0),
+            func.max(Ranking.created_at),
+            literal(datetime.utcnow(), DateTime),
+        )
+        .where(visible_condition())
+        .group_by(Ranking.nickname)
+    )
+    if nicknames is not None:
+        nicknames = list(set(nicknames))
+        if not nicknames:
+            return
+        delete_query = delete_query.where(PlayerStats.nickname.in_(nicknames))
+        source = source.where(Ranking.nickname.in_(nicknames))
+
+    db.execute(delete_query)
+    db.execute(insert(PlayerStats).from_select(
+        ["nickname", "total_sessions", "total_wpm", "total_accuracy", "best_wpm",
+         "total_play_time", "last_played_at", "updated_at"],
+        source
+    ))
+
+
+def backfill_if_empty(db):
+    """集計テーブルが空でランキングがある場合（テーブル追加直後）に一度だけ作成する"""
+    if db.query(PlayerStats.nickname).first() is not None:
+        return False
+    if db.query(Ranking.id).first() is None:
+        return False
+    rebuild_player_stats(db)
+    db.commit()
+    return True
+
+
+def stats_to_dict(stats):
+    """集計行を GameStats の形にする"""
+    if stats is None:
+        return {
+            "total_sessions": 0,
+            "average_wpm": 0.0,
+            "average_accuracy": 0.0,
+            "best_wpm": 0.0,
+            "total_play_time": 0,
+        }
+    return {
+        "total_sessions": stats.total_sessions,
+        "average_wpm": stats.total_wpm / stats.total_sessions,
+        "average_accuracy": stats.total_accuracy / stats.total_sessions,
+        "best_wpm": stats.best_wpm,
+        "total_play_time": int(stats.total_play_time),
+    }
+
+
+def personal_summary(db, nickname, limit=PERSONAL_RESULTS_LIMIT):
+    """
+    集計1行（主キー）と、最近の記録・ベスト記録（いずれもニックネームのインデックスの範囲読み）を返す
+    """
+    stats = db.get(PlayerStats, nickname)
+    if stats is None:
+        return {"nickname": nickname, "stats": stats_to_dict(None), "recent": [], "best": []}
+
+    columns = Ranking.__table__
+    recent = db.execute(
+        select(columns)
+        .where(Ranking.nickname == nickname)
+        .order_by(Ranking.created_at.desc(), Ranking.id.desc())
+        .limit(limit)
+    ).mappings().all()
+    best = db.execute(
+        select(columns)
+        .where(Ranking.nickname == nickname, visible_condition())
+        .order_by(Ranking.wpm.desc(), Ranking.id.asc())
+        .limit(limit)
+    ).mappings().all()
+    return {
+        "nickname": nickname,
+        "stats": stats_to_dict(stats),
+        "recent": [dict(row) for row in recent],
+        "best": [dict(row) for row in best],
+    }
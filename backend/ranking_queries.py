@@ -0,0 +1,142 @@
+"""
+ランキング取得クエリ
+期間・難易度での絞り込みと、プレイヤーごとのベスト記録のみを返すモードを提供します
+管理画面向けのキーセットページングもここで組み立てます
+妥当性チェックでフラグが付いた記録（plausibility.py）は公開のランキングに含めません
+"""
+
+import base64
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select
+
+from models import Ranking
+
+# 期間フィルタ ("today", "week", "month", "all")
+DATE_FILTERS = ("all", "today", "week", "month")
+# 管理者が確認して表示を認めた記録のフラグ（妥当性チェックで再びフラグを付けない）
+FLAG_APPROVED = "approved"
+
+
+def is_visible(flag):
+    """フラグのない記録と管理者が認めた記録だけをランキングに表示する"""
+    return flag is None or flag == FLAG_APPROVED
+
+
+def visible_condition():
+    return or_(Ranking.flag.is_(None), Ranking.flag == FLAG_APPROVED)
+
+
+def ranking_to_dict(ranking):
+    """Ranking の全カラムを辞書にする（セッションを閉じた後も使えるように）"""
+    return {column.name: getattr(ranking, column.name) for column in Ranking.__table__.columns}
+
+
+def window_start(date_filter, now=None):
+    """期間フィルタの開始日時を返す。全期間（または不明な値）の場合は None"""
+    now = now or datetime.utcnow()
+    if date_filter == "today":
+        # 今日のランキング
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if date_filter == "week":
+        # 過去1週間のランキング
+        return now - timedelta(days=7)
+    if date_filter == "month":
+        # 過去1ヶ月のランキング
+        return now - timedelta(days=30)
+    return None
+
+
+def rankings_query(db, date_filter=None, difficulty=None, best_per_player=False, now=None):
+    """
+    WPM降順（同値はID昇順）のランキングクエリを組み立てる
+    best_per_player=True の場合はウィンドウ関数でプレイヤーごとの最高記録1件に絞る
+    """
+    query = db.query(Ranking).filter(visible_condition())
+
+    start = window_start(date_filter, now)
+    if start is not None:
+        query = query.filter(Ranking.created_at >= start)
+    if difficulty:
+        query = query.filter(Ranking.difficulty == difficulty)
+
+    if best_per_player:
+        row_number = func.row_number().over(
+            partition_by=Ranking.nickname,
+            order_by=(Ranking.wpm.desc(), Ranking.id.asc())
+        ).label("player_rank")
+        best = query.with_entities(Ranking.id.label("id"), row_number).subquery()
+        query = (
+            db.query(Ranking)
+            .join(best, Ranking.id == best.c.id)
+            .filter(best.c.player_rank == 1)
+        )
+
+    return query.order_by(Ranking.wpm.desc(), Ranking.id.asc())
+
+
+def filter_conditions(difficulty=None, date_from=None, date_to=None, nickname=None, min_wpm=None, max_wpm=None,
+                      flagged=None):
+    """管理画面の絞り込み条件（難易度・作成日時の範囲・ニックネーム・WPMの範囲・フラグの有無）"""
+    conditions = []
+    if difficulty:
+        conditions.append(Ranking.difficulty == difficulty)
+    if date_from is not None:
+        conditions.append(Ranking.created_at >= date_from)
+    if date_to is not None:
+        conditions.append(Ranking.created_at < date_to)
+    if nickname:
+        conditions.append(Ranking.nickname == nickname)
+    if min_wpm is not None:
+        conditions.append(Ranking.wpm >= min_wpm)
+    if max_wpm is not None:
+        conditions.append(Ranking.wpm <= max_wpm)
+    if flagged is not None:
+        conditions.append(~visible_condition() if flagged else visible_condition())
+    return conditions
+
+
+def encode_cursor(ranking):
+    """次のページの開始位置（作成日時とID）を不透明な文字列にする"""
+    raw = f"{ranking['created_at'].isoformat()}|{ranking['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """encode_cursor の逆変換。不正な値の場合は ValueError"""
+    try:
+        created_at, ranking_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(ranking_id)
+    except Exception as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+
+
+def admin_rankings_page(db, conditions, cursor=None, limit=100):
+    """
+    作成日時の新しい順（同時刻はID降順）に limit 件を返す
+    OFFSET を使わず、前のページの最後の行より後ろだけを読むキーセットページング
+    """
+    query = select(Ranking.__table__).where(*conditions)
+    if cursor:
+        created_at, ranking_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Ranking.created_at < created_at,
+            and_(Ranking.created_at == created_at, Ranking.id < ranking_id)
+        ))
+    query = query.order_by(Ranking.created_at.desc(), Ranking.id.desc()).limit(limit + 1)
+    rows = [dict(row) for row in db.execute(query).mappings()]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def stream_rankings(db, conditions, batch_size=1000):
+    """エクスポート用: 条件に合う行を作成日時の新しい順に batch_size 件ずつ取り出す"""
+    query = (
+        select(Ranking.__table__)
+        .where(*conditions)
+        .order_by(Ranking.created_at.desc(), Ranking.id.desc())
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    result = db.execute(query).mappings()
+    for partition in result.partitions(batch_size):
+        yield partition
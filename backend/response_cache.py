@@ -0,0 +1,128 @@
+"""
+エンコード済みレスポンスのキャッシュ
+変更の少ない読み取り系のレスポンスについて、JSONのバイト列と gzip / brotli 圧縮版を元データの版ごとに一度だけ作り、
+Accept-Encoding に応じて返します。強いETagを付け、If-None-Match が一致すれば 304 を返します
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from fastapi import Response
+
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準の json を使う
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli がない環境では gzip のみ
+    brotli = None
+
+# この大きさ未満の本文は圧縮しない（バイト）
+RESPONSE_COMPRESS_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESS_MIN_SIZE", "512"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# キャッシュしておくレスポンスの数（クエリパラメータの組み合わせごと）
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} はJSONにできません")
+
+
+def dumps(data):
+    """JSONのバイト列にする（FastAPI の既定のエンコーダと同じ表現）"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedBody:
+    """1つのペイロードのエンコード済み表現（無圧縮・gzip・brotli）"""
+
+    def __init__(self, data):
+        self.identity = dumps(data)
+        digest = hashlib.sha256(self.identity).hexdigest()[:32]
+        self.variants = {"identity": (self.identity, f'"{digest}"')}
+        if len(self.identity) >= RESPONSE_COMPRESS_MIN_SIZE:
+            self.variants["gzip"] = (gzip.compress(self.identity, GZIP_LEVEL, mtime=0), f'"{digest}-gzip"')
+            if brotli is not None:
+                self.variants["br"] = (brotli.compress(self.identity, quality=BROTLI_QUALITY), f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def choose(self, accept_encoding):
+        """Accept-Encoding から返す表現を選ぶ（brotli → gzip → 無圧縮の順）"""
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.partition(";")
+            quality = params.replace(" ", "").removeprefix("q=")
+            try:
+                if params and float(quality) == 0:
+                    continue  # q=0 は「受け付けない」
+            except ValueError:
+                pass
+            accepted.add(name.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding
+        return "identity"
+
+
+class ResponseCache:
+    """(キー, 版) ごとにエンコード済みの本文を保持する"""
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, version, build):
+        """版が一致すればキャッシュを、そうでなければ build() の結果をエンコードして返す"""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                metrics.cache_hit("responses")
+                return cached[1]
+        metrics.cache_miss("responses")
+        body = EncodedBody(build())
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def encoded_response(request, body):
+    """リクエストのヘッダに応じてエンコード済みの本文（または 304）を返す"""
+    encoding = body.choose(request.headers.get("accept-encoding"))
+    content, etag = body.variants[encoding]
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or tags & body.etags:
+            return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+response_cache = ResponseCache()
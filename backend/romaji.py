@@ -0,0 +1,271 @@
+"""
+ローマ字入力オートマトンのコンパイラ
+テキストの読み（かな）から、許容される全てのローマ字入力（si/shi、tu/tsu、nn/n、っ の子音重ねなど）を
+受理する決定性オートマトンを作り、内容のハッシュごとにキャッシュします
+"""
+
+import hashlib
+import threading
+
+# かな1文字ごとの入力候補（先頭が表示用の標準的なつづり）
+KANA_TABLE = {
+    'あ': ['a'], 'い': ['i', 'yi'], 'う': ['u', 'wu', 'whu'], 'え': ['e'], 'お': ['o'],
+    'か': ['ka', 'ca'], 'き': ['ki'], 'く': ['ku', 'cu', 'qu'], 'け': ['ke'], 'こ': ['ko', 'co'],
+    'が': ['ga'], 'ぎ': ['gi'], 'ぐ': ['gu'], 'げ': ['ge'], 'ご': ['go'],
+    'さ': ['sa'], 'し': ['shi', 'si', 'ci'], 'す': ['su'], 'せ': ['se', 'ce'], 'そ': ['so'],
+    'ざ': ['za'], 'じ': ['ji', 'zi'], 'ず': ['zu'], 'ぜ': ['ze'], 'ぞ': ['zo'],
+    'た': ['ta'], 'ち': ['chi', 'ti'], 'つ': ['tsu', 'tu'], 'て': ['te'], 'と': ['to'],
+    'だ': ['da'], 'ぢ': ['di'], 'づ': ['du'], 'で': ['de'], 'ど': ['do'],
+    'な': ['na'], 'に': ['ni'], 'ぬ': ['nu'], 'ね': ['ne'], 'の': ['no'],
+    'は': ['ha'], 'ひ': ['hi'], 'ふ': ['fu', 'hu'], 'へ': ['he'], 'ほ': ['ho'],
+    'ば': ['ba'], 'び': ['bi'], 'ぶ': ['bu'], 'べ': ['be'], 'ぼ': ['bo'],
+    'ぱ': ['pa'], 'ぴ': ['pi'], 'ぷ': ['pu'], 'ぺ': ['pe'], 'ぽ': ['po'],
+    'ま': ['ma'], 'み': ['mi'], 'む': ['mu'], 'め': ['me'], 'も': ['mo'],
+    'や': ['ya'], 'ゆ': ['yu'], 'よ': ['yo'],
+    'ら': ['ra'], 'り': ['ri'], 'る': ['ru'], 'れ': ['re'], 'ろ': ['ro'],
+    'わ': ['wa'], 'ゐ': ['wi'], 'ゑ': ['we'], 'を': ['wo'], 'ゔ': ['vu'],
+    'ぁ': ['xa', 'la'], 'ぃ': ['xi', 'li', 'xyi', 'lyi'], 'ぅ': ['xu', 'lu'],
+    'ぇ': ['xe', 'le', 'xye', 'lye'], 'ぉ': ['xo', 'lo'],
+    'ゃ': ['xya', 'lya'], 'ゅ': ['xyu', 'lyu'], 'ょ': ['xyo', 'lyo'], 'ゎ': ['xwa', 'lwa'],
+    'ー': ['-'], '、': [','], '。': ['.'], '　': [' '], '！': ['!'], '？': ['?'],
+}
+
+# 小さい「っ」と「ん」の単独入力
+SMALL_TSU = ['xtu', 'ltu', 'xtsu', 'ltsu']
+N_ALONE = ['nn', "n'", 'xn']
+
+# 拗音（い段 + ゃゅょ）の子音部分
+YOON_PREFIXES = {
+    'き': ['ky'], 'ぎ': ['gy'], 'し': ['sh', 'sy'], 'じ': ['j', 'jy', 'zy'],
+    'ち': ['ch', 'ty', 'cy'], 'ぢ': ['dy'], 'に': ['ny'], 'ひ': ['hy'], 'び': ['by'],
+    'ぴ': ['py'], 'み': ['my'], 'り': ['ry'],
+}
+YOON_VOWELS = {'ゃ': 'a', 'ゅ': 'u', 'ょ': 'o'}
+
+# その他の2文字の組み合わせ（外来語の表記など）
+COMBINED = {
+    ('し', 'ぇ'): ['she', 'sye'], ('ち', 'ぇ'): ['che', 'tye', 'cye'], ('じ', 'ぇ'): ['je', 'jye', 'zye'],
+    # 登録済みのローマ字（ヘボン式）では ティ・ディ・トゥ が ti・di・tu と書かれるため、それも受理する
+    ('て', 'ぃ'): ['thi', 'ti'], ('で', 'ぃ'): ['dhi', 'di'], ('て', 'ゅ'): ['thu'], ('で', 'ゅ'): ['dhu'],
+    ('と', 'ぅ'): ['twu', 'tu'], ('ど', 'ぅ'): ['dwu'],
+    ('ふ', 'ぁ'): ['fa'], ('ふ', 'ぃ'): ['fi'], ('ふ', 'ぇ'): ['fe'], ('ふ', 'ぉ'): ['fo'], ('ふ', 'ゅ'): ['fyu'],
+    ('う', 'ぃ'): ['wi'], ('う', 'ぇ'): ['we'], ('う', 'ぉ'): ['who'],
+    ('ゔ', 'ぁ'): ['va'], ('ゔ', 'ぃ'): ['vi'], ('ゔ', 'ぇ'): ['ve'], ('ゔ', 'ぉ'): ['vo'],
+    ('つ', 'ぁ'): ['tsa'], ('つ', 'ぃ'): ['tsi'], ('つ', 'ぇ'): ['tse'], ('つ', 'ぉ'): ['tso'],
+    ('く', 'ぁ'): ['kwa', 'qa'],
+}
+for _base, _prefixes in YOON_PREFIXES.items():
+    for _small, _vowel in YOON_VOWELS.items():
+        COMBINED[(_base, _small)] = [prefix + _vowel for prefix in _prefixes]
+
+VOWELS = set('aiueo')
+
+# ローマ字 → かな の逆引き表（読みがローマ字でしか分からないテキスト用）
+ROMAJI_TO_KANA = {}
+for (_first, _second), _spellings in COMBINED.items():
+    for _spelling in _spellings:
+        ROMAJI_TO_KANA.setdefault(_spelling, _first + _second)
+for _kana, _spellings in KANA_TABLE.items():
+    for _spelling in _spellings:
+        ROMAJI_TO_KANA.setdefault(_spelling, _kana)
+ROMAJI_MAX_LENGTH = max(len(spelling) for spelling in ROMAJI_TO_KANA)
+
+
+def to_hiragana(text):
+    """カタカナをひらがなに変換する"""
+    return ''.join(chr(ord(char) - 0x60) if 'ァ' <= char <= 'ヶ' else char for char in text)
+
+
+def is_kana_text(text):
+    """かな・長音・記号だけで書かれているか（漢字を含む場合は読みが分からない）"""
+    for char in to_hiragana(text):
+        if char in KANA_TABLE or char in ('っ', 'ん') or char.isascii():
+            continue
+        return False
+    return True
+
+
+def romaji_to_kana(romaji):
+    """ヘボン式のローマ字をひらがなに戻す（変換できない文字はそのまま残す）"""
+    text = romaji.lower()
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        next_char = text[i + 1] if i + 1 < len(text) else ''
+        if char == 'n' and next_char == "'":
+            result.append('ん')
+            i += 2
+            continue
+        if char == 'n' and next_char not in VOWELS and next_char != 'y':
+            result.append('ん')
+            i += 1
+            continue
+        if char == next_char and char not in VOWELS and char.isalpha():
+            # 子音の重ねは「っ」
+            result.append('っ')
+            i += 1
+            continue
+        if char == 't' and text.startswith('tch', i):
+            result.append('っ')
+            i += 1
+            continue
+        for length in range(min(ROMAJI_MAX_LENGTH, len(text) - i), 0, -1):
+            kana = ROMAJI_TO_KANA.get(text[i:i + length])
+            if kana is not None:
+                result.append(kana)
+                i += length
+                break
+        else:
+            result.append(char)
+            i += 1
+    return ''.join(result)
+
+
+def _units(kana):
+    """かなを入力単位（拗音などの組み合わせは1単位）の候補リストに分割する"""
+    units = []
+    i = 0
+    while i < len(kana):
+        char = kana[i]
+        pair = (char, kana[i + 1]) if i + 1 < len(kana) else None
+        if pair in COMBINED:
+            # 組み合わせのつづりに加えて、1文字ずつ打つこともできる
+            separately = [a + b for a in KANA_TABLE[pair[0]] for b in KANA_TABLE[pair[1]]]
+            units.append(('kana', COMBINED[pair] + separately))
+            i += 2
+        elif char in ('っ', 'ん'):
+            units.append((char, None))
+            i += 1
+        elif char in KANA_TABLE:
+            units.append(('kana', list(KANA_TABLE[char])))
+            i += 1
+        else:
+            units.append(('kana', [char.lower()]))
+            i += 1
+    return units
+
+
+def segments_for(kana):
+    """
+    入力単位ごとの受理つづりの列を返す
+    「っ」は次の単位とまとめ、「ん」は次の単位によって単独の n を許すかを決める
+    """
+    units = _units(kana)
+    segments = []
+    for index, (kind, spellings) in enumerate(units):
+        following = units[index + 1] if index + 1 < len(units) else None
+        if kind == 'ん':
+            options = list(N_ALONE)
+            next_spellings = following[1] if following and following[0] == 'kana' else None
+            # 次が母音・や行・な行で始まらない場合は n 1回でよい
+            if next_spellings and all(s[0] not in VOWELS and s[0] not in "yn'" for s in next_spellings):
+                options.insert(0, 'n')
+            segments.append(options)
+        elif kind == 'っ':
+            if following and following[0] == 'kana':
+                continue  # 次の単位と合わせて処理する
+            segments.append(list(SMALL_TSU))
+        else:
+            previous = units[index - 1] if index > 0 else None
+            if previous and previous[0] == 'っ':
+                doubled = [s[0] + s for s in spellings if s[0].isalpha() and s[0] not in VOWELS and s[0] != 'n']
+                spellings = doubled + [tsu + s for tsu in SMALL_TSU for s in spellings]
+            segments.append(spellings)
+    return segments
+
+
+def build_automaton(segment_chains):
+    """
+    複数のつづり列（いずれかを受理）から決定性オートマトンを作る
+    NFAの状態は (列番号, 単位番号, 単位内で入力済みの文字列)
+    """
+    prefixes = []
+    for segments in segment_chains:
+        chain_prefixes = []
+        for spellings in segments:
+            chain_prefixes.append({s[:length] for s in spellings for length in range(1, len(s))})
+        prefixes.append(chain_prefixes)
+
+    def step(nfa_states, char):
+        result = set()
+        for chain, position, typed in nfa_states:
+            segments = segment_chains[chain]
+            if position >= len(segments):
+                continue
+            candidate = typed + char
+            if candidate in segments[position]:
+                result.add((chain, position + 1, ''))
+            if candidate in prefixes[chain][position]:
+                result.add((chain, position, candidate))
+        return frozenset(result)
+
+    start = frozenset((chain, 0, '') for chain in range(len(segment_chains)))
+    alphabet = sorted({c for segments in segment_chains for spellings in segments for s in spellings for c in s})
+    state_ids = {start: 0}
+    order = [start]
+    transitions = []
+    for nfa_states in order:
+        edges = {}
+        for char in alphabet:
+            target = step(nfa_states, char)
+            if not target:
+                continue
+            if target not in state_ids:
+                state_ids[target] = len(order)
+                order.append(target)
+            edges[char] = state_ids[target]
+        transitions.append(edges)
+
+    accept = [
+        state_id for state_id, nfa_states in enumerate(order)
+        if any(position == len(segment_chains[chain]) and typed == '' for chain, position, typed in nfa_states)
+    ]
+    return {"start": 0, "accept": accept, "transitions": transitions}
+
+
+def compile_text(content, romaji=None):
+    """
+    テキストの受理オートマトンを作る
+    かなだけの本文はそのまま、漢字を含む本文は登録済みのローマ字から読みを復元して使う
+    登録済みのローマ字は常に受理する。読みが分からない場合は None
+    """
+    chains = []
+    if content and is_kana_text(content):
+        chains.append(segments_for(to_hiragana(content)))
+    if romaji:
+        chains.append(segments_for(romaji_to_kana(romaji)))
+        # 表示しているつづりそのもの（ん を n 1回で書いたものなど）も受理する
+        chains.append([[romaji.lower()]])
+    if not chains:
+        return None
+    automaton = build_automaton(chains)
+    automaton["romaji"] = romaji or ''.join(spellings[0] for spellings in chains[0])
+    return automaton
+
+
+class AutomatonCache:
+    """本文とローマ字のハッシュをキーにしたコンパイル結果のキャッシュ"""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def key(content, romaji):
+        return hashlib.sha1(f"{content}\0{romaji or ''}".encode("utf-8")).hexdigest()
+
+    def get(self, content, romaji=None):
+        key = self.key(content, romaji)
+        automaton = self._entries.get(key)
+        if automaton is None and key not in self._entries:
+            automaton = compile_text(content, romaji)
+            with self._lock:
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+                self._entries[key] = automaton
+        return automaton
+
+
+automaton_cache = AutomatonCache()
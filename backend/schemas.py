@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -12,6 +12,40 @@ class RankingCreate(BaseModel):
     charactersTyped: int
     difficulty: str
     text_content_id: Optional[int] = None
+    # 再送しても二重に登録されないよう、クライアントが結果ごとに生成するキー
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=64)
+
+# まとめて送信するランキング（オフライン中に溜まった結果など）
+RANKING_BATCH_MAX_SIZE = 50
+
+class RankingBatchItem(RankingCreate):
+    idempotency_key: str = Field(..., min_length=1, max_length=64)
+
+class RankingBatch(BaseModel):
+    results: List[RankingBatchItem] = Field(..., min_length=1, max_length=RANKING_BATCH_MAX_SIZE)
+
+# 管理者によるランキングの一括操作の絞り込み条件
+class RankingFilter(BaseModel):
+    difficulty: Optional[str] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    nickname: Optional[str] = None
+    min_wpm: Optional[float] = None
+    max_wpm: Optional[float] = None
+    flagged: Optional[bool] = None
+
+class RankingBulkUpdateValues(BaseModel):
+    nickname: Optional[str] = None
+    wpm: Optional[float] = None
+    accuracy: Optional[float] = None
+    errors: Optional[int] = None
+    time_elapsed: Optional[float] = None
+    characters_typed: Optional[int] = None
+    difficulty: Optional[str] = None
+
+class RankingBulkUpdate(BaseModel):
+    filter: RankingFilter
+    values: RankingBulkUpdateValues
 
 # テキストコンテンツ関連スキーマ
 class TextContentBase(BaseModel):
@@ -19,6 +53,7 @@ class TextContentBase(BaseModel):
     content: str
     difficulty: str
     is_active: bool = True
+    romaji: Optional[str] = None
 
 class TextContentCreate(TextContentBase):
     pass
@@ -28,6 +63,7 @@ class TextContentUpdate(BaseModel):
     content: Optional[str] = None
     difficulty: Optional[str] = None
     is_active: Optional[bool] = None
+    romaji: Optional[str] = None
 
 class TextContentResponse(TextContentBase):
     id: int
@@ -46,6 +82,12 @@ class GameSessionBase(BaseModel):
 class GameSessionCreate(GameSessionBase):
     pass
 
+# ゲーム終了時の記録（ranking_id を指定した場合、省略した値はランキングから補う）
+class GameSessionComplete(BaseModel):
+    ranking_id: Optional[int] = None
+    wpm: Optional[float] = None
+    accuracy: Optional[float] = None
+
 class GameSessionResponse(GameSessionBase):
     id: int
     start_time: datetime
@@ -53,6 +95,7 @@ class GameSessionResponse(GameSessionBase):
     wpm: Optional[float] = None
     accuracy: Optional[float] = None
     is_completed: bool
+    ranking_id: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -96,3 +139,19 @@ class GameStats(BaseModel):
     average_accuracy: float
     best_wpm: float
     total_play_time: int  # 秒
+
+# 個人成績（集計と最近・ベストの記録）
+class PersonalStats(BaseModel):
+    nickname: str
+    stats: GameStats
+    recent: List[RankingResponse]
+    best: List[RankingResponse]
+
+# 管理者ログイン
+class AdminLogin(BaseModel):
+    password: str
+
+class AdminToken(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int  # 秒
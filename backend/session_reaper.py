@@ -0,0 +1,108 @@
+"""
+放置されたゲームセッションの削除
+完了しないまま一定時間が経ったセッションを、件数を区切った小さなDELETEで定期的に削除します
+1回のDELETEが短いため、SQLiteの書き込みロックを長く握ってゲーム中の書き込みを止めることはありません
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from database import SessionLocal, run_db
+from log import logger
+from metrics import metrics
+from models import GameSession
+
+# 実行間隔（秒、0で無効）・放置とみなすまでの時間（分）
+SESSION_REAPER_INTERVAL = float(os.getenv("SESSION_REAPER_INTERVAL", "300"))
+SESSION_EXPIRE_MINUTES = float(os.getenv("SESSION_EXPIRE_MINUTES", "60"))
+# 1回のDELETEで消す最大件数と、DELETEの間に他の書き込みへ譲る時間（秒）
+SESSION_REAPER_BATCH_SIZE = int(os.getenv("SESSION_REAPER_BATCH_SIZE", "500"))
+SESSION_REAPER_PAUSE = float(os.getenv("SESSION_REAPER_PAUSE", "0.05"))
+
+
+class SessionReaper:
+    def __init__(self, session_factory=SessionLocal, interval=SESSION_REAPER_INTERVAL,
+                 expire_minutes=SESSION_EXPIRE_MINUTES, batch_size=SESSION_REAPER_BATCH_SIZE,
+                 pause=SESSION_REAPER_PAUSE):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.expire_minutes = expire_minutes
+        self.batch_size = batch_size
+        self.pause = pause
+        self._task = None
+        self.last_removed = 0
+        self.last_run_at = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _delete_batch(self, cutoff):
+        """同期処理: 期限切れのセッションを最大 batch_size 件削除し、削除件数を返す"""
+        db = self.session_factory()
+        try:
+            expired_ids = (
+                select(GameSession.id)
+                .where(GameSession.is_completed == False, GameSession.start_time < cutoff)  # noqa: E712
+                .limit(self.batch_size)
+                .scalar_subquery()
+            )
+            result = db.execute(delete(GameSession).where(GameSession.id.in_(expired_ids)))
+            db.commit()
+            return result.rowcount
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run_once(self, now=None):
+        """期限切れのセッションがなくなるまで小分けに削除し、合計件数を返す"""
+        cutoff = (now or datetime.utcnow()) - timedelta(minutes=self.expire_minutes)
+        removed = 0
+        batches = 0
+        while True:
+            count = await run_db(self._delete_batch, cutoff)
+            removed += count
+            batches += 1
+            if count < self.batch_size:
+                break
+            # 次のDELETEの前にランキング等の書き込みを先に通す
+            await asyncio.sleep(self.pause)
+
+        self.last_removed = removed
+        self.last_run_at = datetime.utcnow()
+        metrics.increment("expired_sessions_removed_total", removed)
+        metrics.increment("session_reaper_runs_total")
+        if removed:
+            logger.info("放置セッション削除: %d件 (DELETE %d回)", removed, batches)
+        return removed
+
+    async def _worker(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error("放置セッション削除エラー: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+session_reaper = SessionReaper()
@@ -0,0 +1,67 @@
+"""
+同じ読み取りの同時実行をまとめる（single-flight）
+同じキーの処理が実行中なら新たに実行せず、その結果（または例外）を全ての呼び出し元で共有します
+ttl を指定すると、成功した結果をその秒数だけ保持して続く呼び出しにも返します
+キーにはルートと正規化した引数、必要なら元データの版を含めてください（版が変われば別のキーになる）
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+
+from metrics import metrics
+
+# "on": 同時実行をまとめる / "off": 呼び出しごとに実行する（比較用）
+SINGLEFLIGHT_MODE = os.getenv("SINGLEFLIGHT_MODE", "on")
+# ttl 付きで保持する結果の最大件数
+SINGLEFLIGHT_MAX_RESULTS = 1024
+
+
+class SingleFlight:
+    """イベントループ上で使う。fn は引数なしで awaitable を返す関数"""
+
+    def __init__(self, name, max_results=SINGLEFLIGHT_MAX_RESULTS):
+        self.name = name
+        self.max_results = max_results
+        self._calls = {}
+        # キー → (期限, 結果)（古い順）
+        self._results = OrderedDict()
+
+    async def do(self, key, fn, ttl=0):
+        if SINGLEFLIGHT_MODE != "on":
+            return await fn()
+        loop = asyncio.get_running_loop()
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > loop.time():
+                metrics.cache_hit(self.name)
+                return cached[1]
+            del self._results[key]
+
+        task = self._calls.get(key)
+        if task is None:
+            metrics.cache_miss(self.name)
+            # 呼び出し元とは別のタスクで実行し、最初の呼び出し元が切断しても他の呼び出し元の処理を止めない
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done, ttl))
+        else:
+            metrics.cache_hit(self.name)
+        # 例外も全ての呼び出し元に伝わる
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task, ttl):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if task.cancelled():
+            return
+        # 待っている呼び出し元がいない場合の「取り出されなかった例外」の警告を出さない
+        if task.exception() is not None or ttl <= 0:
+            return
+        self._results[key] = (asyncio.get_running_loop().time() + ttl, task.result())
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
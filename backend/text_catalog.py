@@ -0,0 +1,193 @@
+"""
+テキストカタログのインメモリキャッシュ
+text_contents テーブルを一度だけ読み込み、アクティブなテキスト一覧と難易度別インデックスを保持します
+1件の追加・更新・削除は apply() / remove() でインデックスだけを更新し、起動時と一括取り込みの後は refresh() で読み直します
+"""
+
+import bisect
+import threading
+
+from database import ReadSessionLocal
+from log import logger
+from metrics import metrics
+from romaji import automaton_cache
+import text_store
+
+# テキストが1件も登録されていない場合のデフォルトテキスト
+DEFAULT_TEXTS = [
+    {"id": 1, "title": "こんにちは", "content": "こんにちは", "difficulty": "easy", "is_active": True},
+    {"id": 2, "title": "ありがとう", "content": "ありがとう", "difficulty": "easy", "is_active": True},
+    {"id": 3, "title": "おはよう", "content": "おはよう", "difficulty": "easy", "is_active": True}
+]
+
+
+def load_texts_from_db():
+    db = ReadSessionLocal()
+    try:
+        return text_store.list_texts(db)
+    finally:
+        db.close()
+
+
+class TextCatalog:
+    """テキスト一覧と事前計算済みのインデックスを保持するキャッシュ"""
+
+    def __init__(self, loader=load_texts_from_db):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.from_store = False
+        self.version = 0
+        self.error = None
+        self.texts = []
+        self.active_texts = []
+        self.by_id = {}
+        self.by_difficulty = {}
+        self._automata_version = None
+        self._active_with_automata = []
+
+    def _build(self, texts, from_store):
+        """アクティブ一覧と難易度別インデックスを作り直す"""
+        active_texts = [text for text in texts if text.get('is_active', True)]
+        by_difficulty = {}
+        for text in active_texts:
+            by_difficulty.setdefault(text.get('difficulty'), []).append(text)
+
+        self.texts = texts
+        self.active_texts = active_texts
+        self.by_id = {text.get('id'): text for text in texts}
+        self.by_difficulty = by_difficulty
+        self.from_store = from_store
+        self.loaded = True
+        self.version += 1
+
+    def _load(self):
+        try:
+            texts = self.loader()
+            self.error = None
+        except Exception as e:
+            # 読み込みに失敗した場合は直前の内容を使い続ける
+            logger.error("テキストカタログ読み込みエラー: %s", e)
+            self.error = str(e)
+            if self.loaded:
+                return
+            texts = []
+
+        if texts:
+            self._build(texts, from_store=True)
+        else:
+            logger.warning("テキストが登録されていません。デフォルトテキストを使用します。")
+            self._build(list(DEFAULT_TEXTS), from_store=False)
+        logger.info("テキストカタログ読み込み: %d件 (アクティブ %d件)", len(self.texts), len(self.active_texts))
+
+    def ensure_loaded(self):
+        if self.loaded:
+            metrics.cache_hit("texts")
+            return
+        metrics.cache_miss("texts")
+        with self._lock:
+            if not self.loaded:
+                self._load()
+
+    def refresh(self):
+        """起動時・一括取り込みの後に呼び出し、即座に再読み込みする"""
+        with self._lock:
+            self._load()
+
+    @staticmethod
+    def _position(texts, text_id):
+        """ID順のリストでの text_id の位置と、その位置に存在するか"""
+        position = bisect.bisect_left(texts, text_id, key=lambda text: text.get('id'))
+        return position, position < len(texts) and texts[position].get('id') == text_id
+
+    def _discard(self, texts, text_id):
+        position, found = self._position(texts, text_id)
+        if found:
+            del texts[position]
+
+    def _discard_active(self, text):
+        self._discard(self.active_texts, text.get('id'))
+        difficulty = text.get('difficulty')
+        texts = self.by_difficulty.get(difficulty)
+        if texts is not None:
+            self._discard(texts, text.get('id'))
+            if not texts:
+                del self.by_difficulty[difficulty]
+
+    def _put(self, texts, text):
+        position, found = self._position(texts, text.get('id'))
+        if found:
+            texts[position] = text
+        else:
+            texts.insert(position, text)
+
+    def apply(self, text):
+        """追加・更新した1件（text_store の辞書）をインデックスに反映する（デフォルトテキストからの切り替え以外はテーブルを読み直さない）"""
+        with self._lock:
+            if not self.loaded:
+                return
+            if not self.from_store:
+                # デフォルトテキストを表示している場合は登録されたテキストに切り替える
+                self._load()
+                return
+            text_id = text.get('id')
+            previous = self.by_id.get(text_id)
+            if previous is not None and previous.get('is_active', True):
+                self._discard_active(previous)
+            self._put(self.texts, text)
+            self.by_id[text_id] = text
+            if text.get('is_active', True):
+                self._put(self.active_texts, text)
+                self._put(self.by_difficulty.setdefault(text.get('difficulty'), []), text)
+            self.version += 1
+
+    def remove(self, text_id):
+        """削除した1件をインデックスから取り除く"""
+        with self._lock:
+            if not self.loaded or not self.from_store:
+                return
+            previous = self.by_id.pop(text_id, None)
+            if previous is None:
+                return
+            self._discard(self.texts, text_id)
+            if previous.get('is_active', True):
+                self._discard_active(previous)
+            if not self.texts:
+                # 最後の1件を削除した場合はデフォルトテキストに戻す
+                self._load()
+                return
+            self.version += 1
+
+    def get_all(self):
+        self.ensure_loaded()
+        return self.texts
+
+    def get_active(self, difficulty=None):
+        self.ensure_loaded()
+        if difficulty is None:
+            return self.active_texts
+        return self.by_difficulty.get(difficulty, [])
+
+    def get_active_with_automata(self):
+        """
+        アクティブテキストに入力オートマトンを付けて返す
+        カタログの版ごとに一度だけ組み立て、変更のないテキストはハッシュキャッシュから再利用する
+        """
+        self.ensure_loaded()
+        if self._automata_version != self.version:
+            with self._lock:
+                if self._automata_version != self.version:
+                    version = self.version
+                    self._active_with_automata = [
+                        {**text, "automaton": automaton_cache.get(text.get('content'), text.get('romaji'))}
+                        for text in self.active_texts
+                    ]
+                    self._automata_version = version
+        return self._active_with_automata
+
+    def difficulty_counts(self):
+        self.ensure_loaded()
+        return {difficulty: len(texts) for difficulty, texts in self.by_difficulty.items()}
+
+
+text_catalog = TextCatalog()
@@ -0,0 +1,346 @@
+"""
+サーバー側でのテキストの抽選
+カタログの版ごとに難易度別のテキスト配列を作っておき、要求された件数だけを O(件数) で抽選します
+- 同じセッション内で同じテキストを出さないよう、セッションごとに1周分の抽選状態（疎な Fisher-Yates）を保持する
+  （LRUで件数を制限）。未出題のものから直接選ぶため、周回の終わり近くでも1回の抽選は O(件数)
+  複数ワーカーの場合、同じセッションの要求が別のワーカーに届くことがあるため、抽選状態は
+  状態ディレクトリの SQLite ファイル（SharedSeenStore）に保存して全ワーカーで共有する
+- weighted=True の場合は最近よく出たテキストほど出にくくする（棄却サンプリング。出題回数はワーカーごと）
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import ReadSessionLocal, SQLITE_BUSY_TIMEOUT_MS
+from log import logger
+from models import Ranking
+from text_catalog import text_catalog
+from workers import MULTI_WORKER, WORKER_STATE_DIR
+
+# 1回に抽選できる最大件数
+TEXT_DRAW_MAX_COUNT = int(os.getenv("TEXT_DRAW_MAX_COUNT", "50"))
+# 出題済みのテキストを覚えておくセッション数
+TEXT_DRAW_SESSION_CACHE_SIZE = int(os.getenv("TEXT_DRAW_SESSION_CACHE_SIZE", "10000"))
+# 複数ワーカーの場合に出題済みのテキストを覚えておく秒数（これより前の記録は定期的に消す）
+TEXT_DRAW_SESSION_TTL = float(os.getenv("TEXT_DRAW_SESSION_TTL", "86400"))
+# 共有ファイルの古い記録を消す間隔（抽選の回数）
+SHARED_SEEN_PRUNE_INTERVAL = 1000
+# 出題回数の半減期（秒）と、起動時に読み込む期間（日）
+TEXT_PLAY_HALF_LIFE = float(os.getenv("TEXT_PLAY_HALF_LIFE", "3600"))
+TEXT_PLAY_LOOKBACK_DAYS = 7
+# 重み付き抽選で棄却を繰り返す上限（件数あたり）。超えた分は重みなしで補う
+MAX_REJECTIONS_PER_ITEM = 32
+
+
+class Cycle:
+    """
+    セッションの1周分の抽選状態（疎な Fisher-Yates）
+    難易度別配列の位置を仮想的に並べ替え、先頭の remaining 個を未出題として扱う
+    swapped には入れ替えた位置だけを持つため、1件の抽選は O(1)（出題済みの位置を走査しない）
+    """
+
+    __slots__ = ("key", "size", "remaining", "swapped")
+
+    def __init__(self, key, size, remaining=None, swapped=None):
+        self.key = key
+        self.size = size
+        self.remaining = size if remaining is None else remaining
+        self.swapped = {} if swapped is None else swapped
+
+    def get(self, index):
+        """未出題の index 番目（0 <= index < remaining）の位置"""
+        return self.swapped.get(index, index)
+
+    def take(self, index):
+        """未出題の index 番目を出題済みにして、その位置を返す"""
+        position = self.get(index)
+        self.remaining -= 1
+        if index != self.remaining:
+            self.swapped[index] = self.get(self.remaining)
+        # remaining 以降は二度と参照しない
+        self.swapped.pop(self.remaining, None)
+        return position
+
+    def restart(self):
+        """全て未出題に戻す（新しい周回）"""
+        self.remaining = self.size
+        self.swapped.clear()
+
+
+class PlayCounts:
+    """テキストごとの最近の出題回数（時間とともに半減する）"""
+
+    def __init__(self, half_life=TEXT_PLAY_HALF_LIFE):
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self.counts = {}
+        self._decayed_at = time.monotonic()
+
+    def load(self):
+        """起動時に直近のランキングから出題回数を読み込む"""
+        since = datetime.utcnow() - timedelta(days=TEXT_PLAY_LOOKBACK_DAYS)
+        db = ReadSessionLocal()
+        try:
+            rows = (
+                db.query(Ranking.text_content_id, func.count(Ranking.id))
+                .filter(Ranking.text_content_id.isnot(None), Ranking.created_at >= since)
+                .group_by(Ranking.text_content_id)
+                .all()
+            )
+        finally:
+            db.close()
+        with self._lock:
+            self.counts = {text_id: float(count) for text_id, count in rows}
+            self._decayed_at = time.monotonic()
+        logger.info("テキスト出題回数読み込み: %d件", len(rows))
+
+    def _decay(self):
+        elapsed = time.monotonic() - self._decayed_at
+        if elapsed < self.half_life:
+            return
+        factor = 0.5 ** (elapsed / self.half_life)
+        self.counts = {text_id: count * factor for text_id, count in self.counts.items() if count * factor >= 0.05}
+        self._decayed_at = time.monotonic()
+
+    def record(self, text_id):
+        if text_id is None:
+            return
+        with self._lock:
+            self._decay()
+            self.counts[text_id] = self.counts.get(text_id, 0.0) + 1.0
+
+    def weight(self, text_id):
+        """出題回数が多いほど小さい重み（0〜1）"""
+        return 1.0 / (1.0 + self.counts.get(text_id, 0.0))
+
+
+class SharedSwaps:
+    """
+    共有ファイルに保存した Cycle.swapped（dict の代わりに使う）
+    抽選で参照した位置だけを読み、変更はブロックの終わりにまとめて書き込む
+    """
+
+    def __init__(self, conn, key):
+        self.conn = conn
+        self.key = key
+        self._read = {}
+        # slot → 位置（None は削除）
+        self._changed = {}
+
+    def get(self, slot, default=None):
+        if slot in self._changed:
+            value = self._changed[slot]
+        else:
+            if slot not in self._read:
+                row = self.conn.execute(
+                    "SELECT position FROM seen_swaps WHERE session = ? AND difficulty = ? AND slot = ?", (*self.key, slot)
+                ).fetchone()
+                self._read[slot] = row[0] if row else None
+            value = self._read[slot]
+        return default if value is None else value
+
+    def __setitem__(self, slot, position):
+        self._changed[slot] = position
+
+    def pop(self, slot, default=None):
+        value = self.get(slot, default)
+        self._changed[slot] = None
+        return value
+
+    def clear(self):
+        self.conn.execute("DELETE FROM seen_swaps WHERE session = ? AND difficulty = ?", self.key)
+        self._read = {}
+        self._changed = {}
+
+    def flush(self):
+        self.conn.executemany(
+            "DELETE FROM seen_swaps WHERE session = ? AND difficulty = ? AND slot = ?",
+            [(*self.key, slot) for slot, position in self._changed.items() if position is None]
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO seen_swaps (session, difficulty, slot, position) VALUES (?, ?, ?, ?)",
+            [(*self.key, slot, position) for slot, position in self._changed.items() if position is not None]
+        )
+        self._changed = {}
+
+
+class SharedSeenStore:
+    """
+    セッションごとの抽選状態（Cycle）をワーカー間で共有する SQLite ファイル
+    同じセッションの抽選はファイルの書き込みロック（BEGIN IMMEDIATE）で1つずつ行う
+    """
+
+    def __init__(self, path, ttl=TEXT_DRAW_SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._draws = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_cycles (session TEXT NOT NULL, difficulty TEXT NOT NULL, "
+                "pool_key INTEGER NOT NULL, remaining INTEGER NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (session, difficulty)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_seen_cycles_updated_at ON seen_cycles (updated_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_swaps (session TEXT NOT NULL, difficulty TEXT NOT NULL, "
+                "slot INTEGER NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (session, difficulty, slot)) "
+                "WITHOUT ROWID"
+            )
+
+    @contextmanager
+    def _connection(self):
+        # 接続はスレッドごとに作る（DBのスレッドプールから呼び出される）
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def cycle(self, session, difficulty, pool_key, size):
+        """
+        セッションの Cycle を渡し、ブロック内での抽選結果を書き込む
+        pool_key（難易度別配列の内容）が前回と違う場合は新しい周回から始める
+        """
+        key = (session, difficulty or "")
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT pool_key, remaining FROM seen_cycles WHERE session = ? AND difficulty = ?", key
+            ).fetchone()
+            swaps = SharedSwaps(conn, key)
+            if row is not None and row[0] == pool_key:
+                cycle = Cycle(pool_key, size, row[1], swaps)
+            else:
+                cycle = Cycle(pool_key, size, swapped=swaps)
+                if row is not None:
+                    swaps.clear()
+            yield cycle
+            swaps.flush()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO seen_cycles (session, difficulty, pool_key, remaining, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)", (*key, pool_key, cycle.remaining, now)
+            )
+            self._draws += 1
+            if self._draws % SHARED_SEEN_PRUNE_INTERVAL == 0:
+                conn.execute("DELETE FROM seen_cycles WHERE updated_at < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM seen_swaps WHERE (session, difficulty) NOT IN (SELECT session, difficulty FROM seen_cycles)"
+                )
+
+
+class TextDrawer:
+    def __init__(self, catalog=text_catalog, session_cache_size=TEXT_DRAW_SESSION_CACHE_SIZE, shared=None):
+        self.catalog = catalog
+        self.session_cache_size = session_cache_size
+        # 複数ワーカーの場合の抽選状態の共有先（None の場合はこのプロセスのメモリに保持する）
+        self.shared = shared
+        self.plays = PlayCounts()
+        self._lock = threading.Lock()
+        self._version = None
+        self._pools = {}
+        # (版, 難易度) → 配列の内容を表すキー（ワーカー間で同じ配列かを確かめるため）
+        self._pool_keys = {}
+        # (セッション, 難易度) → Cycle（最近使われた順）
+        self._cycles = OrderedDict()
+
+    def _pool(self, difficulty):
+        """カタログの版ごとに難易度別のテキスト配列を作る（None は全難易度）"""
+        self.catalog.ensure_loaded()
+        if self._version != self.catalog.version:
+            with self._lock:
+                if self._version != self.catalog.version:
+                    version = self.catalog.version
+                    pools = {difficulty: list(texts) for difficulty, texts in self.catalog.by_difficulty.items()}
+                    pools[None] = list(self.catalog.active_texts)
+                    self._pools = pools
+                    self._pool_keys = {}
+                    self._version = version
+        return self._version, self._pools.get(difficulty, [])
+
+    def _pool_key(self, version, difficulty, pool):
+        key = self._pool_keys.get((version, difficulty))
+        if key is None:
+            # 版の番号はワーカーごとに異なるため、テキストIDの並びから作る
+            key = hash(tuple(text["id"] for text in pool))
+            self._pool_keys[(version, difficulty)] = key
+        return key
+
+    def _cycle(self, session, difficulty, version, size):
+        key = (session, difficulty)
+        cycle = self._cycles.get(key)
+        # カタログが変わった場合は最初からやり直す
+        if cycle is None or cycle.key != version:
+            cycle = Cycle(version, size)
+        self._cycles[key] = cycle
+        self._cycles.move_to_end(key)
+        while len(self._cycles) > self.session_cache_size:
+            self._cycles.popitem(last=False)
+        return cycle
+
+    def _choose(self, pool, cycle, count, weighted, rng):
+        """
+        cycle の未出題の位置から count 件を選んで出題済みにし、位置のリストを返す（O(件数)）
+        未出題のテキストが足りない場合は新しい周回から選ぶ
+        weighted=True の場合は棄却サンプリング（件数あたり MAX_REJECTIONS_PER_ITEM 回まで。超えた分は重みなし）
+        """
+        count = min(count, len(pool))
+        if cycle.remaining < count:
+            cycle.restart()
+        positions = []
+        max_rejections = count * MAX_REJECTIONS_PER_ITEM
+        rejections = 0
+        while len(positions) < count:
+            index = rng.randrange(cycle.remaining)
+            if weighted and rejections < max_rejections:
+                if rng.random() >= self.plays.weight(pool[cycle.get(index)]["id"]):
+                    rejections += 1
+                    continue
+            positions.append(cycle.take(index))
+        return positions
+
+    def draw(self, difficulty=None, count=1, session=None, weighted=False, rng=random):
+        """
+        難易度別の配列から count 件を抽選して返す
+        複数ワーカーでセッションを指定した場合は共有ファイルを読み書きするため、run_db から呼び出す
+        """
+        version, pool = self._pool(difficulty)
+        if not pool:
+            return []
+        if session and self.shared is not None:
+            # 別のワーカーで出題したものも除く
+            pool_key = self._pool_key(version, difficulty, pool)
+            with self.shared.cycle(session, difficulty, pool_key, len(pool)) as cycle:
+                positions = self._choose(pool, cycle, count, weighted, rng)
+        elif session:
+            with self._lock:
+                positions = self._choose(pool, self._cycle(session, difficulty, version, len(pool)), count, weighted, rng)
+        else:
+            # セッションなしは1回限りの周回から選ぶ
+            positions = self._choose(pool, Cycle(version, len(pool)), count, weighted, rng)
+        texts = [pool[position] for position in positions]
+        for text in texts:
+            self.plays.record(text["id"])
+        return texts
+
+
+text_drawer = TextDrawer(
+    shared=SharedSeenStore(os.path.join(WORKER_STATE_DIR, "text_draw.db")) if MULTI_WORKER else None
+)
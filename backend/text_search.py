@@ -0,0 +1,178 @@
+"""
+管理画面のテキスト検索
+タイトルと本文を SQLite FTS5（trigram）の索引で検索します。索引は text_contents のトリガーで書き込みと同時に更新されます
+trigram は3文字以上の語しか索引を引けないため、2文字以下の語（と FTS5 が使えない環境）は LIKE で絞り込みます
+一致箇所は {"text", "match"} の区間のリストで返し、HTMLとして解釈せずに表示できるようにします
+結果は新しい順（ID降順）で、索引を rowid の逆順にたどって LIMIT 件で止めるため、ヒット数が多くても全件を並べ替えません
+"""
+
+from sqlalchemy import DateTime, text
+
+from log import logger
+
+FTS_TABLE = "text_contents_fts"
+# FTS5 の一致箇所を囲む印（本文に現れない制御文字）
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+# 本文の抜粋の長さ（FTS5 はトークン数、LIKE の場合は文字数）
+SNIPPET_TOKENS = 24
+SNIPPET_CHARS = 48
+TRIGRAM_MIN_LENGTH = 3
+# 件数はこの数までしか数えない（それ以上は total_exact=False で返す）
+TEXT_SEARCH_COUNT_LIMIT = 1000
+
+TEXT_FIELDS = "t.id, t.title, t.content, t.romaji, t.difficulty, t.is_active, t.created_at, t.updated_at"
+
+_fts_available = None
+
+
+def fts_available(db):
+    """FTS5 の索引が作成済みかどうか（マイグレーション後は変わらないため一度だけ確認する）"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first() is not None if db.bind.dialect.name == "sqlite" else False
+        if not _fts_available:
+            logger.info("テキスト検索: FTS5 索引がないため LIKE で検索します")
+    return _fts_available
+
+
+def _like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def marked_segments(value):
+    """FTS5 の印付き文字列を区間のリストにする"""
+    segments = []
+    for index, part in enumerate(value.split(_MARK_START)):
+        if index == 0:
+            matched, rest = "", part
+        else:
+            matched, _, rest = part.partition(_MARK_END)
+        if matched:
+            segments.append({"text": matched, "match": True})
+        if rest:
+            segments.append({"text": rest, "match": False})
+    return segments
+
+
+def highlight_segments(value, terms, window=None):
+    """
+    value の中の terms（大文字小文字を区別しない）を一致区間にする
+    window を指定すると最初の一致の前後だけを抜き出す
+    """
+    lowered = value.lower()
+    spans = []
+    for term in terms:
+        needle = term.lower()
+        start = lowered.find(needle)
+        while needle and start != -1:
+            spans.append((start, start + len(needle)))
+            start = lowered.find(needle, start + len(needle))
+    spans.sort()
+
+    begin, end = 0, len(value)
+    if window is not None and len(value) > window:
+        first = spans[0][0] if spans else 0
+        begin = max(0, first - window // 3)
+        end = min(len(value), begin + window)
+
+    segments = []
+    if begin > 0:
+        segments.append({"text": "…", "match": False})
+    position = begin
+    for start, stop in spans:
+        start, stop = max(start, position), min(stop, end)
+        if start >= stop:
+            continue
+        if start > position:
+            segments.append({"text": value[position:start], "match": False})
+        segments.append({"text": value[start:stop], "match": True})
+        position = stop
+    if position < end:
+        segments.append({"text": value[position:end], "match": False})
+    if end < len(value):
+        segments.append({"text": "…", "match": False})
+    return segments
+
+
+def search_texts(db, query=None, difficulty=None, is_active=None, offset=0, limit=50):
+    """
+    テキストを検索して {"items", "total", "total_exact", "next_offset"} を返す
+    語を空白で区切った場合は全ての語を含むものを返す（新しい順）
+    """
+    terms = [term for term in (query or "").split() if term]
+    long_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+    use_fts = bool(long_terms) and fts_available(db)
+    like_terms = [term for term in terms if not use_fts or len(term) < TRIGRAM_MIN_LENGTH]
+
+    conditions = []
+    params = {"limit": limit + 1, "offset": offset, "count_limit": TEXT_SEARCH_COUNT_LIMIT}
+    if difficulty:
+        conditions.append("t.difficulty = :difficulty")
+        params["difficulty"] = difficulty
+    if is_active is not None:
+        conditions.append("t.is_active = :is_active")
+        params["is_active"] = is_active
+    for index, term in enumerate(like_terms):
+        conditions.append(f"(t.title LIKE :like{index} ESCAPE '\\' OR t.content LIKE :like{index} ESCAPE '\\')")
+        params[f"like{index}"] = _like_pattern(term)
+
+    if use_fts:
+        conditions.append(f"{FTS_TABLE} MATCH :match")
+        params["match"] = " ".join(_fts_phrase(term) for term in long_terms)
+        source = f"{FTS_TABLE} JOIN text_contents t ON t.id = {FTS_TABLE}.rowid"
+        columns = (
+            f"{TEXT_FIELDS}, "
+            f"highlight({FTS_TABLE}, 0, '{_MARK_START}', '{_MARK_END}') AS title_marked, "
+            f"snippet({FTS_TABLE}, 1, '{_MARK_START}', '{_MARK_END}', '…', {SNIPPET_TOKENS}) AS content_marked"
+        )
+        order = f"{FTS_TABLE}.rowid DESC"
+    else:
+        source = "text_contents t"
+        columns = TEXT_FIELDS
+        order = "t.id DESC"
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # 日時は SQLite の文字列のままにせず datetime にする（他のAPIと同じく ISO 8601 で返す）
+    rows = db.execute(
+        text(f"SELECT {columns} FROM {source} {where} ORDER BY {order} LIMIT :limit OFFSET :offset")
+        .columns(created_at=DateTime, updated_at=DateTime),
+        params
+    ).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    total = db.execute(
+        text(f"SELECT COUNT(*) FROM (SELECT 1 FROM {source} {where} LIMIT :count_limit)"), params
+    ).scalar()
+    total_exact = total < TEXT_SEARCH_COUNT_LIMIT
+    if not total_exact:
+        total = max(total, offset + len(rows))
+
+    items = []
+    for row in rows:
+        item = {key: row[key] for key in (
+            "id", "title", "content", "romaji", "difficulty", "is_active", "created_at", "updated_at"
+        )}
+        item["is_active"] = bool(item["is_active"])
+        if use_fts and not like_terms:
+            item["title_highlight"] = marked_segments(row["title_marked"])
+            item["content_highlight"] = marked_segments(row["content_marked"])
+        else:
+            # LIKE で絞り込んだ語を含む場合は全ての語の一致箇所をここで探す
+            item["title_highlight"] = highlight_segments(row["title"], terms)
+            item["content_highlight"] = highlight_segments(row["content"], terms, SNIPPET_CHARS)
+        items.append(item)
+
+    return {
+        "items": items,
+        "total": total,
+        "total_exact": total_exact,
+        "next_offset": offset + len(items) if has_more else None,
+    }
@@ -0,0 +1,156 @@
+"""
+テキストコンテンツの永続化
+text_contents テーブルを正とし、1件単位のトランザクションで書き込みます
+data/texts.json は初回起動時に一度だけ取り込みます
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from log import logger
+from models import TextContent, AdminSettings
+
+# 取り込み元のテキストファイルのパス
+TEXTS_FILE = os.getenv("TEXTS_FILE") or os.path.join(os.path.dirname(__file__), '..', 'data', 'texts.json')
+
+# 取り込み済みであることを記録する管理者設定のキー
+IMPORT_MARKER_KEY = "texts_json_imported"
+
+TEXT_COLUMNS = (
+    TextContent.id,
+    TextContent.title,
+    TextContent.content,
+    TextContent.difficulty,
+    TextContent.is_active,
+    TextContent.romaji,
+)
+
+
+def text_to_dict(text):
+    return {
+        "id": text.id,
+        "title": text.title,
+        "content": text.content,
+        "difficulty": text.difficulty,
+        "is_active": text.is_active,
+        "romaji": text.romaji,
+    }
+
+
+def list_texts(db):
+    """全テキストをID順に返す（ORMオブジェクトを作らずに列だけを読む）"""
+    rows = db.query(*TEXT_COLUMNS).order_by(TextContent.id).all()
+    return [text_to_dict(row) for row in rows]
+
+
+def create_text(db, fields):
+    """テキストを1件追加して辞書で返す"""
+    text = TextContent(**fields)
+    db.add(text)
+    db.flush()
+    result = text_to_dict(text)
+    db.commit()
+    return result
+
+
+def bulk_create_texts(db, rows):
+    """検証済みのテキストを1トランザクションでまとめて追加し、採番されたIDを返す"""
+    try:
+        ids = db.scalars(insert(TextContent).returning(TextContent.id), rows).all()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return list(ids)
+
+
+def update_text(db, text_id, fields):
+    """テキストを1件更新して辞書で返す。存在しない場合は None"""
+    text = db.get(TextContent, text_id)
+    if text is None:
+        return None
+    for field, value in fields.items():
+        setattr(text, field, value)
+    db.flush()
+    result = text_to_dict(text)
+    db.commit()
+    return result
+
+
+def delete_text(db, text_id):
+    """テキストを1件削除する。削除できた場合は True"""
+    deleted_count = db.query(TextContent).filter(TextContent.id == text_id).delete()
+    db.commit()
+    return deleted_count > 0
+
+
+def import_texts_json(db, path=TEXTS_FILE, force=False):
+    """
+    texts.json をテーブルへ取り込む（IDが一致する行は上書き）
+    取り込み済みの場合は force=True のときだけ再実行し、取り込んだ件数を返す
+    """
+    marker = db.query(AdminSettings).filter(AdminSettings.setting_key == IMPORT_MARKER_KEY).first()
+    if marker and not force:
+        return 0
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, 'r', encoding='utf-8') as f:
+        texts = json.load(f).get('texts', [])
+
+    existing_ids = {text_id for (text_id,) in db.query(TextContent.id)}
+    inserts = []
+    updates = []
+    for text in texts:
+        row = {
+            "title": text["title"],
+            "content": text["content"],
+            "difficulty": text["difficulty"],
+            "is_active": text.get("is_active", True),
+            "romaji": text.get("romaji"),
+        }
+        if text.get("id") is not None:
+            row["id"] = text["id"]
+        if row.get("id") in existing_ids:
+            updates.append(row)
+        else:
+            inserts.append(row)
+
+    try:
+        db.bulk_insert_mappings(TextContent, inserts)
+        db.bulk_update_mappings(TextContent, updates)
+        marker_value = f"{len(texts)}件 ({datetime.utcnow().isoformat()})"
+        if marker:
+            marker.setting_value = marker_value
+        else:
+            db.add(AdminSettings(
+                setting_key=IMPORT_MARKER_KEY,
+                setting_value=marker_value,
+                description="texts.json の取り込み記録"
+            ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info("texts.json 取り込み完了: 追加 %d件, 上書き %d件", len(inserts), len(updates))
+    return len(texts)
+
+
+if __name__ == "__main__":
+    # 使い方: python text_store.py [--force]
+    from database import SessionLocal, engine
+    from migrations import run_migrations
+
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        count = import_texts_json(db, force="--force" in sys.argv[1:])
+        if count == 0:
+            print("取り込みは行われませんでした（取り込み済みの場合は --force を指定してください）")
+    finally:
+        db.close()
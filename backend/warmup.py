@@ -0,0 +1,112 @@
+"""
+起動時のウォームアップ
+サーバーが応答を始めてから、スキーマの更新とホットデータ（テキスト・ランキング上位など）の読み込みを順に行います
+完了するまで /ready は 503 を返し、通常のリクエストは完了を待ってから処理します
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from database import run_db
+from log import logger
+
+# ウォームアップの完了をリクエストが待つ最大時間（秒）
+WARMUP_WAIT_TIMEOUT = float(os.getenv("WARMUP_WAIT_TIMEOUT", "30"))
+# ウォームアップの完了を待たずに処理するパス
+WARMUP_EXEMPT_PATHS = frozenset({"/", "/ready", "/metrics"})
+
+
+class WarmUp:
+    """ウォームアップの各段階を順に実行し、状態を保持する"""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.steps = {}
+        self._event = None
+        self._task = None
+
+    async def start(self, steps):
+        """
+        steps: (名前, 関数) のリスト。同期関数はDBスレッドプールで、非同期関数はそのまま実行する
+        """
+        if self._task is not None:
+            return
+        self._event = asyncio.Event()
+        self._task = asyncio.create_task(self._run(steps))
+
+    async def _run(self, steps):
+        started = time.perf_counter()
+        try:
+            for name, step in steps:
+                step_started = time.perf_counter()
+                if asyncio.iscoroutinefunction(step):
+                    await step()
+                else:
+                    await run_db(step)
+                self.steps[name] = round(time.perf_counter() - step_started, 3)
+            self.ready = True
+            logger.info("ウォームアップ完了: %.2f 秒 %s", time.perf_counter() - started, self.steps)
+        except Exception as e:
+            self.error = str(e)
+            logger.error("ウォームアップエラー: %s", e)
+        finally:
+            self._event.set()
+
+    async def wait(self, timeout=WARMUP_WAIT_TIMEOUT):
+        """完了まで待ち、準備ができていれば True を返す"""
+        if self.ready:
+            return True
+        if self._event is None:
+            return False
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.ready
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def status(self):
+        if self.ready:
+            state = "ready"
+        elif self.error is not None:
+            state = "failed"
+        else:
+            state = "warming"
+        return {"status": state, "steps": self.steps, "error": self.error}
+
+
+warm_up = WarmUp()
+
+
+class WarmUpMiddleware:
+    """ASGIミドルウェア: ウォームアップ中のリクエストは完了を待たせ、失敗・タイムアウトした場合は 503 を返す"""
+
+    def __init__(self, app, warmup=warm_up):
+        self.app = app
+        self.warmup = warmup
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and not self.warmup.ready and scope["path"] not in WARMUP_EXEMPT_PATHS
+                and not await self.warmup.wait()):
+            body = json.dumps({"detail": "起動準備中です。しばらくしてから再度お試しください"},
+                              ensure_ascii=False).encode("utf-8")
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"5"),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        await self.app(scope, receive, send)
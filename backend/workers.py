@@ -0,0 +1,188 @@
+"""
+複数ワーカー（uvicorn --workers）で動かすための調整
+WEB_CONCURRENCY が2以上のときに有効になり、次の3つを提供します
+- 起動処理のファイルロック（スキーマ作成や texts.json の取り込みを同時に行わない）
+- 書き込みのファイルロック（SQLiteへの書き込みトランザクションをプロセスをまたいで1本にする）
+- 共有メモリ（mmap）上の世代カウンタ（他のワーカーの書き込みを検知してメモリ上のキャッシュを更新する）
+"""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from database import SQLALCHEMY_DATABASE_URL, IS_SQLITE
+from log import logger
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+MULTI_WORKER = WEB_CONCURRENCY > 1
+# ロックファイルと世代カウンタを置くディレクトリ（既定ではDBのURLごとに一時ディレクトリを使う）
+WORKER_STATE_DIR = os.getenv("WORKER_STATE_DIR") or os.path.join(
+    tempfile.gettempdir(), "renu-" + hashlib.sha1(SQLALCHEMY_DATABASE_URL.encode()).hexdigest()[:12]
+)
+# 他のワーカーの書き込みを確認する間隔（秒）
+WORKER_SYNC_INTERVAL = float(os.getenv("WORKER_SYNC_INTERVAL", "0.2"))
+
+# 世代カウンタの名前（texts: テキスト / rankings: ランキングの追加 / rankings_reset: 管理者による削除・編集）
+GENERATION_SLOTS = ("texts", "rankings", "rankings_reset")
+_SLOT_SIZE = 8
+
+
+class FileLock:
+    """プロセス間の排他ロック（同じプロセス内のスレッド間もロックする）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        import fcntl  # Unix のみ（複数ワーカーモードでだけ使う）
+        self._thread_lock.acquire()
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a+b")
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        import fcntl
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class GenerationCounter:
+    """mmap したファイル上の64bitカウンタ。読み出しはシステムコールなしで行える"""
+
+    def __init__(self, path, slots=GENERATION_SLOTS):
+        self.slots = {name: index * _SLOT_SIZE for index, name in enumerate(slots)}
+        size = len(slots) * _SLOT_SIZE
+        self._lock = FileLock(path + ".lock")
+        with self._lock:
+            with open(path, "a+b") as f:
+                if os.fstat(f.fileno()).st_size < size:
+                    f.truncate(size)
+            self._file = open(path, "r+b")
+            self._map = mmap.mmap(self._file.fileno(), size)
+
+    def read(self, name):
+        return struct.unpack_from("<Q", self._map, self.slots[name])[0]
+
+    def bump(self, name):
+        with self._lock:
+            value = self.read(name) + 1
+            struct.pack_into("<Q", self._map, self.slots[name], value)
+            return value
+
+
+class WorkerSync:
+    """
+    世代カウンタを見て、他のワーカーが書き込んだ変更をこのワーカーのキャッシュに反映する
+    register(名前, 非同期関数) で反映処理を登録し、notify(名前) で自分の書き込みを他のワーカーへ知らせる
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.handlers = {}
+        self.seen = {}
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def register(self, name, handler):
+        self.handlers[name] = handler
+        self.seen[name] = self.counter.read(name)
+
+    def notify(self, name):
+        previous = self.seen.get(name)
+        value = self.counter.bump(name)
+        # 間に他のワーカーの更新がなければ、自分の更新は反映済みとして扱う
+        if previous is not None and value == previous + 1:
+            self.seen[name] = value
+
+    def changed(self):
+        return [name for name in self.handlers if self.counter.read(name) != self.seen[name]]
+
+    async def check(self):
+        """変更があった分の反映処理を実行する（変更がなければ共有メモリを読むだけ）"""
+        if not self.changed():
+            return
+        async with self._lock:
+            for name in self.changed():
+                value = self.counter.read(name)
+                try:
+                    await self.handlers[name]()
+                    self.seen[name] = value
+                except Exception as e:
+                    logger.error("ワーカー間の同期エラー (%s): %s", name, e)
+
+    async def start(self, interval=WORKER_SYNC_INTERVAL):
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker(interval))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _worker(self, interval):
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+
+def install_writer_lock(engine, lock):
+    """書き込み用エンジンのトランザクションの開始から終了まで、プロセス間の書き込みロックを持つ"""
+    held = threading.local()
+
+    @event.listens_for(engine, "begin")
+    def acquire(conn):
+        lock.acquire()
+        held.value = True
+
+    def release(conn):
+        if getattr(held, "value", False):
+            held.value = False
+            lock.release()
+
+    event.listen(engine, "commit", release)
+    event.listen(engine, "rollback", release)
+
+
+@contextmanager
+def startup_lock():
+    """起動処理を1ワーカーずつ実行する（単一プロセスの場合は何もしない）"""
+    if not MULTI_WORKER:
+        yield
+        return
+    with FileLock(os.path.join(WORKER_STATE_DIR, "startup.lock")):
+        yield
+
+
+worker_sync = None
+if MULTI_WORKER:
+    os.makedirs(WORKER_STATE_DIR, exist_ok=True)
+    worker_sync = WorkerSync(GenerationCounter(os.path.join(WORKER_STATE_DIR, "generations")))
+    if IS_SQLITE:
+        from database import engine
+        install_writer_lock(engine, FileLock(os.path.join(WORKER_STATE_DIR, "writer.lock")))
+    logger.info("複数ワーカーモード: WEB_CONCURRENCY=%d, 状態ディレクトリ %s", WEB_CONCURRENCY, WORKER_STATE_DIR)
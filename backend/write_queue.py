@@ -0,0 +1,121 @@
+"""
+グループコミットによる書き込みキュー
+短い時間窓に集まった挿入を1つのトランザクションにまとめ、コミット（fsync）の回数を減らします
+"""
+
+import asyncio
+import os
+
+from database import SessionLocal, run_db
+
+# まとめる時間窓（秒）と1トランザクションあたりの最大件数
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW", "0.005"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "100"))
+# "on": まとめて書き込む / "off": 1件ずつコミットする
+WRITE_BATCH_MODE = os.getenv("WRITE_BATCH_MODE", "on")
+
+
+class WriteBatcher:
+    """
+    submit() に渡された関数 func(db) を同じトランザクション内でまとめて実行する
+    func は行を追加して flush し、呼び出し元に返す値（生成されたIDを含む辞書など）を返す
+    """
+
+    def __init__(self, session_factory=SessionLocal, window=WRITE_BATCH_WINDOW, max_size=WRITE_BATCH_MAX_SIZE):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_size = max_size
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self):
+        """キューで待っている書き込みの件数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running or WRITE_BATCH_MODE != "on":
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """キューに残っている書き込みを処理してから停止する"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, func):
+        """書き込みをキューに入れ、コミット後に func の戻り値を返す"""
+        if not self.running:
+            # キューが動いていない場合（起動処理を通らない実行など）は1件ずつコミットする
+            return (await run_db(self._execute, [func]))[0]
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((func, future))
+        return await future
+
+    def _execute(self, funcs):
+        """同期処理: 全ての func を1トランザクションで実行する"""
+        db = self.session_factory()
+        try:
+            results = [func(db) for func in funcs]
+            db.commit()
+            return results
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run_batch(self, batch):
+        funcs = [func for func, _ in batch]
+        try:
+            results = await run_db(self._execute, funcs)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # どれか1件が失敗した場合は、他の書き込みを巻き込まないよう1件ずつやり直す
+            for item in batch:
+                await self._run_batch([item])
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._run_batch(batch)
+
+
+write_batcher = WriteBatcher()
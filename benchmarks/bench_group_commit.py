@@ -0,0 +1,74 @@
+"""
+グループコミットのベンチマーク
+同時に送信されたランキングを1件ずつコミットする場合とまとめてコミットする場合の1秒あたりの挿入件数を比較します
+
+使い方: python benchmarks/bench_group_commit.py [--clients 50] [--rounds 20]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--clients", type=int, default=50, help="同時に送信するクライアント数")
+parser.add_argument("--rounds", type=int, default=20, help="各クライアントの送信回数")
+args = parser.parse_args()
+
+# バックエンドのモジュールを読み込む前に一時DBを指定する
+tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from database import engine, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS  # noqa: E402
+from models import Ranking  # noqa: E402
+from ranking_queries import ranking_to_dict  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from write_queue import WriteBatcher  # noqa: E402
+
+
+def make_insert(i):
+    def insert_ranking(db):
+        ranking = Ranking(nickname=f"player{i % 40}", wpm=100.0 + i % 50, accuracy=95.0,
+                          errors=1, time_elapsed=60.0, characters_typed=100,
+                          difficulty="medium", created_at=datetime.utcnow())
+        db.add(ranking)
+        db.flush()
+        return ranking_to_dict(ranking)
+    return insert_ranking
+
+
+async def run(batching):
+    batcher = WriteBatcher()
+    if batching:
+        await batcher.start()
+
+    async def client(c):
+        for r in range(args.rounds):
+            await batcher.submit(make_insert(c * args.rounds + r))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    if batching:
+        await batcher.stop()
+    total = args.clients * args.rounds
+    batches = batcher.batches if batching else total
+    return total / elapsed, batches
+
+
+def main():
+    run_migrations(engine)
+    print(f"journal_mode={SQLITE_JOURNAL_MODE} synchronous={SQLITE_SYNCHRONOUS} "
+          f"clients={args.clients} rounds={args.rounds}")
+    for batching in (False, True):
+        rate, batches = asyncio.run(run(batching))
+        label = "まとめてコミット" if batching else "1件ずつコミット"
+        print(f"{label}: {rate:8.0f} 件/秒 (トランザクション数 {batches})")
+
+
+if __name__ == "__main__":
+    main()
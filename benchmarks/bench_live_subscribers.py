@@ -0,0 +1,127 @@
+"""
+ランキング差分配信（SSE）の負荷テスト
+一時DBでサーバーを起動し、多数の購読者を接続したままランキングを送信して、
+全購読者に差分が届くまでの時間とサーバーのメモリ使用量を計測します
+
+使い方: python benchmarks/bench_live_subscribers.py [--subscribers 500] [--submissions 20]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--subscribers", type=int, default=500, help="同時に接続する購読者数")
+parser.add_argument("--submissions", type=int, default=20, help="接続中に送信するランキング数")
+args = parser.parse_args()
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    """サーバープロセスの常駐メモリ（Linuxのみ）"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+async def subscriber(client, url, ready, received, done):
+    async with client.stream("GET", url) as response:
+        ready.release()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line == "" and event == "diff":
+                received.append(time.perf_counter())
+                if done.is_set():
+                    return
+                event = None
+
+
+async def run(base_url, server_pid):
+    limits = httpx.Limits(max_connections=args.subscribers + 10, max_keepalive_connections=args.subscribers + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+        ready = asyncio.Semaphore(0)
+        done = asyncio.Event()
+        received = []
+        baseline = rss_mb(server_pid)
+        tasks = [
+            asyncio.create_task(subscriber(client, "/api/rankings/stream?limit=10", ready, received, done))
+            for _ in range(args.subscribers)
+        ]
+        started = time.perf_counter()
+        for _ in range(args.subscribers):
+            await ready.acquire()
+        print(f"購読者 {args.subscribers} 件の接続: {time.perf_counter() - started:.2f} 秒, "
+              f"サーバーのメモリ {baseline:.1f} MB → {rss_mb(server_pid):.1f} MB")
+
+        latencies = []
+        for i in range(args.submissions):
+            # 毎回1位になる記録を送り、全購読者に差分が届くまでを計る
+            before = len(received)
+            sent = time.perf_counter()
+            await client.post("/api/rankings", json={
+                "nickname": f"bench{i}", "wpm": 1000.0 + i, "accuracy": 100.0, "errors": 0,
+                "timeElapsed": 60.0, "charactersTyped": 1000 + i, "difficulty": "medium"
+            })
+            while len(received) - before < args.subscribers:
+                await asyncio.sleep(0.001)
+            latencies.append(max(received[before:]) - sent)
+
+        done.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    print(f"全購読者への配信完了まで: 中央値 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"最大 {latencies[-1] * 1000:.1f} ms ({args.submissions} 回)")
+
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}", LOG_LEVEL="WARNING",
+               RATE_LIMIT_MODE="off",
+               # 全購読者が同じIPから接続するため、購読数の上限を購読者数に合わせる
+               LIVE_MAX_SUBSCRIBERS=str(args.subscribers), LIVE_MAX_SUBSCRIBERS_PER_CLIENT=str(args.subscribers))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--log-level", "warning", "--backlog", str(args.subscribers * 2)],
+        env=env
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        asyncio.run(run(base_url, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+WPM順位推定の精度と速度のベンチマーク
+合成したランキング（既定100万件）を一時DBに入れ、ヒストグラムから推定した順位が
+厳密な値（WPMの昇順リストの二分探索）と報告された誤差の範囲内で一致するかを確認し、
+COUNT(*) との速度を比較します
+
+使い方: python benchmarks/bench_percentile_accuracy.py [--rows 1000000] [--queries 2000]
+"""
+
+import argparse
+import bisect
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="合成するランキングの件数")
+parser.add_argument("--queries", type=int, default=2000, help="照合するWPMの個数")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+# バックエンドのモジュールを読み込む前に一時DBを指定する
+tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import func, insert  # noqa: E402
+
+from database import engine, ReadSessionLocal  # noqa: E402
+from models import Ranking  # noqa: E402
+from percentiles import PercentileSketch  # noqa: E402
+from ranking_queries import window_start  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+DIFFICULTIES = ("easy", "medium", "hard")
+MEANS = {"easy": 180.0, "medium": 140.0, "hard": 100.0}
+
+
+def generate(now):
+    """難易度ごとに正規分布に近いWPMと、直近60日に散らばった作成日時を作る"""
+    rng = random.Random(args.seed)
+    rows = []
+    for _ in range(args.rows):
+        difficulty = rng.choice(DIFFICULTIES)
+        rows.append({
+            "nickname": f"player{rng.randrange(5000)}",
+            "wpm": round(max(rng.gauss(MEANS[difficulty], 45.0), 1.0), 2),
+            "accuracy": 95.0,
+            "errors": 0,
+            "time_elapsed": 60.0,
+            "characters_typed": 100,
+            "difficulty": difficulty,
+            "created_at": now - timedelta(seconds=rng.randrange(60 * 86400)),
+        })
+    return rows
+
+
+def main():
+    run_migrations(engine)
+    now = datetime.utcnow()
+    rows = generate(now)
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, len(rows), 50000):
+            conn.execute(insert(Ranking), rows[offset:offset + 50000])
+    print(f"挿入: {len(rows)}件 {time.perf_counter() - started:.1f} 秒")
+
+    sketch = PercentileSketch()
+    started = time.perf_counter()
+    sketch.load()
+    print(f"ヒストグラム構築（起動時の読み込み）: {time.perf_counter() - started:.2f} 秒")
+
+    rng = random.Random(args.seed + 1)
+    failures = 0
+    worst = 0.0
+    errors = []
+    for date_filter in (None, "week", "today"):
+        start = window_start(date_filter, now)
+        first_day = start.date() if start else None
+        for difficulty in (None,) + DIFFICULTIES:
+            # 推定側と同じく、期間の境界は日単位で扱う
+            values = sorted(
+                row["wpm"] for row in rows
+                if (difficulty is None or row["difficulty"] == difficulty)
+                and (first_day is None or row["created_at"].date() >= first_day)
+            )
+            for _ in range(args.queries // 12):
+                wpm = round(rng.uniform(0, 350), 2)
+                result = sketch.percentile(wpm, difficulty, date_filter, now)
+                exact = 100.0 * bisect.bisect_left(values, wpm) / len(values)
+                difference = abs(result["percentile"] - exact)
+                worst = max(worst, difference)
+                errors.append(result["error"])
+                if difference > result["error"] + 1e-9:
+                    failures += 1
+    print(f"照合: {len(errors)}件, 誤差範囲外 {failures}件, 最大誤差 {worst:.4f}%, "
+          f"報告された誤差上限の平均 {sum(errors) / len(errors):.4f}%")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        sketch.percentile(150.0, "medium")
+    sketch_elapsed = (time.perf_counter() - started) / 1000
+
+    db = ReadSessionLocal()
+    try:
+        started = time.perf_counter()
+        for _ in range(10):
+            db.query(func.count(Ranking.id)).filter(Ranking.difficulty == "medium", Ranking.wpm < 150.0).scalar()
+        count_elapsed = (time.perf_counter() - started) / 10
+    finally:
+        db.close()
+    print(f"1回あたり: ヒストグラム {sketch_elapsed * 1e6:.0f} µs / COUNT(*) {count_elapsed * 1e3:.1f} ms")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+記録の妥当性チェック（一括判定）のベンチマーク
+一時DBに合成したランキング（既定100万件）を入れ、一部に矛盾する記録・極端に速い記録を混ぜてから
+plausibility.rescore の読み込み・判定・書き戻しの時間と、混ぜた記録の検出数を表示します
+判定の実行中に別のスレッドからランキングを登録し続け、書き込みの待ち時間（最大）も表示します
+
+使い方: python benchmarks/bench_plausibility.py [--rows 1000000] [--bad-ratio 0.01]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="合成するランキングの件数")
+parser.add_argument("--texts", type=int, default=300, help="テキストの種類数")
+parser.add_argument("--bad-ratio", type=float, default=0.01, help="不自然な記録の割合")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+# バックエンドのモジュールを読み込む前に一時DBを指定する
+tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from database import engine, read_engine  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import Ranking  # noqa: E402
+import plausibility  # noqa: E402
+
+DIFFICULTIES = ("easy", "medium", "hard")
+MEANS = {"easy": 110.0, "medium": 150.0, "hard": 190.0}
+# 混ぜる不自然な記録の種類（期待する判定理由）
+BAD_KINDS = ("wpm_mismatch", "accuracy_mismatch", "wpm_limit", "outlier")
+
+
+def generate(rng, now):
+    """正常な記録と、種類ごとに同じ数の不自然な記録を作り、不自然な記録の (行番号, 種類) も返す"""
+    rows = []
+    injected = {}
+    for index in range(args.rows):
+        difficulty = rng.choice(DIFFICULTIES)
+        time_elapsed = rng.uniform(20.0, 120.0)
+        characters_typed = max(round(rng.gauss(MEANS[difficulty], 35.0) * time_elapsed / 60), 1)
+        errors = rng.randrange(15)
+        wpm = round(characters_typed / (time_elapsed / 60), 2)
+        accuracy = round(characters_typed / (characters_typed + errors) * 100, 2)
+        if rng.random() < args.bad_ratio:
+            kind = BAD_KINDS[len(injected) % len(BAD_KINDS)]
+            if kind == "wpm_mismatch":
+                wpm = round(wpm * 3, 2)
+            elif kind == "accuracy_mismatch":
+                accuracy = 100.0
+                errors += 20
+            elif kind == "wpm_limit":
+                characters_typed = round(plausibility.MAX_PLAUSIBLE_WPM * 2 * time_elapsed / 60)
+                wpm = round(characters_typed / (time_elapsed / 60), 2)
+                accuracy = round(characters_typed / (characters_typed + errors) * 100, 2)
+            else:
+                # 式には合うが同じ難易度の記録と比べて極端に速い
+                characters_typed = round(MEANS[difficulty] * 5 * time_elapsed / 60)
+                wpm = round(characters_typed / (time_elapsed / 60), 2)
+                accuracy = round(characters_typed / (characters_typed + errors) * 100, 2)
+            injected[index + 1] = kind
+        rows.append({
+            "nickname": f"player{rng.randrange(50000)}",
+            "text_content_id": rng.randrange(1, args.texts + 1),
+            "wpm": wpm,
+            "accuracy": accuracy,
+            "errors": errors,
+            "time_elapsed": time_elapsed,
+            "characters_typed": characters_typed,
+            "difficulty": difficulty,
+            "created_at": now - timedelta(seconds=rng.randrange(90 * 86400)),
+        })
+    return rows, injected
+
+
+def submit_during(stop, latencies):
+    """stop が立つまで 20ms ごとにランキングを1件ずつ登録し、書き込みにかかった時間を記録する"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(insert(Ranking), [{
+                "nickname": "bench-submit", "wpm": 120.0, "accuracy": 100.0, "errors": 0, "time_elapsed": 60.0,
+                "characters_typed": 120, "difficulty": "easy", "created_at": datetime.utcnow(),
+            }])
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.02)
+
+
+def main():
+    run_migrations(engine)
+    rng = random.Random(args.seed)
+    rows, injected = generate(rng, datetime.utcnow())
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, len(rows), 50000):
+            conn.execute(insert(Ranking), rows[offset:offset + 50000])
+    print(f"ランキング挿入: {len(rows)}件 {time.perf_counter() - started:.1f} 秒（不自然な記録 {len(injected)}件）")
+
+    stop = threading.Event()
+    latencies = []
+    submitter = threading.Thread(target=submit_during, args=(stop, latencies))
+    submitter.start()
+    try:
+        summary = plausibility.rescore(engine, read_engine=read_engine)
+    finally:
+        stop.set()
+        submitter.join()
+    print(f"一括判定: 読み込み {summary['load_seconds']:.2f} 秒 / 判定 {summary['evaluate_seconds']:.2f} 秒 / "
+          f"合計（書き戻し・集計の作り直しを含む） {summary['total_seconds']:.2f} 秒")
+    for flag, count in sorted(summary["flagged"].items()):
+        print(f"  {flag:18s} {count:8d}")
+    print(f"判定中のランキング登録: {len(latencies)}件、最大 {max(latencies) * 1e3:.1f} ms / "
+          f"中央値 {sorted(latencies)[len(latencies) // 2] * 1e3:.1f} ms")
+
+    with engine.connect() as conn:
+        flags = dict(conn.execute(select(Ranking.id, Ranking.flag).where(Ranking.flag.isnot(None))).all())
+        visible = conn.scalar(select(func.count(Ranking.id)).where(Ranking.flag.is_(None)))
+    for kind in BAD_KINDS:
+        ids = [ranking_id for ranking_id, injected_kind in injected.items() if injected_kind == kind]
+        detected = sum(1 for ranking_id in ids if flags.get(ranking_id) == kind)
+        print(f"検出 {kind:18s} {detected:6d} / {len(ids):6d}")
+    false_positives = sum(1 for ranking_id in flags if ranking_id not in injected)
+    print(f"正常な記録へのフラグ: {false_positives}件（{false_positives / max(len(rows) - len(injected), 1):.4%}）"
+          f" / 表示される記録 {visible}件")
+
+    # 2回目は変更がないため、読み込みと判定の時間だけになる
+    again = plausibility.rescore(engine, read_engine=read_engine)
+    print(f"2回目（変更 {again['changed']}件）: {again['total_seconds']:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+エンコード済みレスポンスキャッシュのベンチマーク
+/api/game/texts と /api/rankings について、従来どおり毎回 FastAPI のエンコーダでJSONにする場合と、
+エンコード・圧縮済みの本文を返す場合の1リクエストあたりのCPU時間と転送量を比較します
+
+使い方: python benchmarks/bench_response_cache.py [--requests 2000] [--rankings 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--requests", type=int, default=2000, help="各エンドポイントへのリクエスト数")
+parser.add_argument("--rankings", type=int, default=200, help="事前に登録するランキング数")
+args = parser.parse_args()
+
+# バックエンドのモジュールを読み込む前に一時DBを指定する
+tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("RATE_LIMIT_MODE", "off")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from leaderboard import leaderboard  # noqa: E402
+from models import Ranking  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from schemas import RankingResponse  # noqa: E402
+from text_catalog import text_catalog  # noqa: E402
+
+
+# 比較用: キャッシュを使わない従来の実装
+@main.app.get("/bench/texts")
+async def texts_uncached(with_automata: bool = False):
+    if with_automata:
+        return text_catalog.get_active_with_automata()
+    return text_catalog.get_active()
+
+
+@main.app.get("/bench/rankings", response_model=List[RankingResponse])
+async def rankings_uncached(limit: int = 10):
+    return leaderboard.top(None, None, limit)
+
+
+def seed():
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(Ranking, [
+            {"nickname": f"player{i}", "wpm": 100.0 + i % 300, "accuracy": 95.0, "errors": 0,
+             "time_elapsed": 60.0, "characters_typed": 100, "difficulty": "medium",
+             "created_at": datetime.utcnow()}
+            for i in range(args.rankings)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    leaderboard.load()
+
+
+def measure(client, url, headers):
+    client.get(url, headers=headers)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    size = 0
+    for _ in range(args.requests):
+        response = client.get(url, headers=headers)
+        size = int(response.headers.get("content-length", len(response.content)))
+    return ((time.process_time() - cpu) / args.requests, (time.perf_counter() - wall) / args.requests, size)
+
+
+def run_benchmark():
+    seed()
+    headers = {"Accept-Encoding": "br, gzip"}
+    cases = [
+        ("texts", "/bench/texts", "/api/game/texts"),
+        ("texts+automata", "/bench/texts?with_automata=true", "/api/game/texts?with_automata=true"),
+        ("rankings limit=100", "/bench/rankings?limit=100", "/api/rankings?limit=100"),
+    ]
+    with TestClient(main.app) as client:
+        etag = client.get("/api/game/texts", headers=headers).headers["etag"]
+        for label, uncached_url, cached_url in cases:
+            before = measure(client, uncached_url, {})
+            after = measure(client, cached_url, headers)
+            print(f"{label:20s} CPU {before[0] * 1e6:7.0f} µs → {after[0] * 1e6:7.0f} µs "
+                  f"(-{(1 - after[0] / before[0]) * 100:.0f}%), "
+                  f"応答 {before[1] * 1e6:7.0f} µs → {after[1] * 1e6:7.0f} µs, "
+                  f"サイズ {before[2]} → {after[2]} バイト")
+        not_modified = measure(client, "/api/game/texts", {**headers, "If-None-Match": etag})
+        print(f"{'texts (304)':20s} CPU {not_modified[0] * 1e6:7.0f} µs")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,52 @@
+"""
+ローマ字入力オートマトンのコンパイル時間のベンチマーク
+texts.json の全テキストについて、初回コンパイルとハッシュキャッシュからの取得の時間、オートマトンのサイズを計測します
+
+使い方: python benchmarks/bench_romaji_compile.py [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--repeat", type=int, default=20, help="計測の繰り返し回数")
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from romaji import AutomatonCache, compile_text  # noqa: E402
+from text_store import TEXTS_FILE  # noqa: E402
+
+
+def main():
+    with open(TEXTS_FILE, 'r', encoding='utf-8') as f:
+        texts = json.load(f).get('texts', [])
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        automata = [compile_text(text["content"], text.get("romaji")) for text in texts]
+    compile_elapsed = (time.perf_counter() - started) / args.repeat
+
+    cache = AutomatonCache()
+    for text in texts:
+        cache.get(text["content"], text.get("romaji"))
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in texts:
+            cache.get(text["content"], text.get("romaji"))
+    cached_elapsed = (time.perf_counter() - started) / args.repeat
+
+    states = [len(automaton["transitions"]) for automaton in automata if automaton]
+    size = len(json.dumps(automata, ensure_ascii=False).encode("utf-8"))
+    print(f"テキスト数: {len(texts)}")
+    print(f"コンパイル:       {compile_elapsed * 1000:8.2f} ms (1件あたり {compile_elapsed / len(texts) * 1e6:.0f} µs)")
+    print(f"キャッシュ取得:   {cached_elapsed * 1000:8.2f} ms")
+    print(f"状態数: 平均 {sum(states) / len(states):.1f} / 最大 {max(states)}")
+    print(f"JSONサイズ: {size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+同時の読み取りをまとめる（single-flight）効果の確認
+一時DBにランキングを入れ、同じ条件の /api/rankings（プレイヤーごとのベスト記録。SQLで処理される）に N 件の要求を
+同時に送り、実行されたDBクエリの数と所要時間をまとめる場合（SINGLEFLIGHT_MODE=on）とまとめない場合で比較します
+読み込み前の /api/game/texts への同時の要求も、テキストの読み込みが1回になることを確認します
+まとめる場合に N 件の要求でクエリがちょうど1回でなければ終了コード1で終わります
+
+使い方: python benchmarks/bench_singleflight.py [--concurrency 100] [--rankings 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--concurrency", type=int, default=100, help="同時に送る要求の数")
+parser.add_argument("--rankings", type=int, default=200000, help="事前に登録するランキング数")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+# バックエンドのモジュールを読み込む前に一時DBを指定する
+tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("RATE_LIMIT_MODE", "off")
+os.environ.setdefault("MAX_CONCURRENT_REQUESTS", "100000")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+import main  # noqa: E402
+import singleflight  # noqa: E402
+from database import engine, read_engine  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import Ranking  # noqa: E402
+from text_catalog import text_catalog  # noqa: E402
+
+# テーブルごとに実行された SELECT の数
+queries = {"rankings": 0, "text_contents": 0}
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith("SELECT"):
+        for table in queries:
+            if f"FROM {table}" in statement:
+                queries[table] += 1
+
+
+def seed():
+    run_migrations(engine)
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for offset in range(0, args.rankings, 50000):
+            rows = []
+            for _ in range(offset, min(offset + 50000, args.rankings)):
+                characters_typed = max(round(rng.gauss(140.0, 45.0)), 1)
+                rows.append({
+                    "nickname": f"player{rng.randrange(20000)}", "wpm": float(characters_typed), "accuracy": 100.0,
+                    "errors": 0, "time_elapsed": 60.0, "characters_typed": characters_typed,
+                    "difficulty": rng.choice(("easy", "medium", "hard")),
+                    "created_at": now - timedelta(seconds=rng.randrange(30 * 86400)),
+                })
+            conn.execute(insert(Ranking), rows)
+
+
+async def burst(client, url, table):
+    """同じ要求を同時に送り、(クエリ数, 所要時間, 失敗数) を返す"""
+    before = queries[table]
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(url) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for response in responses if response.status_code != 200)
+    return queries[table] - before, elapsed, failed
+
+
+def report(label, result):
+    count, elapsed, failed = result
+    print(f"{label:44s} クエリ {count:4d}回  {elapsed * 1e3:8.1f} ms" + (f"  失敗 {failed}件" if failed else ""))
+
+
+async def run():
+    ok = True
+    async with main.app.router.lifespan_context(main.app):
+        await main.warm_up.wait(timeout=None)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            url = "/api/rankings?limit=50&best_per_player=true"
+            for mode in ("off", "on"):
+                singleflight.SINGLEFLIGHT_MODE = mode
+                main.rankings_flight.clear()
+                result = await burst(client, url, "rankings")
+                report(f"/api/rankings 同時{args.concurrency}件（{mode}）", result)
+                if mode == "on":
+                    ok &= result[0] == 1
+                    # 保持期間内の次の要求はクエリを実行しない
+                    report("  続けて同じ要求（保持期間内）", await burst(client, url, "rankings"))
+                    # ランキングが更新されると版が変わり、再び1回だけ実行する
+                    await client.post("/api/rankings", json={
+                        "nickname": "bench", "wpm": 100.0, "accuracy": 100.0, "errors": 0,
+                        "timeElapsed": 60.0, "charactersTyped": 100, "difficulty": "easy"
+                    })
+                    result = await burst(client, url, "rankings")
+                    report("  ランキング登録後", result)
+                    ok &= result[0] == 1
+
+            # 起動直後（テキスト未読み込み）の状態にする
+            # （カタログのロックでも読み込みは1回になるが、まとめない場合は待つ要求ごとにスレッドを使う）
+            singleflight.SINGLEFLIGHT_MODE = "on"
+            text_catalog.loaded = False
+            result = await burst(client, "/api/game/texts", "text_contents")
+            report(f"/api/game/texts 読み込み前に同時{args.concurrency}件", result)
+            ok &= result[0] == 1
+    return ok
+
+
+def run_benchmark():
+    seed()
+    event.listen(read_engine, "before_cursor_execute", count_query)
+    if read_engine is not engine:
+        event.listen(engine, "before_cursor_execute", count_query)
+    ok = asyncio.run(run())
+    print("OK: 同時の同じ要求はクエリ1回にまとめられました" if ok else "NG: クエリが1回になりませんでした")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    run_benchmark()
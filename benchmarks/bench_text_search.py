@@ -0,0 +1,122 @@
+"""
+テキスト検索のベンチマーク
+合成したテキスト（既定10万件）を一時DBに入れ、FTS5（trigram）索引での検索と、
+全件を LIKE で走査する場合の1クエリあたりの時間を比較します
+
+使い方: python benchmarks/bench_text_search.py [--texts 100000] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--texts", type=int, default=100000, help="合成するテキストの件数")
+parser.add_argument("--queries", type=int, default=200, help="種類ごとのクエリ数")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+# バックエンドのモジュールを読み込む前に一時DBを指定する
+tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from database import engine, ReadSessionLocal  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import TextContent  # noqa: E402
+import text_search  # noqa: E402
+
+# 本文を組み立てる語（ひらがな・カタカナ・漢字・英字を混ぜる）
+WORDS = [
+    "きょうは", "いいてんき", "ですね", "がっこう", "ともだち", "あした", "れんしゅう", "たいぴんぐ",
+    "コンピュータ", "プログラム", "キーボード", "インターネット", "東京", "大阪", "新幹線", "富士山",
+    "桜", "図書館", "天気予報", "音楽", "typing", "keyboard", "python", "sqlite",
+]
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def seed(rng):
+    rows = []
+    for index in range(args.texts):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 30))]
+        rows.append({
+            "title": f"{rng.choice(WORDS)}{rng.choice(WORDS)}{index}",
+            "content": "".join(words) + f"番号{index}",
+            "difficulty": rng.choice(DIFFICULTIES),
+            "is_active": rng.random() < 0.9,
+        })
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, len(rows), 20000):
+            conn.execute(insert(TextContent), rows[offset:offset + 20000])
+    print(f"挿入（索引の更新を含む）: {len(rows)}件 {time.perf_counter() - started:.1f} 秒")
+
+
+def measure(label, queries, **filters):
+    db = ReadSessionLocal()
+    try:
+        text_search.search_texts(db, queries[0], **filters)
+        started = time.perf_counter()
+        totals = 0
+        for query in queries:
+            totals += text_search.search_texts(db, query, **filters)["total"]
+        elapsed = (time.perf_counter() - started) / len(queries)
+    finally:
+        db.close()
+    print(f"{label:36s} {elapsed * 1e3:8.2f} ms/クエリ (平均ヒット {totals / len(queries):.0f}件)")
+    return elapsed
+
+
+def measure_like_scan(queries):
+    """比較用: 索引を使わずに全件を LIKE で走査する"""
+    db = ReadSessionLocal()
+    try:
+        started = time.perf_counter()
+        for query in queries:
+            pattern = f"%{query}%"
+            db.execute(text(
+                "SELECT id, title FROM text_contents WHERE title LIKE :p OR content LIKE :p ORDER BY id DESC LIMIT 50"
+            ), {"p": pattern}).all()
+            db.execute(text(
+                "SELECT COUNT(*) FROM text_contents WHERE title LIKE :p OR content LIKE :p"
+            ), {"p": pattern}).scalar()
+        elapsed = (time.perf_counter() - started) / len(queries)
+    finally:
+        db.close()
+    print(f"{'LIKE 全件走査（比較用）':36s} {elapsed * 1e3:8.2f} ms/クエリ")
+    return elapsed
+
+
+def main():
+    run_migrations(engine)
+    rng = random.Random(args.seed)
+    seed(rng)
+    db = ReadSessionLocal()
+    try:
+        print(f"FTS5 索引: {'あり' if text_search.fts_available(db) else 'なし'}")
+    finally:
+        db.close()
+
+    # 絞り込まれる語（まれな番号）と、多くのテキストに現れる語
+    rare = [f"番号{rng.randrange(args.texts)}" for _ in range(args.queries)]
+    common = [rng.choice([word for word in WORDS if len(word) >= 3]) for _ in range(args.queries)]
+    short = [rng.choice(["東京", "大阪", "桜", "音楽"]) for _ in range(max(1, args.queries // 10))]
+
+    fts = measure("FTS5: まれな語", rare)
+    measure("FTS5: よく現れる語", common)
+    measure("FTS5: よく現れる語 + 難易度・有効", common, difficulty="hard", is_active=True)
+    measure("FTS5: 2語（AND）", [f"{a} {b}" for a, b in zip(rare, common)])
+    measure("LIKE: 2文字以下の語", short)
+    measure("絞り込みのみ（語なし）", [None] * args.queries, difficulty="medium")
+    scan = measure_like_scan(rare[: max(1, args.queries // 10)])
+    print(f"まれな語の検索: FTS5 は LIKE 全件走査の {scan / fts:.0f} 倍速い")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+複数ワーカーモードのスループットのベンチマーク
+ワーカー数を変えて一時DBでサーバーを起動し、テキスト取得・ランキング取得・ランキング送信を混ぜた負荷をかけて
+1秒あたりの処理件数を比較します（負荷をかけるクライアントも別プロセスで動かします）
+
+使い方: python benchmarks/bench_workers.py [--workers 1,2,3,4] [--duration 10] [--clients 4] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--workers", default="1,2,3,4", help="試すワーカー数（カンマ区切り）")
+parser.add_argument("--duration", type=float, default=10.0, help="各ワーカー数での計測時間（秒）")
+parser.add_argument("--clients", type=int, default=4, help="負荷をかけるクライアントのプロセス数")
+parser.add_argument("--concurrency", type=int, default=32, help="クライアント1プロセスあたりの同時リクエスト数")
+parser.add_argument("--write-ratio", type=float, default=0.1, help="リクエストのうちランキング送信の割合")
+args = parser.parse_args()
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def client_loop(base_url, duration, seed):
+    rng = random.Random(seed)
+    done = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal done, errors
+            while time.perf_counter() < deadline:
+                roll = rng.random()
+                if roll < args.write_ratio:
+                    characters_typed = rng.randrange(50, 400)
+                    request = client.post("/api/rankings", json={
+                        "nickname": f"player{rng.randrange(1000)}", "wpm": float(characters_typed),
+                        "accuracy": round(characters_typed / (characters_typed + 1) * 100, 2), "errors": 1,
+                        "timeElapsed": 60.0, "charactersTyped": characters_typed,
+                        "difficulty": rng.choice(["easy", "medium", "hard"])
+                    })
+                elif roll < 0.55:
+                    request = client.get("/api/rankings?limit=50", headers={"Accept-Encoding": "gzip"})
+                else:
+                    request = client.get("/api/game/texts", headers={"Accept-Encoding": "gzip"})
+                try:
+                    response = await request
+                    if response.status_code >= 400:
+                        errors += 1
+                    done += 1
+                except httpx.HTTPError:
+                    errors += 1
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return done, errors
+
+
+def run_client(base_url, duration, seed, results):
+    results.put(asyncio.run(client_loop(base_url, duration, seed)))
+
+
+def measure(workers):
+    tmpdir = tempfile.mkdtemp(prefix="renu-bench-")
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+               WEB_CONCURRENCY=str(workers), WORKER_STATE_DIR=tmpdir, LOG_LEVEL="WARNING",
+               RATE_LIMIT_MODE="off", MAX_CONCURRENT_REQUESTS="100000")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(base_url + "/api/game/texts")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        time.sleep(1.0)  # 全ワーカーの起動を待つ
+
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=run_client, args=(base_url, args.duration, seed, results))
+            for seed in range(args.clients)
+        ]
+        for process in clients:
+            process.start()
+        totals = [results.get() for _ in clients]
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    done = sum(count for count, _ in totals)
+    errors = sum(count for _, count in totals)
+    return done / args.duration, errors
+
+
+def main():
+    print(f"CPUコア数: {os.cpu_count()}, クライアント {args.clients} プロセス × 同時 {args.concurrency}, "
+          f"送信の割合 {args.write_ratio:.0%}")
+    baseline = None
+    for workers in [int(value) for value in args.workers.split(",")]:
+        rate, errors = measure(workers)
+        baseline = baseline or rate
+        print(f"ワーカー {workers}: {rate:8.0f} 件/秒 (x{rate / baseline:.2f}), エラー {errors}件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""
+ゲームの一連の流れの負荷試験
+一時DBで backend/main.py の app を動かし（プロセス内の ASGI トランスポート、またはローカルの uvicorn）、
+N人のプレイヤーが同時に「テキスト取得 → ゲームセッション作成 → ランキング送信 → ランキング取得」を繰り返したときの
+スループットとエンドポイントごとの p50 / p95 / p99 を計測します
+
+シナリオ
+- cold: 起動直後（ウォームアップなし）。起動時間と各エンドポイントの最初の1回の応答時間も記録する
+- warm: ウォームアップ後の定常状態
+- large-texts: 大きな texts.json（--texts 件）を取り込んだ状態
+- million-rankings: rankings テーブルに --rankings 件（既定100万件）が入った状態
+
+結果は benchmarks/results/loadtest-<シナリオ>.json に保存します。--save-baseline で benchmarks/baselines/ に基準値として保存し、
+--compare で基準値と比べて p95 やスループットが --tolerance を超えて悪化していれば終了コード1で終わります
+
+使い方: python benchmarks/loadtest.py [--scenario warm,cold,large-texts,million-rankings|all] [--players 50] [--rounds 5]
+                                      [--mode asgi|uvicorn] [--save-baseline] [--compare] [--tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+SCENARIOS = ("cold", "warm", "large-texts", "million-rankings")
+ENDPOINTS = ("texts", "session", "submit", "rankings")
+DIFFICULTIES = ("easy", "medium", "hard")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "..", "backend")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINES_DIR = os.path.join(BENCH_DIR, "baselines")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--scenario", default="warm", help="実行するシナリオ（カンマ区切り、または all）")
+parser.add_argument("--players", type=int, default=50, help="同時に遊ぶプレイヤー数")
+parser.add_argument("--rounds", type=int, default=5, help="プレイヤー1人あたりのゲーム回数")
+parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi",
+                    help="asgi: プロセス内で app を直接呼ぶ / uvicorn: ローカルの uvicorn を起動してHTTPで呼ぶ")
+parser.add_argument("--texts", type=int, default=20000, help="large-texts で取り込むテキスト数")
+parser.add_argument("--rankings", type=int, default=1000000, help="million-rankings で事前に入れるランキング数")
+parser.add_argument("--rate-limit", action="store_true", help="クライアントごとのレート制限を有効にしたまま計測する")
+parser.add_argument("--seed", type=int, default=1)
+parser.add_argument("--save-baseline", action="store_true", help="結果を基準値として保存する")
+parser.add_argument("--compare", action="store_true", help="保存済みの基準値と比較する")
+parser.add_argument("--tolerance", type=float, default=0.25, help="悪化とみなす割合")
+parser.add_argument("--child", help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+# ---- 計測する側（シナリオごとに別プロセスで実行する） ----
+
+def play_result(rng):
+    """60秒間のプレイ結果（WPM・正確率は入力文字数とミス数から計算し、送信時の妥当性チェックを通る値にする）"""
+    characters_typed = max(round(rng.gauss(140.0, 45.0)), 1)
+    errors = rng.randrange(20)
+    return {
+        "wpm": float(characters_typed),
+        "accuracy": round(characters_typed / (characters_typed + errors) * 100, 2),
+        "errors": errors,
+        "time_elapsed": 60.0,
+        "characters_typed": characters_typed,
+    }
+
+
+def write_texts_json(path, count, rng):
+    """large-texts 用の texts.json を作る"""
+    words = ["たいぴんぐ", "れんしゅう", "きょうは", "いいてんき", "ですね", "がっこう", "ともだち", "あした"]
+    romaji = {"たいぴんぐ": "taipingu", "れんしゅう": "renshuu", "きょうは": "kyouha", "いいてんき": "iitenki",
+              "ですね": "desune", "がっこう": "gakkou", "ともだち": "tomodachi", "あした": "ashita"}
+    texts = []
+    for index in range(count):
+        chosen = [rng.choice(words) for _ in range(rng.randint(2, 12))]
+        texts.append({
+            "id": index + 1,
+            "title": f"テキスト{index + 1}",
+            "content": "".join(chosen),
+            "romaji": "".join(romaji[word] for word in chosen),
+            "difficulty": DIFFICULTIES[index % len(DIFFICULTIES)],
+            "is_active": True,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"texts": texts}, f, ensure_ascii=False)
+
+
+def seed_rankings(count, rng):
+    """million-rankings 用のランキングを一時DBへ直接入れる（アプリの起動前に行う）"""
+    from sqlalchemy import insert
+
+    from database import engine
+    from models import Ranking
+    from migrations import run_migrations
+
+    run_migrations(engine)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, count, 50000):
+            conn.execute(insert(Ranking), [
+                {
+                    "nickname": f"player{rng.randrange(20000)}",
+                    **play_result(rng),
+                    "difficulty": rng.choice(DIFFICULTIES),
+                    "created_at": now - timedelta(seconds=rng.randrange(60 * 86400)),
+                }
+                for _ in range(offset, min(offset + 50000, count))
+            ])
+    return time.perf_counter() - started
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+        self.first = {}
+
+    async def call(self, name, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            status = response.status_code
+        except httpx.HTTPError:
+            response = None
+            status = "error"
+        elapsed = time.perf_counter() - started
+        self.latencies[name].append(elapsed)
+        self.first.setdefault(name, elapsed)
+        self.statuses[name][str(status)] = self.statuses[name].get(str(status), 0) + 1
+        return response if status == 200 else None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    # 最近順位法
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+async def play(client, recorder, player, rounds, rng):
+    """1人のプレイヤーがゲームを rounds 回遊ぶ（リクエストはフロントエンドと同じ形）"""
+    headers = {"X-Real-IP": f"10.{player // 65536 % 256}.{player // 256 % 256}.{player % 256}",
+               "Accept-Encoding": "gzip"}
+    nickname = f"player{player}"
+    for _ in range(rounds):
+        response = await recorder.call("texts", client.get("/api/game/texts", headers=headers))
+        if response is None:
+            continue
+        texts = response.json()
+        if not texts:
+            continue
+        text = rng.choice(texts)
+        difficulty = text["difficulty"]
+        await recorder.call("session", client.post("/api/game/session", headers=headers, json={
+            "nickname": nickname, "text_content_id": text["id"], "difficulty": difficulty
+        }))
+        result = play_result(rng)
+        await recorder.call("submit", client.post("/api/rankings", headers=headers, json={
+            "nickname": nickname, "wpm": result["wpm"], "accuracy": result["accuracy"], "errors": result["errors"],
+            "timeElapsed": result["time_elapsed"], "charactersTyped": result["characters_typed"],
+            "difficulty": difficulty, "text_content_id": text["id"]
+        }))
+        await recorder.call("rankings", client.get(
+            f"/api/rankings?limit=10&difficulty={difficulty}", headers=headers
+        ))
+
+
+async def drive(client, scenario, rng):
+    if scenario != "cold":
+        # ウォームアップ（キャッシュ・接続・コンパイル済みの状態にしてから計測する）
+        await play(client, Recorder(), 0, 2, rng)
+    recorder = Recorder()
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        play(client, recorder, player + 1, args.rounds, random.Random(args.seed + player))
+        for player in range(args.players)
+    ))
+    return recorder, time.perf_counter() - started
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_asgi(scenario, rng):
+    started = time.perf_counter()
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        # ウォームアップの完了（/ready が 200 を返す状態）までを起動時間とする
+        await main.warm_up.wait(timeout=None)
+        startup = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            recorder, duration = await drive(client, scenario, rng)
+    return startup, recorder, duration
+
+
+async def run_uvicorn(scenario, rng):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port),
+         "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        startup = None
+        async with httpx.AsyncClient(base_url=base_url, timeout=120,
+                                     limits=httpx.Limits(max_connections=args.players)) as client:
+            for _ in range(3000):
+                try:
+                    if (await client.get("/ready")).status_code == 200:
+                        startup = time.perf_counter() - started
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.05)
+            if startup is None:
+                raise RuntimeError("uvicorn が起動しませんでした")
+            recorder, duration = await drive(client, scenario, rng)
+    finally:
+        server.terminate()
+        server.wait()
+    return startup, recorder, duration
+
+
+def run_child(scenario):
+    sys.path.insert(0, BACKEND_DIR)
+    rng = random.Random(args.seed)
+    dataset = {}
+    if scenario == "million-rankings":
+        dataset["rankings"] = args.rankings
+        dataset["seed_seconds"] = round(seed_rankings(args.rankings, rng), 2)
+    if scenario == "large-texts":
+        dataset["texts"] = args.texts
+
+    runner = run_asgi if args.mode == "asgi" else run_uvicorn
+    startup, recorder, duration = asyncio.run(runner(scenario, rng))
+
+    endpoints = {}
+    total = 0
+    for name in ENDPOINTS:
+        values = sorted(recorder.latencies[name])
+        total += len(values)
+        statuses = recorder.statuses[name]
+        endpoints[name] = {
+            "count": len(values),
+            "errors": sum(count for status, count in statuses.items() if status != "200"),
+            "statuses": statuses,
+            "mean_ms": round(sum(values) / len(values) * 1e3, 3) if values else None,
+            **{f"p{int(q * 100)}_ms": round(percentile(values, q) * 1e3, 3) if values else None
+               for q in (0.5, 0.95, 0.99)},
+        }
+    print(json.dumps({
+        "scenario": scenario,
+        "mode": args.mode,
+        "players": args.players,
+        "rounds": args.rounds,
+        "dataset": dataset,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "startup_seconds": round(startup, 3),
+        "first_request_ms": {name: round(value * 1e3, 3) for name, value in recorder.first.items()},
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(total / duration, 1),
+        "games_per_second": round(endpoints["submit"]["count"] / duration, 1),
+        "endpoints": endpoints,
+    }))
+
+
+# ---- 親プロセス（シナリオごとに一時DBを用意して子プロセスを起動し、結果を保存・比較する） ----
+
+def run_scenario(scenario):
+    tmpdir = tempfile.mkdtemp(prefix="renu-loadtest-")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'loadtest.db')}", LOG_LEVEL="WARNING",
+               WORKER_STATE_DIR=tmpdir, SECRET_KEY=os.getenv("SECRET_KEY", "loadtest"))
+    if not args.rate_limit:
+        env["RATE_LIMIT_MODE"] = "off"
+    if scenario == "large-texts":
+        path = os.path.join(tmpdir, "texts.json")
+        write_texts_json(path, args.texts, random.Random(args.seed))
+        env["TEXTS_FILE"] = path
+    command = [sys.executable, os.path.abspath(__file__), "--child", scenario] + [
+        value for value in sys.argv[1:] if value not in ("--save-baseline", "--compare")
+    ]
+    output = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_result(result):
+    print(f"\n[{result['scenario']}] {result['mode']}, {result['players']}人 × {result['rounds']}回, "
+          f"起動 {result['startup_seconds']:.2f} 秒, {result['requests_per_second']:.0f} 件/秒, "
+          f"{result['games_per_second']:.1f} ゲーム/秒")
+    print(f"  {'エンドポイント':<12} {'件数':>6} {'エラー':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'初回 ms':>9}")
+    for name, stats in result["endpoints"].items():
+        first = result["first_request_ms"].get(name)
+        print(f"  {name:<12} {stats['count']:>6} {stats['errors']:>6} "
+              + " ".join(f"{stats[key] if stats[key] is not None else '-':>9}" for key in ("p50_ms", "p95_ms", "p99_ms"))
+              + f" {first if first is not None else '-':>9}")
+
+
+def compare(result, baseline):
+    """基準値より悪化した項目を返す（1ms 未満の差は揺らぎとして無視する）"""
+    regressions = []
+    limit = 1 + args.tolerance
+    if result["requests_per_second"] < baseline["requests_per_second"] / limit:
+        regressions.append(f"スループット {baseline['requests_per_second']} → {result['requests_per_second']} 件/秒")
+    for name, stats in result["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if stats[key] is None or base[key] is None:
+                continue
+            if stats[key] > base[key] * limit and stats[key] - base[key] > 1.0:
+                regressions.append(f"{name} {key} {base[key]} → {stats[key]}")
+        if stats["errors"] > base["errors"]:
+            regressions.append(f"{name} エラー {base['errors']} → {stats['errors']}件")
+    return regressions
+
+
+def main():
+    if args.child:
+        run_child(args.child)
+        return
+
+    scenarios = SCENARIOS if args.scenario == "all" else tuple(args.scenario.split(","))
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"不明なシナリオです: {scenario}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    failed = False
+    for scenario in scenarios:
+        result = run_scenario(scenario)
+        print_result(result)
+        name = f"loadtest-{scenario}-{args.mode}.json"
+        with open(os.path.join(RESULTS_DIR, name), "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        baseline_path = os.path.join(BASELINES_DIR, name)
+        if args.compare:
+            if not os.path.exists(baseline_path):
+                print(f"  基準値がありません: {baseline_path}")
+            else:
+                with open(baseline_path) as f:
+                    regressions = compare(result, json.load(f))
+                for regression in regressions:
+                    print(f"  悪化: {regression}")
+                if not regressions:
+                    print("  基準値からの悪化なし")
+                failed = failed or bool(regressions)
+        if args.save_baseline:
+            os.makedirs(BASELINES_DIR, exist_ok=True)
+            with open(baseline_path, "w") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            print(f"  基準値を保存しました: {baseline_path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
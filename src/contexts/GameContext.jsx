@@ -1,8 +1,51 @@
-import React, { createContext, useContext, useState, useCallback } from 'react'
+import React, { createContext, useContext, useState, useCallback, useEffect, useMemo } from 'react'
 import axios from 'axios'
 
 const GameContext = createContext()
 
+const DIFFICULTIES = ['easy', 'medium', 'hard']
+// 起動時に難易度ごとに取得しておくテキストの件数
+const TEXT_POOL_SIZE = 10
+
+// テキスト抽選のセッションID（タブごと）
+const getDrawSession = () => {
+  let session = sessionStorage.getItem('renu-draw-session')
+  if (!session) {
+    session = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+    sessionStorage.setItem('renu-draw-session', session)
+  }
+  return session
+}
+
+// 送信できなかったランキング（起動時とオンラインに戻ったときにまとめて再送する）
+const PENDING_RANKINGS_KEY = 'renu-pending-rankings'
+const PENDING_RANKINGS_MAX = 200
+// 1回のまとめ送信の最大件数（サーバーの上限と同じ）
+const RANKING_BATCH_SIZE = 50
+const RANKING_SUBMIT_TIMEOUT = 10000
+
+const loadPendingRankings = () => {
+  try {
+    return JSON.parse(localStorage.getItem(PENDING_RANKINGS_KEY)) || []
+  } catch {
+    return []
+  }
+}
+
+const savePendingRankings = (items) => {
+  localStorage.setItem(PENDING_RANKINGS_KEY, JSON.stringify(items.slice(-PENDING_RANKINGS_MAX)))
+}
+
+// 結果ごとの冪等キー（同じ結果を何度送っても1件だけ登録される）
+const newIdempotencyKey = () => (
+  window.crypto?.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`
+)
+
+// 通信エラー・タイムアウト・サーバーの一時的なエラーは再送する（不自然な記録などの4xxは再送しない）
+const isRetryable = (error) => !error.response || error.response.status >= 500 || error.response.status === 429
+
 export const useGame = () => {
   const context = useContext(GameContext)
   if (!context) {
@@ -31,12 +74,12 @@ export const GameProvider = ({ children }) => {
   })
 
   // API設定
-  const api = axios.create({
+  const api = useMemo(() => axios.create({
     baseURL: '/api',
     headers: {
       'Content-Type': 'application/json',
     },
-  })
+  }), [])
 
   // デバッグ情報を取得
   const fetchDebugInfo = useCallback(async () => {
@@ -53,6 +96,16 @@ export const GameProvider = ({ children }) => {
     }
   }, [api])
 
+  // サーバーでテキストを抽選する（同じタブのセッション内では同じテキストが出ないようにする）
+  const drawTexts = useCallback(async (difficulty, count = 1) => {
+    const params = { count, session: getDrawSession(), weighted: true }
+    if (difficulty) {
+      params.difficulty = difficulty
+    }
+    const response = await api.get('/game/texts/next', { params })
+    return response.data
+  }, [api])
+
   // テキストコンテンツを取得
   const fetchTexts = useCallback(async () => {
     try {
@@ -72,23 +125,17 @@ export const GameProvider = ({ children }) => {
         }
       }
       
-      console.log('テキスト取得API呼び出し...')
-      const response = await api.get('/game/texts')
-      console.log('APIレスポンス:', response)
-      console.log('テキスト取得成功:', response.data.length, '件')
-      
-      // テキストデータの詳細をログ出力
-      if (response.data && response.data.length > 0) {
-        const easyCount = response.data.filter(t => t.difficulty === 'easy').length
-        const mediumCount = response.data.filter(t => t.difficulty === 'medium').length
-        const hardCount = response.data.filter(t => t.difficulty === 'hard').length
-        console.log(`難易度別統計 - Easy: ${easyCount}, Medium: ${mediumCount}, Hard: ${hardCount}`)
-        console.log('サンプルテキスト:', response.data.slice(0, 3))
-      }
+      // カタログ全体ではなく、難易度ごとに抽選した数件だけを取得する
+      console.log('テキスト抽選API呼び出し...')
+      const responses = await Promise.all(
+        DIFFICULTIES.map(difficulty => drawTexts(difficulty, TEXT_POOL_SIZE))
+      )
+      const drawnTexts = responses.flat()
+      console.log('テキスト取得成功:', drawnTexts.length, '件')
       
-      setTexts(response.data)
+      setTexts(drawnTexts)
       console.log('=== テキスト取得完了 ===')
-      return response.data
+      return drawnTexts
     } catch (error) {
       console.error('=== テキスト取得エラー ===')
       console.error('エラーオブジェクト:', error)
@@ -102,7 +149,7 @@ export const GameProvider = ({ children }) => {
       setTexts([])
       return []
     }
-  }, [api, fetchDebugInfo])
+  }, [api, fetchDebugInfo, drawTexts])
 
   // ランキングを取得
   const fetchRankings = useCallback(async (dateFilter = "all", limit = 10) => {
@@ -136,6 +183,34 @@ export const GameProvider = ({ children }) => {
     })
   }, [texts])
 
+  // 溜まっている結果を RANKING_BATCH_SIZE 件ずつまとめて送信する
+  const flushPendingRankings = useCallback(async () => {
+    let pending = loadPendingRankings()
+    while (pending.length > 0) {
+      const chunk = pending.slice(0, RANKING_BATCH_SIZE)
+      let sent
+      try {
+        const response = await api.post('/rankings/batch', { results: chunk }, { timeout: RANKING_SUBMIT_TIMEOUT })
+        // 登録済み・不自然な記録として断られたものも含め、応答があった結果は取り除く
+        sent = new Set(response.data.results.map(result => result.idempotency_key))
+      } catch (error) {
+        if (isRetryable(error)) return
+        console.error('ランキング再送エラー（破棄します）:', error.response?.data)
+        sent = new Set(chunk.map(item => item.idempotency_key))
+      }
+      if (sent.size === 0) return
+      pending = loadPendingRankings().filter(item => !sent.has(item.idempotency_key))
+      savePendingRankings(pending)
+    }
+  }, [api])
+
+  // 起動時とオンラインに戻ったときに、送信できなかった結果を再送する
+  useEffect(() => {
+    flushPendingRankings()
+    window.addEventListener('online', flushPendingRankings)
+    return () => window.removeEventListener('online', flushPendingRankings)
+  }, [flushPendingRankings])
+
   // ランキング送信
   const submitRanking = useCallback(async (stats) => {
     try {
@@ -153,16 +228,30 @@ export const GameProvider = ({ children }) => {
         timeElapsed: stats.timeElapsed || 0,
         charactersTyped: stats.charactersTyped || 0,
         difficulty: 'medium', // デフォルト難易度
-        timestamp: new Date().toISOString()
+        timestamp: new Date().toISOString(),
+        idempotency_key: newIdempotencyKey()
       }
       
       console.log('=== ランキング送信開始 ===')
       console.log('送信データ:', rankingData)
       console.log('API URL:', '/api/rankings')
       
-      const response = await api.post('/rankings', rankingData)
+      let response
+      try {
+        response = await api.post('/rankings', rankingData, { timeout: RANKING_SUBMIT_TIMEOUT })
+      } catch (error) {
+        if (isRetryable(error)) {
+          // 届いたかどうか分からない場合も同じキーで再送する（登録済みなら二重には登録されない）
+          savePendingRankings([...loadPendingRankings(), rankingData])
+          console.warn('ランキングを保存しました（オンラインに戻ったときに再送します）')
+        }
+        throw error
+      }
       console.log('ランキング送信成功:', response.data)
       
+      // 以前に送信できなかった結果もまとめて送る
+      await flushPendingRankings()
+      
       // ランキングを再取得
       console.log('ランキング再取得中...')
       await fetchRankings()
@@ -179,7 +268,7 @@ export const GameProvider = ({ children }) => {
       console.error('リクエスト設定:', error.config)
       throw error
     }
-  }, [nickname, api, fetchRankings])
+  }, [nickname, api, fetchRankings, flushPendingRankings])
 
   // ゲーム終了
   const endGame = useCallback((finalStats) => {
@@ -229,6 +318,7 @@ export const GameProvider = ({ children }) => {
     setNickname,
     debugInfo,
     fetchTexts,
+    drawTexts,
     fetchRankings,
     fetchPersonalRankings,
     fetchDebugInfo,
@@ -1,13 +1,18 @@
 import React, { useState, useEffect } from 'react'
 import axios from 'axios'
-import { Settings, Plus, Edit, Trash2, Eye, EyeOff, Save, X, Lock, Trophy, RotateCcw, AlertTriangle } from 'lucide-react'
+import { Settings, Plus, Edit, Trash2, Eye, EyeOff, Save, X, Lock, Trophy, RotateCcw, AlertTriangle, ShieldCheck } from 'lucide-react'
 
 const Admin = () => {
   const [adminPassword, setAdminPassword] = useState('')
+  const [adminToken, setAdminToken] = useState(null)
   const [isAuthenticated, setIsAuthenticated] = useState(false)
   const [activeTab, setActiveTab] = useState('texts')
   const [texts, setTexts] = useState([])
+  const [textSearch, setTextSearch] = useState({ q: '', difficulty: '', is_active: '' })
+  const [textsTotal, setTextsTotal] = useState({ total: 0, exact: true })
+  const [textsNextOffset, setTextsNextOffset] = useState(null)
   const [rankings, setRankings] = useState([])
+  const [rankingsCursor, setRankingsCursor] = useState(null)
   const [loading, setLoading] = useState(true)
   const [editingText, setEditingText] = useState(null)
   const [editingRanking, setEditingRanking] = useState(null)
@@ -34,6 +39,7 @@ const Admin = () => {
     baseURL: '/api',
     headers: {
       'Content-Type': 'application/json',
+      ...(adminToken ? { Authorization: `Bearer ${adminToken}` } : {}),
     },
   })
 
@@ -48,28 +54,32 @@ const Admin = () => {
 
   const handleLogin = async () => {
     try {
-      console.log('ログイン試行開始')
-      console.log('入力パスワード:', adminPassword)
-      console.log('API URL:', `/admin/texts?password=${encodeURIComponent(adminPassword)}`)
-      
-      // パスワードで認証を試行
-      const response = await api.get(`/admin/texts?password=${encodeURIComponent(adminPassword)}`)
-      console.log('API レスポンス:', response)
+      // パスワードは最初のログインでだけ送り、以降はトークンで認証する
+      const response = await api.post('/admin/login', { password: adminPassword })
+      setAdminToken(response.data.access_token)
+      setAdminPassword('')
       setIsAuthenticated(true)
-      setTexts(response.data)
-      console.log('認証成功:', response.data)
     } catch (error) {
-      console.error('認証エラー詳細:', error)
-      console.error('エラーレスポンス:', error.response)
-      console.log('使用したパスワード:', adminPassword)
+      console.error('認証エラー:', error)
       alert(`パスワードが正しくありません。デフォルトパスワード: admin123\nエラー: ${error.message}`)
     }
   }
 
+  // 検索条件（空の項目は送らない）で offset 件目から読み込む
+  const searchTexts = (offset) => {
+    const params = { offset }
+    Object.entries(textSearch).forEach(([key, value]) => {
+      if (value !== '') params[key] = value
+    })
+    return api.get('/admin/texts/search', { params })
+  }
+
   const loadTexts = async () => {
     try {
-      const response = await api.get(`/admin/texts?password=${encodeURIComponent(adminPassword)}`)
-      setTexts(response.data)
+      const response = await searchTexts(0)
+      setTexts(response.data.items)
+      setTextsTotal({ total: response.data.total, exact: response.data.total_exact })
+      setTextsNextOffset(response.data.next_offset)
     } catch (error) {
       console.error('テキスト読み込みエラー:', error)
     } finally {
@@ -77,10 +87,49 @@ const Admin = () => {
     }
   }
 
+  const loadMoreTexts = async () => {
+    if (textsNextOffset === null) return
+    try {
+      const response = await searchTexts(textsNextOffset)
+      setTexts(prev => [...prev, ...response.data.items])
+      setTextsNextOffset(response.data.next_offset)
+    } catch (error) {
+      console.error('テキスト読み込みエラー:', error)
+    }
+  }
+
+  const handleTextSearch = (e) => {
+    e.preventDefault()
+    loadTexts()
+  }
+
+  // 検索語の一致箇所を強調する（HTMLとしては解釈しない）
+  const renderHighlight = (segments, fallback) => {
+    if (!segments) return fallback
+    return segments.map((segment, index) => (
+      segment.match
+        ? <mark key={index} className="bg-yellow-200 rounded-sm">{segment.text}</mark>
+        : <React.Fragment key={index}>{segment.text}</React.Fragment>
+    ))
+  }
+
   const loadRankings = async () => {
     try {
-      const response = await api.get(`/admin/rankings?password=${encodeURIComponent(adminPassword)}`)
-      setRankings(response.data)
+      const response = await api.get(`/admin/rankings`)
+      setRankings(response.data.items)
+      setRankingsCursor(response.data.next_cursor)
+    } catch (error) {
+      console.error('ランキング読み込みエラー:', error)
+    }
+  }
+
+  // 次のページを読み込んで一覧に追加
+  const loadMoreRankings = async () => {
+    if (!rankingsCursor) return
+    try {
+      const response = await api.get(`/admin/rankings?cursor=${encodeURIComponent(rankingsCursor)}`)
+      setRankings(prev => [...prev, ...response.data.items])
+      setRankingsCursor(response.data.next_cursor)
     } catch (error) {
       console.error('ランキング読み込みエラー:', error)
     }
@@ -90,9 +139,9 @@ const Admin = () => {
     e.preventDefault()
     try {
       if (editingText) {
-        await api.put(`/admin/texts/${editingText.id}?password=${encodeURIComponent(adminPassword)}`, formData)
+        await api.put(`/admin/texts/${editingText.id}`, formData)
       } else {
-        await api.post(`/admin/texts?password=${encodeURIComponent(adminPassword)}`, formData)
+        await api.post(`/admin/texts`, formData)
       }
       
       await loadTexts()
@@ -107,7 +156,7 @@ const Admin = () => {
     if (!confirm('このテキストを削除しますか？')) return
     
     try {
-      await api.delete(`/admin/texts/${id}?password=${encodeURIComponent(adminPassword)}`)
+      await api.delete(`/admin/texts/${id}`)
       await loadTexts()
     } catch (error) {
       console.error('削除エラー:', error)
@@ -154,7 +203,7 @@ const Admin = () => {
   const handleRankingSubmit = async (e) => {
     e.preventDefault()
     try {
-      await api.put(`/admin/rankings/${editingRanking.id}?password=${encodeURIComponent(adminPassword)}`, rankingFormData)
+      await api.put(`/admin/rankings/${editingRanking.id}`, rankingFormData)
       await loadRankings()
       resetRankingForm()
     } catch (error) {
@@ -167,7 +216,7 @@ const Admin = () => {
     if (!confirm('このランキングを削除しますか？')) return
     
     try {
-      await api.delete(`/admin/rankings/${id}?password=${encodeURIComponent(adminPassword)}`)
+      await api.delete(`/admin/rankings/${id}`)
       await loadRankings()
     } catch (error) {
       console.error('ランキング削除エラー:', error)
@@ -179,7 +228,7 @@ const Admin = () => {
     if (!confirm('すべてのランキングをリセットしますか？この操作は取り消せません。')) return
     
     try {
-      await api.delete(`/admin/rankings?password=${encodeURIComponent(adminPassword)}`)
+      await api.delete(`/admin/rankings`)
       await loadRankings()
       alert('すべてのランキングがリセットされました')
     } catch (error) {
@@ -188,6 +237,32 @@ const Admin = () => {
     }
   }
 
+  // 全ての記録の妥当性をまとめて判定し、不自然な記録にフラグを付ける
+  const handleRescoreRankings = async () => {
+    try {
+      const response = await api.post(`/admin/rankings/plausibility`)
+      const flagged = Object.entries(response.data.flagged)
+        .map(([flag, count]) => `${flag}: ${count}件`)
+        .join('\n')
+      await loadRankings()
+      alert(`${response.data.checked}件を判定し、${response.data.changed}件のフラグを変更しました\n${flagged}`)
+    } catch (error) {
+      console.error('妥当性チェックエラー:', error)
+      alert('記録の妥当性チェックに失敗しました')
+    }
+  }
+
+  // フラグが付いた記録を確認済みにしてランキングに戻す
+  const handleApproveRanking = async (id) => {
+    try {
+      await api.put(`/admin/rankings/${id}`, { flag: 'approved' })
+      await loadRankings()
+    } catch (error) {
+      console.error('ランキング更新エラー:', error)
+      alert('ランキングの更新に失敗しました')
+    }
+  }
+
   const resetRankingForm = () => {
     setRankingFormData({
       nickname: '',
@@ -413,6 +488,40 @@ const Admin = () => {
               </button>
             </div>
 
+            <form onSubmit={handleTextSearch} className="flex flex-wrap items-center gap-2 mb-2">
+              <input
+                type="search"
+                value={textSearch.q}
+                onChange={(e) => setTextSearch({ ...textSearch, q: e.target.value })}
+                className="input-field flex-1 min-w-[12rem]"
+                placeholder="タイトル・本文を検索"
+                maxLength={200}
+              />
+              <select
+                value={textSearch.difficulty}
+                onChange={(e) => setTextSearch({ ...textSearch, difficulty: e.target.value })}
+                className="input-field w-auto"
+              >
+                <option value="">すべての難易度</option>
+                {Object.entries(difficultyLabels).map(([value, label]) => (
+                  <option key={value} value={value}>{label}</option>
+                ))}
+              </select>
+              <select
+                value={textSearch.is_active}
+                onChange={(e) => setTextSearch({ ...textSearch, is_active: e.target.value })}
+                className="input-field w-auto"
+              >
+                <option value="">すべて</option>
+                <option value="true">アクティブ</option>
+                <option value="false">非アクティブ</option>
+              </select>
+              <button type="submit" className="btn-secondary">検索</button>
+            </form>
+            <p className="text-xs text-gray-500 mb-4">
+              {textsTotal.total}件{textsTotal.exact ? '' : '以上'}
+            </p>
+
             <div className="space-y-4">
               {texts.map((text) => (
                 <div
@@ -422,7 +531,7 @@ const Admin = () => {
                   <div className="flex items-center justify-between">
                     <div className="flex-1">
                       <div className="flex items-center space-x-3 mb-2">
-                        <h3 className="text-lg font-bold text-gray-900">{text.title}</h3>
+                        <h3 className="text-lg font-bold text-gray-900">{renderHighlight(text.title_highlight, text.title)}</h3>
                         <span className={`px-2 py-1 rounded-full text-xs font-medium ${difficultyColors[text.difficulty]}`}>
                           {difficultyLabels[text.difficulty]}
                         </span>
@@ -433,7 +542,7 @@ const Admin = () => {
                         </span>
                       </div>
                       <p className="text-gray-600 text-sm mb-2">
-                        {text.content.substring(0, 100)}...
+                        {renderHighlight(text.content_highlight, `${text.content.substring(0, 100)}...`)}
                       </p>
                       <div className="text-xs text-gray-500">
                         文字数: {text.content.length} | 
@@ -473,6 +582,17 @@ const Admin = () => {
                   </button>
                 </div>
               )}
+
+              {textsNextOffset !== null && (
+                <div className="text-center">
+                  <button
+                    onClick={loadMoreTexts}
+                    className="btn-secondary"
+                  >
+                    さらに読み込む
+                  </button>
+                </div>
+              )}
             </div>
           </div>
         </div>
@@ -624,6 +744,13 @@ const Admin = () => {
                   <RotateCcw className="w-4 h-4" />
                   <span>全リセット</span>
                 </button>
+                <button
+                  onClick={handleRescoreRankings}
+                  className="btn-secondary flex items-center space-x-2"
+                >
+                  <ShieldCheck className="w-4 h-4" />
+                  <span>妥当性チェック</span>
+                </button>
                 <button
                   onClick={loadRankings}
                   className="btn-secondary flex items-center space-x-2"
@@ -648,6 +775,12 @@ const Admin = () => {
                         <span className={`px-2 py-1 rounded-full text-xs font-medium ${difficultyColors[ranking.difficulty]}`}>
                           {difficultyLabels[ranking.difficulty]}
                         </span>
+                        {ranking.flag && ranking.flag !== 'approved' && (
+                          <span className="px-2 py-1 rounded-full text-xs font-medium bg-red-100 text-red-800 flex items-center space-x-1">
+                            <AlertTriangle className="w-3 h-3" />
+                            <span>{ranking.flag}（非表示）</span>
+                          </span>
+                        )}
                       </div>
                       <div className="grid grid-cols-2 md:grid-cols-4 gap-4 text-sm">
                         <div>
@@ -674,6 +807,15 @@ const Admin = () => {
                     </div>
 
                     <div className="flex items-center space-x-2 ml-4">
+                      {ranking.flag && ranking.flag !== 'approved' && (
+                        <button
+                          onClick={() => handleApproveRanking(ranking.id)}
+                          className="p-2 text-green-600 hover:bg-green-50 rounded-lg transition-colors"
+                          title="確認済みにしてランキングに表示"
+                        >
+                          <ShieldCheck className="w-4 h-4" />
+                        </button>
+                      )}
                       <button
                         onClick={() => startEditRanking(ranking)}
                         className="p-2 text-blue-600 hover:bg-blue-50 rounded-lg transition-colors"
@@ -699,6 +841,17 @@ const Admin = () => {
                   <p className="text-gray-500">ランキングデータがありません。</p>
                 </div>
               )}
+
+              {rankingsCursor && (
+                <div className="text-center">
+                  <button
+                    onClick={loadMoreRankings}
+                    className="btn-secondary"
+                  >
+                    さらに読み込む
+                  </button>
+                </div>
+              )}
             </div>
           </div>
         </div>
@@ -16,7 +16,7 @@ const Game = () => {
   const [currentErrors, setCurrentErrors] = useState(0)       // ミス数
   const [lastWPM, setLastWPM] = useState(0)                  // 時間切れ直前のWPM
 
-  const { texts, fetchTexts, endGame, nickname, debugInfo, submitRanking } = useGame()
+  const { texts, fetchTexts, drawTexts, endGame, nickname, debugInfo, submitRanking } = useGame()
   const [searchParams] = useSearchParams()
   const navigate = useNavigate()
 
@@ -120,9 +120,21 @@ const Game = () => {
     return 'hard'
   }
 
-  const handleNextProblem = () => {
+  const handleNextProblem = async () => {
+    const difficulty = getDifficultyByWPM(currentWPM)
+    try {
+      // 次の問題はサーバーで抽選する（このセッションでまだ出ていないテキスト）
+      const [nextText] = await drawTexts(difficulty, 1)
+      if (nextText) {
+        setSelectedText(nextText)
+        setSelectedDifficulty(nextText.difficulty)
+        return
+      }
+    } catch (error) {
+      console.error('テキスト抽選エラー:', error)
+    }
+    // 抽選できなかった場合は取得済みのテキストから選ぶ
     if (texts.length > 0) {
-      const difficulty = getDifficultyByWPM(currentWPM)
       const availableTexts = texts.filter(text => text.is_active && text.difficulty === difficulty)
       
       // 指定された難易度の問題がない場合は、すべての問題から選択
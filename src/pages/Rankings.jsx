@@ -13,8 +13,32 @@ const Rankings = () => {
     loadRankings()
   }, [selectedDateFilter, limit])
 
-  const loadRankings = async () => {
-    setLoading(true)
+  // 新しい記録はサーバーから差分で受け取る（再取得のポーリングは行わない）
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return
+    const params = new URLSearchParams({ limit: limit.toString() })
+    if (selectedDateFilter !== 'all') {
+      params.append('date_filter', selectedDateFilter)
+    }
+    const source = new EventSource(`/api/rankings/stream?${params}`)
+
+    source.addEventListener('diff', (event) => {
+      const { rank, entry, evicted_id } = JSON.parse(event.data)
+      setRankings((current) => {
+        if (rank > limit) return current
+        const next = current.filter((ranking) => ranking.id !== entry.id && ranking.id !== evicted_id)
+        next.splice(rank - 1, 0, entry)
+        return next.slice(0, limit)
+      })
+    })
+    // 管理者による削除・編集など、差分で表せない変更があった場合は取り直す
+    source.addEventListener('reset', () => loadRankings(false))
+
+    return () => source.close()
+  }, [selectedDateFilter, limit])
+
+  const loadRankings = async (showLoading = true) => {
+    if (showLoading) setLoading(true)
     try {
       const data = await fetchRankings(selectedDateFilter, limit)
       setRankings(data)
@@ -0,0 +1,73 @@
+"""
+テスト共通の設定
+バックエンドのモジュールを読み込む前に一時DBを指定し、backend/ を import パスに加えます（benchmarks/ と同じ方式）
+
+使い方: python -m pytest -q tests（時間のかかるテストも含める場合は --run-slow）
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmpdir = tempfile.mkdtemp(prefix="renu-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'test.db')}"
+os.environ["WORKER_STATE_DIR"] = os.path.join(_tmpdir, "workers")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["RATE_LIMIT_MODE"] = "off"
+os.environ["MAX_CONCURRENT_REQUESTS"] = "100000"
+os.environ["WEB_CONCURRENCY"] = "1"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="時間のかかるテスト（slow）も実行する")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: 時間のかかるテスト（--run-slow を指定したときだけ実行）")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="--run-slow を指定すると実行します")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
+@pytest.fixture(scope="session")
+def database():
+    """スキーマを作成した書き込み用エンジン"""
+    from database import engine
+    from migrations import run_migrations
+
+    run_migrations(engine)
+    return engine
+
+
+@pytest.fixture
+def app_client(database):
+    """
+    起動処理（ウォームアップ）を済ませたアプリに接続する httpx.AsyncClient を作る関数を返す
+    テストは asyncio.run の中で `async with app_client() as client:` として使う
+    """
+    import httpx
+    from contextlib import asynccontextmanager
+
+    import main
+
+    @asynccontextmanager
+    async def connect():
+        # 前のテストの起動で準備完了になったままだと、今回のウォームアップの完了を待たずに始まってしまう
+        main.warm_up.ready = False
+        main.warm_up.error = None
+        async with main.app.router.lifespan_context(main.app):
+            await main.warm_up.wait(timeout=None)
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                yield client
+
+    return connect
@@ -0,0 +1,59 @@
+"""
+管理者ログイン
+bcrypt の検証がDBのスレッドプールを占有しないこと、同じクライアントからの試行回数が制限されること
+"""
+
+import asyncio
+import time
+import uuid
+
+import admission
+
+LOGIN_FLOOD = 8
+
+
+def test_login_flood_does_not_delay_ranking_submit(app_client):
+    async def scenario():
+        async with app_client() as client:
+            logins = [
+                asyncio.ensure_future(client.post("/api/admin/login", json={"password": f"wrong-{index}"}))
+                for index in range(LOGIN_FLOOD)
+            ]
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            submitted = await client.post("/api/rankings", json={
+                "nickname": f"login-flood-{uuid.uuid4().hex[:8]}", "wpm": 120.0, "accuracy": 100.0, "errors": 0,
+                "timeElapsed": 60.0, "charactersTyped": 120, "difficulty": "easy"
+            })
+            elapsed = time.perf_counter() - started
+            logins_pending = sum(1 for login in logins if not login.done())
+            responses = await asyncio.gather(*logins)
+            return submitted, elapsed, logins_pending, responses
+
+    submitted, elapsed, logins_pending, responses = asyncio.run(scenario())
+    assert submitted.status_code == 200
+    # ログインの検証（1回約0.4秒 × 8回）が終わる前にランキングの登録が返る
+    assert logins_pending > 0
+    assert elapsed < 1.0
+    assert all(response.status_code == 401 for response in responses)
+
+
+def test_login_attempts_are_rate_limited(app_client, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_MODE", "on")
+    admission.rate_limiter.clear()
+    _, burst = admission.rate_limiter.budgets["admin_login"]
+
+    async def scenario():
+        async with app_client() as client:
+            headers = {"X-Real-IP": "203.0.113.7"}
+            return [
+                await client.post("/api/admin/login", json={"password": "wrong"}, headers=headers)
+                for _ in range(burst + 1)
+            ]
+
+    try:
+        responses = asyncio.run(scenario())
+    finally:
+        admission.rate_limiter.clear()
+    assert [response.status_code for response in responses] == [401] * burst + [429]
+    assert "Retry-After" in responses[-1].headers
@@ -0,0 +1,56 @@
+"""
+レート制限のクライアントIPの判定とバケット数の上限、ヘルスチェックの受付制限の対象外
+"""
+
+import asyncio
+
+from starlette.requests import Request
+
+import admission
+from admission import RateLimiter, client_ip
+
+
+def request_from(peer, real_ip=None):
+    headers = [(b"x-real-ip", real_ip.encode())] if real_ip else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 40000)})
+
+
+def test_real_ip_header_used_only_from_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(admission, "trusted_proxies", admission._parse_networks("127.0.0.1,172.28.0.0/16"))
+    assert client_ip(request_from("127.0.0.1", "198.51.100.5")) == "198.51.100.5"
+    assert client_ip(request_from("172.28.0.10", "198.51.100.5")) == "198.51.100.5"
+    # nginx を通さない接続の X-Real-IP は無視し、接続元のIPで数える
+    assert client_ip(request_from("203.0.113.9", "198.51.100.5")) == "203.0.113.9"
+    assert client_ip(request_from("203.0.113.9")) == "203.0.113.9"
+
+
+def test_real_ip_header_ignored_when_trust_proxy_off(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_TRUST_PROXY", False)
+    assert client_ip(request_from("127.0.0.1", "198.51.100.5")) == "127.0.0.1"
+
+
+def test_bucket_count_is_capped():
+    limiter = RateLimiter(budgets={"test": (1.0, 2)}, idle_seconds=300, max_buckets=100)
+    for index in range(1000):
+        limiter.acquire(f"10.0.{index // 256}.{index % 256}", "test", now=1.0)
+    assert len(limiter) == 100
+    # 残っているのは最近使われたクライアント
+    assert limiter.acquire("10.0.3.231", "test", now=1.0) == 0.0
+    assert limiter.acquire("10.0.3.231", "test", now=1.0) > 0
+
+
+def test_ready_is_exempt_from_load_shedding(app_client, monkeypatch):
+    import main
+
+    async def scenario():
+        async with app_client() as client:
+            middleware = main.app.middleware_stack
+            while not isinstance(middleware, admission.AdmissionMiddleware):
+                middleware = middleware.app
+            # 処理中のリクエスト数が上限に達している状態
+            monkeypatch.setattr(middleware, "in_flight", middleware.max_concurrent)
+            return await client.get("/ready"), await client.get("/api/rankings")
+
+    ready, rankings = asyncio.run(scenario())
+    assert ready.status_code == 200
+    assert rankings.status_code == 503
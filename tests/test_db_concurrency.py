@@ -0,0 +1,123 @@
+"""
+run_db の同時実行（DB_ACCESS_MODE の threadpool / inline の両方）
+同時の書き込みと読み込みで "database is locked" にならず、書き込んだ行が失われないこと
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from database import ReadSessionLocal, SessionLocal, run_db
+from models import Ranking
+
+CONCURRENCY = 40
+
+
+def insert_ranking(nickname, wpm):
+    db = SessionLocal()
+    try:
+        db.add(Ranking(
+            nickname=nickname, wpm=wpm, accuracy=100.0, errors=0, time_elapsed=60.0,
+            characters_typed=round(wpm), difficulty="easy"
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_rankings(prefix):
+    db = ReadSessionLocal()
+    try:
+        return db.scalar(select(func.count(Ranking.id)).where(Ranking.nickname.like(f"{prefix}%")))
+    finally:
+        db.close()
+
+
+@pytest.fixture(params=["threadpool", "inline"])
+def db_access_mode(request, monkeypatch, database):
+    monkeypatch.setattr("database.DB_ACCESS_MODE", request.param)
+    return request.param
+
+
+def test_run_db_concurrent_writes_and_reads(db_access_mode):
+    prefix = f"run-db-{db_access_mode}-{uuid.uuid4().hex[:8]}-"
+
+    async def scenario():
+        writes = [run_db(insert_ranking, f"{prefix}{index}", 100.0 + index) for index in range(CONCURRENCY)]
+        reads = [run_db(count_rankings, prefix) for _ in range(CONCURRENCY)]
+        # 例外（"database is locked" を含む）があれば gather がそのまま送出する
+        results = await asyncio.gather(*writes, *reads)
+        return results[CONCURRENCY:]
+
+    counts = asyncio.run(scenario())
+    assert all(0 <= count <= CONCURRENCY for count in counts)
+    assert count_rankings(prefix) == CONCURRENCY
+
+
+def test_api_concurrent_submits_and_reads(db_access_mode, app_client):
+    prefix = f"api-{db_access_mode}-{uuid.uuid4().hex[:8]}-"
+
+    async def scenario():
+        async with app_client() as client:
+            submits = [
+                client.post("/api/rankings", json={
+                    "nickname": f"{prefix}{index}", "wpm": 120.0, "accuracy": 100.0, "errors": 0,
+                    "timeElapsed": 60.0, "charactersTyped": 120, "difficulty": "easy"
+                })
+                for index in range(CONCURRENCY)
+            ]
+            reads = [
+                client.get("/api/rankings", params={"limit": 20, "best_per_player": "true"})
+                for _ in range(CONCURRENCY)
+            ]
+            return await asyncio.gather(*submits, *reads)
+
+    responses = asyncio.run(scenario())
+    for response in responses:
+        assert response.status_code == 200, response.text
+        assert "database is locked" not in response.text
+    assert count_rankings(prefix) == CONCURRENCY
+
+
+def test_reads_served_while_write_in_flight(database, monkeypatch):
+    """threadpool モードでは、書き込みのトランザクションが開いている間も読み込みが返る"""
+    monkeypatch.setattr("database.DB_ACCESS_MODE", "threadpool")
+    prefix = f"in-flight-{uuid.uuid4().hex[:8]}-"
+    writing = threading.Event()
+
+    def slow_write():
+        db = SessionLocal()
+        try:
+            db.add(Ranking(
+                nickname=f"{prefix}0", wpm=100.0, accuracy=100.0, errors=0, time_elapsed=60.0,
+                characters_typed=100, difficulty="easy"
+            ))
+            db.flush()
+            writing.set()
+            # コミット前の遅い書き込み（SQLiteのfsyncなど）
+            time.sleep(0.5)
+            db.commit()
+        finally:
+            db.close()
+
+    async def scenario():
+        write = asyncio.ensure_future(run_db(slow_write))
+        while not writing.is_set():
+            await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        counts = await asyncio.gather(*(run_db(count_rankings, prefix) for _ in range(3)))
+        elapsed = time.perf_counter() - started
+        write_done = write.done()
+        await write
+        return counts, elapsed, write_done
+
+    counts, elapsed, write_done = asyncio.run(scenario())
+    # WALでは未コミットの行は見えず、読み込みは書き込みの完了を待たない
+    assert counts == [0, 0, 0]
+    assert not write_done
+    assert elapsed < 0.5
+    assert count_rankings(prefix) == 1
@@ -0,0 +1,82 @@
+"""
+ランキング送信の冪等キー
+- 管理者がランキングを変更した後に再送された場合、変更前の登録結果を返さないこと
+- 冪等キーは送信したクライアントにだけ返し、差分配信・公開のランキングには含めないこと
+"""
+
+import asyncio
+import json
+import uuid
+
+from auth import admin_auth
+
+
+def ranking_payload(nickname, key, wpm=120.0):
+    return {
+        "nickname": nickname, "wpm": wpm, "accuracy": 100.0, "errors": 0,
+        "timeElapsed": 60.0, "charactersTyped": round(wpm), "difficulty": "easy", "idempotency_key": key
+    }
+
+
+def admin_headers():
+    token, _ = admin_auth.create_token()
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_retry_after_bulk_update_returns_updated_values(app_client):
+    nickname = f"bulk-{uuid.uuid4().hex[:8]}"
+    key = uuid.uuid4().hex
+
+    async def scenario():
+        async with app_client() as client:
+            created = await client.post("/api/rankings", json=ranking_payload(nickname, key))
+            updated = await client.post("/api/admin/rankings/bulk-update", headers=admin_headers(), json={
+                "filter": {"nickname": nickname}, "values": {"difficulty": "hard"}
+            })
+            retried = await client.post("/api/rankings", json=ranking_payload(nickname, key))
+            return created, updated, retried
+
+    created, updated, retried = asyncio.run(scenario())
+    assert created.status_code == 200 and created.json()["difficulty"] == "easy"
+    assert updated.json()["updated"] == 1
+    assert retried.status_code == 200
+    assert retried.json()["duplicate"] is True
+    assert retried.json()["id"] == created.json()["id"]
+    assert retried.json()["difficulty"] == "hard"
+
+
+def test_idempotency_key_is_not_published(app_client):
+    import main
+
+    key = f"secret-{uuid.uuid4().hex}"
+    nickname = f"private-{uuid.uuid4().hex[:8]}"
+
+    async def scenario():
+        async with app_client() as client:
+            subscriber = main.live_hub.subscribe(("all", None))
+            try:
+                # 上位に入る記録（差分が配信される）
+                created = await client.post("/api/rankings", json=ranking_payload(nickname, key, wpm=1150.0))
+                message = subscriber.queue.get_nowait()
+            finally:
+                main.live_hub.unsubscribe(subscriber)
+            top = await client.get("/api/rankings", params={"limit": 100})
+            best = await client.get("/api/rankings", params={"limit": 100, "best_per_player": "true"})
+            return created, message, top, best, main.leaderboard.top("all", None, 100)
+
+    created, message, top, best, entries = asyncio.run(scenario())
+    assert created.json()["idempotency_key"] == key
+
+    event, data = message.decode().strip().split("\n")
+    assert event == "event: diff"
+    diff = json.loads(data[len("data: "):])
+    assert diff["entry"]["nickname"] == nickname
+    assert "idempotency_key" not in diff["entry"]
+    assert key not in message.decode()
+
+    for response in (top, best):
+        assert any(entry["nickname"] == nickname for entry in response.json())
+        assert all("idempotency_key" not in entry for entry in response.json())
+        assert key not in response.text
+    # SSE の snapshot にも使うメモリ上の上位K件
+    assert all("idempotency_key" not in entry for entry in entries)
@@ -0,0 +1,35 @@
+"""
+初期データの作成（init_data.py）
+空のDBで実行したとき、texts.json の取り込み記録があっても管理者設定の初期値が作られること
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "backend")
+DEFAULT_SETTING_KEYS = {"game_time_limit", "max_errors", "ranking_display_limit"}
+
+
+def run_init_data(db_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    subprocess.run([sys.executable, "init_data.py"], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+
+def setting_keys(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {key for (key,) in conn.execute("SELECT setting_key FROM admin_settings")}
+
+
+def test_init_data_creates_default_settings_on_empty_db(tmp_path):
+    db_path = tmp_path / "fresh.db"
+    run_init_data(db_path)
+    keys = setting_keys(db_path)
+    assert DEFAULT_SETTING_KEYS <= keys
+    assert "texts_json_imported" in keys
+
+    # 2回目の実行で重複して作らない
+    run_init_data(db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM admin_settings").fetchone()[0] == len(keys)
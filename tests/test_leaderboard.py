@@ -0,0 +1,178 @@
+"""
+インメモリのランキング（上位K件）
+送信・編集・削除・フラグ付け・期間の経過をランダムに繰り返し、常に rankings_query と同じ結果を返すこと
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import leaderboard as leaderboard_module
+from leaderboard import Leaderboard, ranking_to_entry
+from migrations import run_migrations
+from models import Ranking
+from ranking_queries import DATE_FILTERS, FLAG_APPROVED, is_visible, rankings_query
+
+SIZE = 10
+DIFFICULTIES = ("easy", "hard")
+# 同じWPMの記録を作り、ID順の並びも確認する
+WPM_VALUES = [float(value) for value in range(100, 130, 2)]
+
+
+class Clock:
+    """leaderboard モジュールの datetime.utcnow() を差し替え、時刻を進められるようにする"""
+
+    def __init__(self, now):
+        self.now = now
+        clock = self
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return clock.now
+
+        self.datetime = FakeDatetime
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leaderboard.db'}", connect_args={"check_same_thread": False})
+    run_migrations(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(datetime(2024, 5, 1, 20, 0, 0))
+    monkeypatch.setattr(leaderboard_module, "datetime", clock.datetime)
+    return clock
+
+
+def expected_ids(db, date_filter, difficulty, limit, now):
+    rows = rankings_query(db, date_filter, difficulty, now=now).limit(limit).all()
+    return [row.id for row in rows]
+
+
+def board_ids(board, date_filter, difficulty, limit):
+    entries = board.top(date_filter, difficulty, limit)
+    if entries is None and board.needs_reload(date_filter, difficulty):
+        board.reload(date_filter, difficulty)
+        entries = board.top(date_filter, difficulty, limit)
+    return None if entries is None else [entry["id"] for entry in entries]
+
+
+def assert_matches_sql(board, db, now):
+    db.expire_all()
+    for date_filter in DATE_FILTERS:
+        for difficulty in (None,) + DIFFICULTIES:
+            for limit in (3, SIZE):
+                ids = board_ids(board, date_filter, difficulty, limit)
+                if ids is None:
+                    # メモリ上にないランキングは呼び出し側がSQLを使う
+                    continue
+                assert ids == expected_ids(db, date_filter, difficulty, limit, now), (date_filter, difficulty, limit)
+
+
+def add_ranking(db, rng, created_at, flag=None):
+    ranking = Ranking(
+        nickname=f"player{rng.randrange(8)}", wpm=rng.choice(WPM_VALUES), accuracy=95.0, errors=1,
+        time_elapsed=60.0, characters_typed=100, difficulty=rng.choice(DIFFICULTIES), created_at=created_at,
+        flag=flag
+    )
+    db.add(ranking)
+    db.commit()
+    return ranking
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_leaderboard_matches_sql_under_random_operations(session_factory, clock, seed):
+    rng = random.Random(seed)
+    db = session_factory()
+    try:
+        for _ in range(60):
+            add_ranking(db, rng, clock.now - timedelta(hours=rng.uniform(0, 24 * 40)))
+        board = Leaderboard(size=SIZE, session_factory=session_factory)
+        board.load()
+        assert_matches_sql(board, db, clock.now)
+
+        for _ in range(200):
+            ids = [ranking_id for (ranking_id,) in db.query(Ranking.id)]
+            operation = rng.choice(["add", "add", "add", "update", "delete", "flag", "approve", "advance", "invalidate"])
+            if operation == "add":
+                flag = "wpm_mismatch" if rng.random() < 0.1 else None
+                ranking = add_ranking(db, rng, clock.now, flag)
+                if is_visible(ranking.flag):
+                    board.add(ranking_to_entry(ranking))
+            elif operation in ("update", "flag", "approve") and ids:
+                # 管理者による編集（main.update_ranking と同じ反映方法）
+                ranking = db.get(Ranking, rng.choice(ids))
+                if operation == "update":
+                    ranking.wpm = rng.choice(WPM_VALUES)
+                    ranking.difficulty = rng.choice(DIFFICULTIES)
+                else:
+                    ranking.flag = "wpm_mismatch" if operation == "flag" else FLAG_APPROVED
+                db.commit()
+                if is_visible(ranking.flag):
+                    board.replace(ranking_to_entry(ranking))
+                else:
+                    board.remove(ranking.id)
+            elif operation == "delete" and ids:
+                ranking_id = rng.choice(ids)
+                db.query(Ranking).filter(Ranking.id == ranking_id).delete()
+                db.commit()
+                board.remove(ranking_id)
+            elif operation == "advance":
+                # 期間の境界（日付の変わり目など）をまたぐ
+                clock.now += timedelta(hours=rng.uniform(1, 30))
+            elif operation == "invalidate":
+                board.invalidate()
+            assert_matches_sql(board, db, clock.now)
+    finally:
+        db.close()
+
+
+def test_changes_during_reload_are_applied(session_factory, clock, monkeypatch):
+    """再読み込みのSQLの実行中に反映された送信・削除が、読み込んだ結果で失われないこと"""
+    rng = random.Random(0)
+    db = session_factory()
+    try:
+        for _ in range(30):
+            add_ranking(db, rng, clock.now - timedelta(hours=1))
+        board = Leaderboard(size=SIZE, session_factory=session_factory)
+        board.load()
+        board.invalidate()
+
+        read = leaderboard_module.Board.read
+        during = {}
+
+        def read_then_change(self, session, now):
+            entries = read(self, session, now)
+            if not during:
+                # 読み込みの後・反映の前に、別の送信と削除が届く
+                fast = add_ranking(db, rng, clock.now)
+                fast.wpm = 1000.0
+                db.commit()
+                board.add(ranking_to_entry(fast))
+                removed = entries[0]["id"]
+                db.query(Ranking).filter(Ranking.id == removed).delete()
+                db.commit()
+                board.remove(removed)
+                during.update(added=fast.id, removed=removed)
+            return entries
+
+        monkeypatch.setattr(leaderboard_module.Board, "read", read_then_change)
+        board.reload("all", None)
+        top = board.boards[("all", None)]
+        ids = [entry["id"] for entry in top.entries]
+        assert ids[0] == during["added"]
+        assert during["removed"] not in ids
+        # 削除で欠けた順位はもう一度読み込んで埋める
+        assert top.dirty and top.loading is None
+        monkeypatch.setattr(leaderboard_module.Board, "read", read)
+        assert_matches_sql(board, db, clock.now)
+    finally:
+        db.close()
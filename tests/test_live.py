@@ -0,0 +1,70 @@
+"""
+ランキング配信（SSE）の接続の制限
+購読数の上限（全体・クライアントIPごと）と、接続のレート制限
+"""
+
+import asyncio
+
+import admission
+from admission import RateLimiter
+from live import LeaderboardHub
+
+KEY = ("all", None)
+
+
+def test_subscriber_caps():
+    hub = LeaderboardHub(max_subscribers=3, max_per_client=2)
+    first = hub.subscribe(KEY, "198.51.100.1")
+    second = hub.subscribe(KEY, "198.51.100.1")
+    # 同じIPからは2つまで
+    assert hub.subscribe(KEY, "198.51.100.1") is None
+    third = hub.subscribe(("week", "easy"), "198.51.100.2")
+    # 全体で3つまで
+    assert hub.subscribe(KEY, "198.51.100.3") is None
+    assert hub.count == 3
+
+    # 購読をやめると枠が空く（2回呼び出しても数は1つだけ減る）
+    hub.unsubscribe(first)
+    hub.unsubscribe(first)
+    assert hub.count == 2 and hub.clients == {"198.51.100.1": 1, "198.51.100.2": 1}
+    assert hub.subscribe(KEY, "198.51.100.1") is not None
+
+    for subscriber in (second, third):
+        hub.unsubscribe(subscriber)
+    assert hub.clients == {"198.51.100.1": 1}
+
+
+def test_stream_returns_503_when_cap_reached(app_client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.live_hub, "max_per_client", 1)
+
+    async def scenario():
+        async with app_client() as client:
+            # テストクライアントの接続元IPで、すでに1つ購読している状態
+            subscriber = main.live_hub.subscribe(KEY, "127.0.0.1")
+            try:
+                response = await client.get("/api/rankings/stream")
+            finally:
+                main.live_hub.unsubscribe(subscriber)
+            return response, main.live_hub.count
+
+    response, count = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert count == 0
+
+
+def test_stream_connect_is_rate_limited(app_client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(admission, "RATE_LIMIT_MODE", "on")
+    monkeypatch.setattr(admission, "rate_limiter", RateLimiter(budgets={"live_connect": (0.001, 2)}))
+    # 購読の上限に達した状態にして、ストリームを開かずに接続の受付だけを確かめる
+    monkeypatch.setattr(main.live_hub, "max_subscribers", 0)
+
+    async def scenario():
+        async with app_client() as client:
+            return [(await client.get("/api/rankings/stream")).status_code for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [503, 503, 429]
@@ -0,0 +1,35 @@
+"""
+スキーマのマイグレーション
+空のDBに全てのマイグレーションを適用した結果が、モデルの定義（カラム・インデックス）と一致すること
+"""
+
+from sqlalchemy import create_engine, inspect
+
+from migrations import MIGRATIONS, run_migrations
+from models import Base
+
+
+def columns(inspector, table_name):
+    return {
+        column["name"]: (column["nullable"], bool(column["primary_key"]))
+        for column in inspector.get_columns(table_name)
+    }
+
+
+def test_fresh_database_matches_models(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    try:
+        assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            expected = {
+                column.name: (column.nullable, column.primary_key) for column in table.columns
+            }
+            assert columns(inspector, table.name) == expected, table.name
+            expected_indexes = {index.name: index.unique for index in table.indexes}
+            indexes = {index["name"]: bool(index["unique"]) for index in inspector.get_indexes(table.name)}
+            assert indexes == expected_indexes, table.name
+        # 2回目は何も適用しない
+        assert run_migrations(engine) == []
+    finally:
+        engine.dispose()
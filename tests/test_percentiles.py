@@ -0,0 +1,91 @@
+"""
+WPMの順位推定（percentile_sketch）の精度
+合成したランキングを読み込み、推定した順位と厳密な値（WPMの昇順リストの二分探索）の差が報告された誤差の上限以内であること
+"""
+
+import bisect
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from migrations import run_migrations
+from models import Ranking
+from percentiles import PercentileSketch
+from ranking_queries import window_start
+
+DIFFICULTIES = ("easy", "medium", "hard")
+MEANS = {"easy": 180.0, "medium": 140.0, "hard": 100.0}
+# 読み込み時に現在の日付より古い日ごとのヒストグラムを捨てるため、現在時刻を基準にする
+NOW = datetime.utcnow()
+
+
+def generate(count, seed):
+    """難易度ごとに正規分布に近いWPMと、直近60日に散らばった作成日時を作る"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        difficulty = rng.choice(DIFFICULTIES)
+        rows.append({
+            "nickname": f"player{rng.randrange(5000)}", "wpm": round(max(rng.gauss(MEANS[difficulty], 45.0), 1.0), 2),
+            "accuracy": 95.0, "errors": 0, "time_elapsed": 60.0, "characters_typed": 100,
+            "difficulty": difficulty, "created_at": NOW - timedelta(seconds=rng.randrange(60 * 86400)),
+        })
+    return rows
+
+
+def loaded_sketch(tmp_path, rows):
+    """一時DBに rows を入れ、起動時と同じ方法（DB側の集計）でヒストグラムを構築する"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'percentiles.db'}")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        for offset in range(0, len(rows), 50000):
+            conn.execute(insert(Ranking), rows[offset:offset + 50000])
+    sketch = PercentileSketch(session_factory=sessionmaker(bind=engine))
+    sketch.load()
+    engine.dispose()
+    return sketch
+
+
+def assert_within_reported_error(sketch, rows, queries, seed):
+    rng = random.Random(seed)
+    for date_filter in (None, "month", "week", "today"):
+        start = window_start(date_filter, NOW)
+        # 推定側と同じく、期間の境界は日単位で扱う
+        first_day = start.date() if start else None
+        for difficulty in (None,) + DIFFICULTIES:
+            values = sorted(
+                row["wpm"] for row in rows
+                if (difficulty is None or row["difficulty"] == difficulty)
+                and (first_day is None or row["created_at"].date() >= first_day)
+            )
+            for _ in range(queries):
+                wpm = round(rng.uniform(0, 350), 2)
+                result = sketch.percentile(wpm, difficulty, date_filter, NOW)
+                exact = 100.0 * bisect.bisect_left(values, wpm) / len(values)
+                assert result["total"] == len(values)
+                assert abs(result["percentile"] - exact) <= result["error"] + 1e-9, (date_filter, difficulty, wpm)
+
+
+def test_loaded_percentiles_within_reported_error(tmp_path):
+    rows = generate(50000, seed=1)
+    sketch = loaded_sketch(tmp_path, rows)
+    assert_within_reported_error(sketch, rows, queries=200, seed=2)
+
+
+def test_submitted_percentiles_within_reported_error():
+    # ランキング送信のたびに加える場合も同じ範囲に収まる
+    rows = generate(20000, seed=3)
+    sketch = PercentileSketch(session_factory=None)
+    for row in rows:
+        sketch.add(row)
+    assert_within_reported_error(sketch, rows, queries=100, seed=4)
+
+
+@pytest.mark.slow
+def test_million_rows_within_reported_error(tmp_path):
+    rows = generate(1000000, seed=1)
+    sketch = loaded_sketch(tmp_path, rows)
+    assert_within_reported_error(sketch, rows, queries=200, seed=2)
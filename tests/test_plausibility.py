@@ -0,0 +1,74 @@
+"""
+記録の妥当性チェック（一括判定）
+判定の間は書き込み用の接続を使わず、ランキングの登録を待たせないこと
+"""
+
+import threading
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert, select
+
+import plausibility
+from database import engine, read_engine
+from models import Ranking
+from ranking_queries import FLAG_APPROVED
+
+
+def ranking_row(nickname, wpm=120.0, characters_typed=120, flag=None):
+    return {
+        "nickname": nickname, "wpm": wpm, "accuracy": 100.0, "errors": 0, "time_elapsed": 60.0,
+        "characters_typed": characters_typed, "difficulty": "easy", "flag": flag, "created_at": datetime.utcnow(),
+    }
+
+
+@pytest.fixture
+def rankings(database):
+    prefix = f"rescore-{uuid.uuid4().hex[:8]}-"
+    with engine.begin() as conn:
+        conn.execute(insert(Ranking), [
+            ranking_row(f"{prefix}ok"),
+            # WPMが入力文字数と経過時間に合わない
+            ranking_row(f"{prefix}mismatch", wpm=600.0),
+            # 管理者が確認済みにした記録は変更しない
+            ranking_row(f"{prefix}approved", wpm=600.0, flag=FLAG_APPROVED),
+        ])
+    return prefix
+
+
+def flags_of(prefix):
+    with engine.connect() as conn:
+        rows = conn.execute(select(Ranking.nickname, Ranking.flag).where(Ranking.nickname.like(f"{prefix}%")))
+        return {nickname[len(prefix):]: flag for nickname, flag in rows}
+
+
+def test_rescore_does_not_hold_writer_while_evaluating(rankings, monkeypatch):
+    evaluate = plausibility.evaluate
+    submitted = []
+
+    def submit():
+        with engine.begin() as conn:
+            conn.execute(insert(Ranking), [ranking_row(f"{rankings}during")])
+        submitted.append(True)
+
+    def evaluate_with_concurrent_submit(columns):
+        # 判定の途中で別のスレッドからランキングを登録する（書き込み用の接続を持っていれば待たされる）
+        thread = threading.Thread(target=submit)
+        thread.start()
+        thread.join(2)
+        return evaluate(columns)
+
+    monkeypatch.setattr(plausibility, "evaluate", evaluate_with_concurrent_submit)
+    summary = plausibility.rescore(engine, read_engine=read_engine)
+
+    assert submitted == [True]
+    assert summary["changed"] >= 1
+    flags = flags_of(rankings)
+    assert flags == {"ok": None, "mismatch": "wpm_mismatch", "approved": FLAG_APPROVED, "during": None}
+
+
+def test_rescore_dry_run_writes_nothing(rankings):
+    summary = plausibility.rescore(engine, dry_run=True, read_engine=read_engine)
+    assert summary["dry_run"] is True
+    assert flags_of(rankings)["mismatch"] is None
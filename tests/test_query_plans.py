@@ -0,0 +1,81 @@
+"""
+ランキングと個人成績のクエリが EXPLAIN QUERY PLAN でインデックスを使っていること（全件走査でないこと）
+実際に実行されたSQLとパラメータを記録し、同じものの実行計画を確認します
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import player_stats
+from database import SessionLocal
+from models import Ranking
+from ranking_queries import rankings_query
+
+
+@pytest.fixture(scope="module")
+def db(database):
+    session = SessionLocal()
+    now = datetime.utcnow()
+    for index in range(40):
+        ranking = Ranking(
+            nickname=f"plan-player{index % 4}", wpm=100.0 + index, accuracy=98.0, errors=1,
+            time_elapsed=60.0, characters_typed=100 + index, difficulty=("easy", "hard")[index % 2],
+            created_at=now - timedelta(days=index)
+        )
+        session.add(ranking)
+        session.flush()
+        player_stats.record_ranking(session, ranking)
+    session.commit()
+    yield session
+    session.close()
+
+
+def query_plans(db, func):
+    """func の中で実行された rankings を読むSQLごとに、実行計画の詳細（行のリスト）を返す"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM rankings" in statement:
+            statements.append((statement, parameters))
+
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        func()
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+    assert statements
+    return [
+        [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        for statement, parameters in statements
+    ]
+
+
+def assert_uses_index(plan, index_name):
+    rankings_steps = [step for step in plan if " rankings " in f"{step} "]
+    # "SCAN rankings" だけの行（インデックスなしの全件走査）がない
+    assert all("USING" in step for step in rankings_steps), plan
+    assert any(f"INDEX {index_name}" in step for step in rankings_steps), plan
+
+
+@pytest.mark.parametrize("date_filter, difficulty, best_per_player, index_name", [
+    ("all", None, False, "ix_rankings_wpm"),
+    ("week", None, False, "ix_rankings_wpm"),
+    ("all", "easy", False, "ix_rankings_difficulty_wpm"),
+    ("month", "easy", False, "ix_rankings_difficulty_wpm"),
+    ("all", None, True, "ix_rankings_nickname_"),
+    ("week", "hard", True, "ix_rankings_difficulty_wpm"),
+])
+def test_leaderboard_query_uses_index(db, date_filter, difficulty, best_per_player, index_name):
+    [plan] = query_plans(
+        db, lambda: rankings_query(db, date_filter, difficulty, best_per_player).limit(10).all()
+    )
+    assert_uses_index(plan, index_name)
+
+
+def test_personal_history_queries_use_nickname_indexes(db):
+    recent_plan, best_plan = query_plans(db, lambda: player_stats.personal_summary(db, "plan-player1", 10))
+    assert_uses_index(recent_plan, "ix_rankings_nickname_created_at")
+    assert_uses_index(best_plan, "ix_rankings_nickname_wpm")
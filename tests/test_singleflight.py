@@ -0,0 +1,64 @@
+"""
+同時の同じ読み取りのまとめ（single-flight）
+キャッシュのない状態で同じ /api/rankings を同時に N 件送ったとき、rankings への SELECT がちょうど1回であること
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from database import engine, read_engine
+
+CONCURRENCY = 50
+
+
+@pytest.fixture
+def rankings_selects(database):
+    """rankings を読む SELECT の実行回数（書き込み用・読み込み用の両方のエンジン）"""
+    counter = {"count": 0}
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM rankings" in statement:
+            counter["count"] += 1
+
+    engines = {engine, read_engine}
+    for target in engines:
+        event.listen(target, "before_cursor_execute", count_query)
+    yield counter
+    for target in engines:
+        event.remove(target, "before_cursor_execute", count_query)
+
+
+def burst(app_client, counter, prepare, params):
+    async def scenario():
+        async with app_client() as client:
+            # 同じ件数の記録を入れておく（起動時の読み込みは数えない）
+            prepare()
+            counter["count"] = 0
+            responses = await asyncio.gather(*(client.get("/api/rankings", params=params) for _ in range(CONCURRENCY)))
+            return responses, counter["count"]
+
+    return asyncio.run(scenario())
+
+
+def test_concurrent_sql_rankings_run_one_query(app_client, rankings_selects):
+    import main
+
+    # プレイヤーごとのベスト記録はSQLで処理される
+    responses, count = burst(
+        app_client, rankings_selects, main.rankings_flight.clear, {"limit": 50, "best_per_player": "true"}
+    )
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses}) == 1
+    assert count == 1
+
+
+def test_concurrent_reads_of_dirty_leaderboard_reload_once(app_client, rankings_selects):
+    import main
+
+    # 一括操作の後など、メモリ上のランキングの再読み込みが必要な状態
+    responses, count = burst(app_client, rankings_selects, main.leaderboard.invalidate, {"limit": 10})
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses}) == 1
+    assert count == 1
@@ -0,0 +1,88 @@
+"""
+テキストカタログの1件単位の更新
+apply() / remove() でテーブルを読み直さずに、全件を読み直した場合と同じインデックスになること
+"""
+
+import random
+
+from text_catalog import DEFAULT_TEXTS, TextCatalog
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def make_text(text_id, rng):
+    return {
+        "id": text_id, "title": f"タイトル{text_id}", "content": f"テキスト{text_id}-{rng.randrange(100)}",
+        "difficulty": rng.choice(DIFFICULTIES), "is_active": rng.random() < 0.8, "romaji": None,
+    }
+
+
+class Store:
+    """text_contents テーブルの代わり（読み込んだ回数を数える）"""
+
+    def __init__(self, texts):
+        self.rows = {text["id"]: text for text in texts}
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return [dict(self.rows[text_id]) for text_id in sorted(self.rows)]
+
+
+def snapshot(catalog):
+    ids = lambda texts: [text["id"] for text in texts]  # noqa: E731
+    return {
+        "texts": catalog.texts,
+        "active": ids(catalog.active_texts),
+        "by_id": catalog.by_id,
+        "by_difficulty": {difficulty: ids(texts) for difficulty, texts in catalog.by_difficulty.items()},
+    }
+
+
+def test_single_edits_match_full_reload():
+    rng = random.Random(1)
+    store = Store([make_text(text_id, rng) for text_id in range(1, 201)])
+    catalog = TextCatalog(loader=store.load)
+    catalog.ensure_loaded()
+    next_id = 201
+
+    for _ in range(500):
+        version = catalog.version
+        operation = rng.choice(["create", "update", "update", "delete"])
+        if operation == "create":
+            text = make_text(next_id, rng)
+            next_id += 1
+            store.rows[text["id"]] = text
+            catalog.apply(dict(text))
+        elif operation == "update":
+            text = make_text(rng.choice(list(store.rows)), rng)
+            store.rows[text["id"]] = text
+            catalog.apply(dict(text))
+        else:
+            text_id = rng.choice(list(store.rows))
+            del store.rows[text_id]
+            catalog.remove(text_id)
+        assert catalog.version > version
+
+        reloaded = TextCatalog(loader=store.load)
+        reloaded.ensure_loaded()
+        assert snapshot(catalog) == snapshot(reloaded)
+
+    # 1件ごとの更新ではテーブルを読み直さない（比較用の読み込みを除く）
+    assert store.loads == 1 + 500
+
+
+def test_switches_between_default_and_stored_texts():
+    store = Store([])
+    catalog = TextCatalog(loader=store.load)
+    catalog.ensure_loaded()
+    assert not catalog.from_store and catalog.texts == DEFAULT_TEXTS
+
+    text = {"id": 10, "title": "a", "content": "あ", "difficulty": "easy", "is_active": True, "romaji": None}
+    store.rows[10] = text
+    catalog.apply(text)
+    assert catalog.from_store and [t["id"] for t in catalog.active_texts] == [10]
+
+    del store.rows[10]
+    catalog.remove(10)
+    assert not catalog.from_store and catalog.texts == DEFAULT_TEXTS
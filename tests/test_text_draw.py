@@ -0,0 +1,136 @@
+"""
+テキスト抽選のセッション内の重複防止
+複数ワーカー（別々のプロセス）に同じセッションの要求が届いても、1周するまで同じテキストを出さないこと
+周回の終わり近く（ほとんど出題済み）でも、1回の抽選の手間が件数に比例する分だけであること
+"""
+
+import multiprocessing
+import random
+
+import pytest
+
+from text_draw import SharedSeenStore, TextDrawer
+
+POOL_SIZE = 40
+
+
+class Catalog:
+    """TextDrawer が使うカタログの最小限の実装"""
+
+    def __init__(self, size=POOL_SIZE):
+        texts = [{"id": text_id, "difficulty": "easy", "content": f"テキスト{text_id}"} for text_id in range(1, size + 1)]
+        self.version = 1
+        self.by_difficulty = {"easy": texts}
+        self.active_texts = texts
+
+    def ensure_loaded(self):
+        pass
+
+
+def drawn_ids(drawer, session, count, times, seed):
+    rng = random.Random(seed)
+    return [text["id"] for _ in range(times) for text in drawer.draw("easy", count, session, rng=rng)]
+
+
+def test_in_process_session_has_no_repeats_within_a_cycle():
+    drawer = TextDrawer(catalog=Catalog())
+    ids = drawn_ids(drawer, "s1", 4, POOL_SIZE // 4, seed=1)
+    assert sorted(ids) == list(range(1, POOL_SIZE + 1))
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "text_draw.db")
+
+
+class CountingRandom(random.Random):
+    """randrange の呼び出し回数を数える"""
+
+    calls = 0
+
+    def randrange(self, *args, **kwargs):
+        self.calls += 1
+        return super().randrange(*args, **kwargs)
+
+
+def test_draws_near_end_of_cycle_stay_bounded():
+    size = 5000
+    drawer = TextDrawer(catalog=Catalog(size))
+    rng = CountingRandom(1)
+    ids = []
+    for _ in range(size):
+        before = rng.calls
+        ids += [text["id"] for text in drawer.draw("easy", 1, "s1", rng=rng)]
+        # 出題済みの位置を引き直さない
+        assert rng.calls - before == 1
+    assert sorted(ids) == list(range(1, size + 1))
+
+
+def test_shared_draws_near_end_of_cycle_stay_bounded(store_path):
+    size = 2000
+    store = SharedSeenStore(store_path)
+    drawer = TextDrawer(catalog=Catalog(size), shared=store)
+    # 共有ファイルのSQLの処理量（SQLiteの仮想マシンの命令数 / 100）
+    work = {"steps": 0}
+
+    def count_steps():
+        work["steps"] += 1
+        return 0
+
+    store._local.conn.set_progress_handler(count_steps, 100)
+    costs = []
+    ids = []
+    while len(ids) < size:
+        work["steps"] = 0
+        ids += [text["id"] for text in drawer.draw("easy", 2, "s1", rng=random.Random(len(ids)))]
+        costs.append(work["steps"])
+    assert sorted(ids) == list(range(1, size + 1))
+    # 出題済みのIDを全て読まないため、周回の終わりでも最初と同程度
+    early, late = sum(costs[10:60]), sum(costs[-50:])
+    assert late <= 2 * early + 50, (early, late)
+
+
+def test_shared_session_has_no_repeats_across_workers(store_path):
+    # ワーカーごとに別のメモリ・接続を持ち、出題済みの記録だけを共有する
+    workers = [TextDrawer(catalog=Catalog(), shared=SharedSeenStore(store_path)) for _ in range(4)]
+    ids = []
+    for turn in range(POOL_SIZE // 2):
+        ids += drawn_ids(workers[turn % len(workers)], "s1", 2, 1, seed=turn)
+    assert sorted(ids) == list(range(1, POOL_SIZE + 1))
+
+    # 1周した後は最初からやり直す（前の周回の記録は消える）
+    next_cycle = drawn_ids(workers[0], "s1", 3, 1, seed=100)
+    assert len(set(next_cycle)) == 3
+    assert sorted(drawn_ids(workers[1], "s1", POOL_SIZE - 3, 1, seed=101) + next_cycle) == list(range(1, POOL_SIZE + 1))
+
+
+def test_shared_sessions_and_difficulties_are_independent(store_path):
+    first = TextDrawer(catalog=Catalog(), shared=SharedSeenStore(store_path))
+    second = TextDrawer(catalog=Catalog(), shared=SharedSeenStore(store_path))
+    assert len(drawn_ids(first, "a", POOL_SIZE, 1, seed=1)) == POOL_SIZE
+    # 別のセッションは最初から全てのテキストを引ける
+    assert sorted(drawn_ids(second, "b", POOL_SIZE, 1, seed=2)) == list(range(1, POOL_SIZE + 1))
+
+
+def _draw_in_worker(store_path, session, times, seed, results):
+    drawer = TextDrawer(catalog=Catalog(), shared=SharedSeenStore(store_path))
+    results.extend(drawn_ids(drawer, session, 1, times, seed))
+
+
+def test_shared_session_across_processes(store_path):
+    processes = 4
+    context = multiprocessing.get_context("fork")
+    with context.Manager() as manager:
+        results = manager.list()
+        workers = [
+            context.Process(target=_draw_in_worker, args=(store_path, "s1", POOL_SIZE // processes, seed, results))
+            for seed in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        assert all(worker.exitcode == 0 for worker in workers)
+        ids = list(results)
+    # 同時に引いても同じテキストは出ない
+    assert sorted(ids) == list(range(1, POOL_SIZE + 1))
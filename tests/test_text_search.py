@@ -0,0 +1,37 @@
+"""
+管理画面のテキスト検索
+検索結果の日時が他のAPIと同じ ISO 8601 の形式であること（FTS5 と LIKE のどちらで検索した場合も）
+"""
+
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+
+from auth import admin_auth
+
+
+def admin_headers():
+    token, _ = admin_auth.create_token()
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.parametrize("query", ["検索対象", "索"])
+def test_search_returns_iso_datetimes(app_client, query):
+    title = f"検索対象-{uuid.uuid4().hex[:8]}"
+
+    async def scenario():
+        async with app_client() as client:
+            created = await client.post("/api/admin/texts", headers=admin_headers(), json={
+                "title": title, "content": "検索対象の本文", "difficulty": "easy"
+            })
+            assert created.status_code == 200, created.text
+            return await client.get("/api/admin/texts/search", headers=admin_headers(), params={"q": query})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    [item] = [item for item in response.json()["items"] if item["title"] == title]
+    for field in ("created_at", "updated_at"):
+        assert "T" in item[field]
+        datetime.fromisoformat(item[field])